@@ -0,0 +1,454 @@
+"""
+Benchmarks.
+
+The ingest benchmark runs the loaders against a FakeNeo4jServer, over
+HTTP or through its FakeBoltServer front end. Every
+loader mode runs in a fresh process, so that its CPU time and peak
+memory are its own, and reports students per second, bytes sent, CPU
+time and peak RSS.
+
+The generator benchmark times every field of `generate_student` on its
+own, the row and bulk generators (fast mode included) as a whole, and
+the serializers.
+
+The startup benchmark times short command lines in fresh interpreters
+and lists the heaviest imports, to catch import time regressions.
+
+Results are plain JSON documents; comparing them with the results of a
+previous run tells regressions apart.
+"""
+import csv
+import datetime as dt
+import io
+import json
+import logging
+import multiprocessing
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from datetime import datetime, timezone
+
+from . import formats, generator
+from .fake_neo4j import FakeBoltServer, FakeNeo4jServer
+from .log import get_logger
+from .pools import ValuePools
+
+CLI_MAIN = 'from graph_data.cli import main; main()'
+
+logger = get_logger(__name__)
+
+# mode: (cli group arguments, loader command arguments), `{bolt_url}` is
+# the url of the Bolt front end of the fake server
+INGEST_MODES = {
+    'json': ([], ['neo4j_load_dump_json', '--source', 'json']),
+    'json_ndjson': ([], ['neo4j_load_dump_json', '--source', 'ndjson']),
+    'json_columnar': ([], ['neo4j_load_dump_json', '--source', 'columnar']),
+    'json_virtual': ([], ['neo4j_load_dump_json', '--source', 'virtual']),
+    'json_gzip': (['--neo4j_gzip'],
+                  ['neo4j_load_dump_json', '--source', 'json']),
+    'json_concurrent': ([], ['neo4j_load_dump_json', '--source', 'json',
+                             '--concurrency', '4']),
+    'csv': ([], ['neo4j_load_dump_csv', '--source', 'json']),
+    'json_dedupe': ([], ['neo4j_load_dump_json', '--source', 'json',
+                         '--dedupe_characteristics']),
+    'csv_dump': ([], ['neo4j_load_dump_csv', '--source', 'csv']),
+    'csv_dedupe': ([], ['neo4j_load_dump_csv', '--source', 'csv',
+                        '--dedupe_characteristics']),
+    'json_bolt': (['--neo4j_url', '{bolt_url}'],
+                  ['neo4j_load_dump_json', '--source', 'json']),
+    'csv_bolt': (['--neo4j_url', '{bolt_url}'],
+                 ['neo4j_load_dump_csv', '--source', 'csv']),
+    # id schemes, against json_virtual
+    'json_uuid7': (['--id_scheme', 'uuid7'],
+                   ['neo4j_load_dump_json', '--source', 'virtual']),
+    'json_int': (['--id_scheme', 'int'],
+                 ['neo4j_load_dump_json', '--source', 'virtual']),
+    'json_base62': (['--id_scheme', 'base62'],
+                    ['neo4j_load_dump_json', '--source', 'virtual']),
+    'csv_int': (['--id_scheme', 'int'],
+                ['neo4j_load_dump_csv', '--source', 'virtual']),
+}
+
+# batch file formats the ingest modes read
+DUMP_FORMATS = ('json', 'ndjson', 'columnar', 'csv')
+
+# measures where a higher value is worse
+COSTS = ('seconds', 'cpu_seconds', 'peak_rss_mb', 'bytes_sent')
+
+
+def run_cli(args):
+    """
+    Run the graph-data command line with `args` in a fresh process,
+    Return wall clock time, CPU time and peak RSS of that process
+    """
+    context = multiprocessing.get_context('spawn')
+    parent, child = context.Pipe(duplex=False)
+    process = context.Process(target=_run_cli, args=(args, child))
+    process.start()
+    child.close()
+    try:
+        measures = parent.recv()
+    except EOFError:
+        measures = None
+    process.join()
+    if process.exitcode or measures is None:
+        raise RuntimeError('graph-data {} failed with exit code {}'.format(
+            ' '.join(args), process.exitcode))
+    return measures
+
+
+def _run_cli(args, connection):
+    from . import cli
+
+    cli.init_logger()
+    logging.getLogger().setLevel(logging.WARNING)
+    start_time = time.monotonic()
+    cli.cli.main(args=args, obj=cli.Namespace(), standalone_mode=False)
+    seconds = time.monotonic() - start_time
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # decode worker processes
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    connection.send({
+        'seconds': seconds,
+        'cpu_seconds': (usage.ru_utime + usage.ru_stime +
+                        children.ru_utime + children.ru_stime),
+        # ru_maxrss is in KiB on Linux
+        'peak_rss_mb': usage.ru_maxrss / 1024,
+        'children_peak_rss_mb': children.ru_maxrss / 1024,
+    })
+    connection.close()
+
+
+def run_ingest_benchmark(dataset_args, students, modes=None,
+                         **server_options):
+    """
+    Dump a dataset with `dataset_args` (cli group arguments) in every
+    format, then load it with every mode of `modes` (all by default)
+    against a FakeNeo4jServer configured by `server_options`,
+    Return the results document
+    """
+    modes = modes or sorted(INGEST_MODES)
+    for format in DUMP_FORMATS:
+        logger.info('benchmark.ingest.dump', format=format)
+        run_cli(dataset_args + ['dump', '--format', format])
+
+    results = {}
+    with FakeNeo4jServer(**server_options) as server, \
+            FakeBoltServer(server) as bolt_server:
+        for mode in modes:
+            group_args, command_args = INGEST_MODES[mode]
+            group_args = [arg.format(bolt_url=bolt_server.url)
+                          for arg in group_args]
+            server.reset_stats()
+            measures = run_cli(dataset_args + ['--neo4j_url', server.url] +
+                               group_args + command_args)
+            measures.update({
+                'students': students,
+                'students_per_second': students / measures['seconds'],
+                'bytes_sent': server.stats['bytes_received'],
+                'requests': server.stats['requests'],
+                'failures': server.stats['failures'],
+            })
+            logger.info('benchmark.ingest.mode', mode=mode, **measures)
+            results[mode] = measures
+
+    return {
+        'benchmark': 'ingest',
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'arguments': dataset_args,
+        'server': server_options,
+        'results': results,
+    }
+
+
+def compare_results(baseline, results, tolerance=0.1):
+    """
+    Compare `results` to the `baseline` results of an earlier run,
+    logging the ratio of every measure,
+    Return the (mode, measure) pairs more than `tolerance` worse
+    """
+    regressions = []
+    for mode, measures in results['results'].items():
+        base = baseline['results'].get(mode)
+        if base is None:
+            continue
+        ratios = {}
+        for measure in COSTS + ('students_per_second',):
+            if not base.get(measure):
+                continue
+            ratio = measures[measure] / base[measure]
+            ratios[measure] = '{:.3f}'.format(ratio)
+            if measure in COSTS:
+                worse = ratio > 1 + tolerance
+            else:
+                worse = ratio < 1 - tolerance
+            if worse:
+                regressions.append((mode, measure))
+        logger.info('benchmark.compare', mode=mode, ratios=ratios)
+    if regressions:
+        logger.warning('benchmark.regressions',
+                       regressions=['{}.{}'.format(*r) for r in regressions])
+    return regressions
+
+
+def generator_fields():
+    """
+    Return (field, function, calls per student) for every value drawn by
+    `generate_student`, in the order it draws them
+    """
+    fake = generator.get_fake()
+    date_of_birth = dt.datetime(1990, 6, 15)
+    return [
+        ('date_of_birth', lambda: fake.date_time_between(
+            start_date='-45y', end_date='-22y'), 1),
+        ('street_name', fake.street_name, 1),
+        ('building_number', fake.building_number, 1),
+        ('date_enrolled', lambda: generator.random_date_enrolled(
+            date_of_birth), 1),
+        ('idno', generator.random_idno, 1),
+        ('name', fake.name, 1),
+        ('description', fake.text, 1),
+        ('phone', fake.phone_number, 1),
+        ('country', fake.country, 1),
+        ('city', fake.city, 1),
+        ('university', generator.random_university, 1),
+        ('faculty', generator.random_faculty, 1),
+        # the second call, the first is in random_date_enrolled
+        ('datetime_now', dt.datetime.now, 1),
+        ('year_graduated', lambda: random.choice(range(2000, 2020)), 1),
+        # 2 to 4 hobbies
+        ('hobby', generator.random_hobby, 3),
+    ]
+
+
+def _time_calls(func, calls):
+    """
+    Return the seconds per call of `func` over `calls` calls
+    """
+    start_time = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start_time) / calls
+
+
+def _allocations(func, students):
+    """
+    Return the memory blocks and bytes still allocated, per student, by
+    `func` making `students` students, and its peak traced bytes
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        result = func()
+        after = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    diff = after.compare_to(before, 'filename')
+    del result
+    return {
+        'retained_blocks_per_student': sum(
+            stat.count_diff for stat in diff) / students,
+        'retained_bytes_per_student': sum(
+            stat.size_diff for stat in diff) / students,
+        'peak_bytes_per_student': peak / students,
+    }
+
+
+def _throughput(func, students):
+    start_time = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start_time
+    return {'seconds': seconds, 'students_per_second': students / seconds}
+
+
+def _write_csv_rows(students, output):
+    writer = csv.writer(output, dialect=formats.CSV_DIALECT)
+    for student in students:
+        writer.writerow(generator.get_student_as_csv_row(student))
+        writer.writerows(generator.get_student_characteristic_rows(student))
+
+
+def _write_batch_csv_rows(batch, output):
+    writer = csv.writer(output, dialect=formats.CSV_DIALECT)
+    writer.writerows(generator.get_batch_as_csv_rows(batch))
+    writer.writerows(generator.get_batch_characteristic_rows(batch))
+
+
+def serializers(rows, batch):
+    """
+    Return (name, binary, function writing to a stream) for every way
+    students are serialized, from `rows` (generate_student dicts) or
+    from `batch` (a StudentBatch of as many students)
+    """
+    return [
+        ('json_pretty', False, lambda output: json.dump(
+            {'data': rows}, output, **formats.PRETTY_JSON_KWARGS)),
+        ('json_compact', False, lambda output: json.dump(
+            {'data': rows}, output, **formats.COMPACT_JSON_KWARGS)),
+        ('csv_rows', False, lambda output: _write_csv_rows(rows, output)),
+        ('csv_batch', False,
+         lambda output: _write_batch_csv_rows(batch, output)),
+        ('ndjson_batch', False,
+         lambda output: formats.write_ndjson([batch], output)),
+        ('columnar_batch', True,
+         lambda output: formats.write_columnar([batch], output)),
+    ]
+
+
+def run_generator_benchmark(students, seed=None, calls=None):
+    """
+    Time the fields of `generate_student` (`calls` calls each, `students`
+    by default), the row and bulk generators and the serializers,
+    Return the results document
+    """
+    calls = calls or students
+    generator.reseed(seed)
+
+    fields = {}
+    for name, func, per_student in generator_fields():
+        seconds = _time_calls(func, calls)
+        fields[name] = {
+            'calls_per_student': per_student,
+            'ns_per_call': seconds * 1e9,
+            'us_per_student': seconds * per_student * 1e6,
+        }
+
+    results = {}
+    rows = []
+    results['generate_student'] = _throughput(
+        lambda: rows.extend(generator.generate_student()
+                            for _ in range(students)), students)
+    results['generate_student'].update(_allocations(
+        lambda: [generator.generate_student() for _ in range(students)],
+        students))
+    batches = []
+    results['generate_students'] = _throughput(
+        lambda: batches.append(generator.generate_students(students)),
+        students)
+    results['generate_students'].update(_allocations(
+        lambda: generator.generate_students(students), students))
+    pools = ValuePools(seed)
+    start_time = time.perf_counter()
+    pools.values
+    pool_build_seconds = time.perf_counter() - start_time
+    results['generate_students_fast'] = _throughput(
+        lambda: generator.generate_students(students, pools=pools),
+        students)
+    results['generate_students_fast']['pool_build_seconds'] = \
+        pool_build_seconds
+
+    # share of the time of generate_student spent on each field,
+    # what is left goes to building the dicts
+    us_per_student = 1e6 / results['generate_student']['students_per_second']
+    for name, field in fields.items():
+        field['share'] = field['us_per_student'] / us_per_student
+    fields['other'] = {'us_per_student': max(
+        0.0, us_per_student - sum(field['us_per_student']
+                                  for field in fields.values()))}
+    fields['other']['share'] = fields['other']['us_per_student'] / \
+        us_per_student
+
+    for name, binary, write in serializers(rows, batches[0]):
+        output = io.BytesIO() if binary else io.StringIO()
+        results['serialize_' + name] = _throughput(
+            lambda: write(output), students)
+        size = len(output.getvalue()) if binary else \
+            len(output.getvalue().encode('utf-8'))
+        results['serialize_' + name]['bytes_per_student'] = size / students
+
+    for name, measures in results.items():
+        logger.info('benchmark.generator', name=name, **measures)
+    slowest = sorted(fields, key=lambda name: -fields[name]['us_per_student'])
+    logger.info('benchmark.generator.fields', slowest=slowest[:5])
+
+    return {
+        'benchmark': 'generator',
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'students': students,
+        'fields': fields,
+        'results': results,
+    }
+
+
+# command lines run by the startup benchmark
+STARTUP_COMMANDS = {
+    'import': ['-c', 'import graph_data.cli'],
+    'help': ['-c', CLI_MAIN, '--help'],
+    'batch': ['-c', CLI_MAIN, '--seed', '1', '--batch_size', '1',
+              '-o', '/dev/null', 'batch'],
+}
+
+# imports startup should avoid when it can
+HEAVY_MODULES = ('faker', 'requests', 'structlog', 'numpy', 'http.server')
+
+
+def import_times(stderr):
+    """
+    Parse the output of `python -X importtime`,
+    Return the cumulative seconds of every top level import and the own
+    seconds (without its imports) of every imported module
+    """
+    cumulative, own = {}, {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not self_us.strip().isdigit():
+            # header line
+            continue
+        own[name.strip()] = int(self_us) / 1e6
+        if not name.startswith('  '):
+            cumulative[name.strip()] = int(cumulative_us) / 1e6
+    return cumulative, own
+
+
+def run_startup_benchmark(repeat=5):
+    """
+    Run every command of STARTUP_COMMANDS `repeat` times in a fresh
+    interpreter, then once more with -X importtime,
+    Return the results document
+    """
+    results = {}
+    for name, args in STARTUP_COMMANDS.items():
+        durations = []
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            subprocess.run([sys.executable] + args, check=True,
+                           stdout=subprocess.DEVNULL)
+            durations.append(time.perf_counter() - start_time)
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime'] + args, check=True,
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            universal_newlines=True)
+        cumulative, own = import_times(process.stderr)
+        results[name] = {
+            'seconds': statistics.median(durations),
+            'min_seconds': min(durations),
+            'import_seconds': sum(cumulative.values()),
+            'slowest_imports': sorted(
+                own, key=lambda module: -own[module])[:5],
+            'heavy_imports': [
+                module for module in HEAVY_MODULES
+                if module in process.stderr.split()],
+        }
+        logger.info('benchmark.startup', name=name, **results[name])
+
+    return {
+        'benchmark': 'startup',
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'repeat': repeat,
+        'results': results,
+    }
@@ -0,0 +1,500 @@
+"""
+Neo4j client speaking Bolt (protocol version 1, neo4j 3.x).
+
+Bolt is the binary protocol of neo4j: messages are PackStream encoded
+structures sent in chunks over a plain TCP connection. A request is
+pipelined: all its messages (RUN and PULL_ALL for every statement,
+within BEGIN and COMMIT when there are several) are written at once,
+then their responses are read, so a request costs one round trip.
+
+BoltClient has the interface of neo4j.Neo4jClient: failures raise
+neo4j.QueryError with the neo4j status codes and results have the shape
+of the HTTP endpoint ones, statistics included, so that the loaders do
+not depend on the transport. Connections are pooled and reused.
+"""
+import socket
+import struct
+import threading
+
+from urllib.parse import urlsplit
+
+from . import neo4j
+
+DEFAULT_PORT = 7687
+HANDSHAKE = b'\x60\x60\xb0\x17'
+# protocol versions proposed to the server, 0 pads the four proposals
+VERSIONS = (1, 0, 0, 0)
+USER_AGENT = 'graph-data/1.0'
+MAX_CHUNK_SIZE = 0xFFFF
+
+# requests
+INIT = 0x01
+ACK_FAILURE = 0x0E
+RESET = 0x0F
+RUN = 0x10
+DISCARD_ALL = 0x2F
+PULL_ALL = 0x3F
+# responses
+SUCCESS = 0x70
+RECORD = 0x71
+IGNORED = 0x7E
+FAILURE = 0x7F
+
+# statistics keys of the HTTP endpoint and their Bolt names
+BOLT_STATS = {
+    key: key.replace('_', '-') for key in neo4j.STATS_KEYS
+    if key != 'contains_updates'}
+BOLT_STATS['relationship_deleted'] = 'relationships-deleted'
+
+
+class BoltError(Exception):
+    """
+    Unexpected message or version, the connection can not be used anymore
+    """
+
+
+class Structure():
+    """
+    PackStream structure: a `tag` byte and a list of `fields`
+    """
+
+    __slots__ = ('tag', 'fields')
+
+    def __init__(self, tag, fields):
+        self.tag = tag
+        self.fields = fields
+
+    def __eq__(self, other):
+        return (isinstance(other, Structure) and self.tag == other.tag and
+                self.fields == other.fields)
+
+    def __repr__(self):
+        return 'Structure({:#x}, {!r})'.format(self.tag, self.fields)
+
+
+_INT8 = struct.Struct('>b')
+_INT16 = struct.Struct('>h')
+_INT32 = struct.Struct('>i')
+_INT64 = struct.Struct('>q')
+_UINT8 = struct.Struct('>B')
+_UINT16 = struct.Struct('>H')
+_UINT32 = struct.Struct('>I')
+_FLOAT64 = struct.Struct('>d')
+
+
+def _pack_size(buffer, size, tiny, markers):
+    """
+    Append the marker of a string, list, map or structure of `size`
+    items: `tiny` | size below 16, else markers of 8, 16 and 32 bits sizes
+    """
+    if size < 0x10 and tiny is not None:
+        buffer.append(tiny | size)
+    elif size < 0x100:
+        buffer.append(markers[0])
+        buffer.append(size)
+    elif size < 0x10000:
+        buffer.append(markers[1])
+        buffer += _UINT16.pack(size)
+    elif size < 0x100000000 and len(markers) > 2:
+        buffer.append(markers[2])
+        buffer += _UINT32.pack(size)
+    else:
+        raise ValueError('too many items to pack: {}'.format(size))
+
+
+# encodings of short strings: keys and catalog values repeat in every row
+_strings = {}
+MAX_CACHED_STRINGS = 100000
+
+
+def _packed_string(value):
+    """
+    Return the encoding of a string, cached if short
+    """
+    packed = _strings.get(value)
+    if packed is not None:
+        return packed
+    data = value.encode('utf-8')
+    size = len(data)
+    if size < 0x10:
+        packed = bytes((0x80 | size,)) + data
+    elif size < 0x100:
+        packed = bytes((0xD0, size)) + data
+    elif size < 0x10000:
+        packed = b'\xD1' + _UINT16.pack(size) + data
+    else:
+        packed = b'\xD2' + _UINT32.pack(size) + data
+    if size <= 32 and len(_strings) < MAX_CACHED_STRINGS:
+        _strings[value] = packed
+    return packed
+
+
+def pack(value, buffer):
+    """
+    Append the PackStream encoding of `value` to the bytearray `buffer`
+    """
+    # strings, the most common values, are packed inline
+    kind = type(value)
+    if kind is str:
+        buffer += _packed_string(value)
+    elif kind is dict:
+        if len(value) < 0x10:
+            buffer.append(0xA0 | len(value))
+        else:
+            _pack_size(buffer, len(value), 0xA0, (0xD8, 0xD9, 0xDA))
+        for key, item in value.items():
+            buffer += _packed_string(key)
+            if type(item) is str:
+                buffer += _packed_string(item)
+            else:
+                pack(item, buffer)
+    elif kind is list or kind is tuple:
+        if len(value) < 0x10:
+            buffer.append(0x90 | len(value))
+        else:
+            _pack_size(buffer, len(value), 0x90, (0xD4, 0xD5, 0xD6))
+        for item in value:
+            if type(item) is str:
+                buffer += _packed_string(item)
+            else:
+                pack(item, buffer)
+    elif value is None:
+        buffer.append(0xC0)
+    elif value is True:
+        buffer.append(0xC3)
+    elif value is False:
+        buffer.append(0xC2)
+    elif isinstance(value, int):
+        if -0x10 <= value < 0x80:
+            buffer += _INT8.pack(value)
+        elif -0x80 <= value < 0x80:
+            buffer.append(0xC8)
+            buffer += _INT8.pack(value)
+        elif -0x8000 <= value < 0x8000:
+            buffer.append(0xC9)
+            buffer += _INT16.pack(value)
+        elif -0x80000000 <= value < 0x80000000:
+            buffer.append(0xCA)
+            buffer += _INT32.pack(value)
+        elif -0x8000000000000000 <= value < 0x8000000000000000:
+            buffer.append(0xCB)
+            buffer += _INT64.pack(value)
+        else:
+            raise ValueError('integer out of range: {}'.format(value))
+    elif isinstance(value, float):
+        buffer.append(0xC1)
+        buffer += _FLOAT64.pack(value)
+    elif isinstance(value, str):
+        pack(str(value), buffer)
+    elif isinstance(value, (bytes, bytearray)):
+        _pack_size(buffer, len(value), None, (0xCC, 0xCD, 0xCE))
+        buffer += value
+    elif isinstance(value, dict):
+        pack(dict(value), buffer)
+    elif isinstance(value, (list, tuple)):
+        pack(list(value), buffer)
+    elif hasattr(value, 'item'):
+        # numpy scalar
+        pack(value.item(), buffer)
+    elif isinstance(value, Structure):
+        _pack_size(buffer, len(value.fields), 0xB0, (0xDC, 0xDD))
+        buffer.append(value.tag)
+        for item in value.fields:
+            pack(item, buffer)
+    else:
+        raise TypeError('can not pack {!r}'.format(value))
+
+
+class Unpacker():
+    """
+    Decode the PackStream values of `data`, one after the other
+    """
+
+    def __init__(self, data):
+        self.data = bytes(data)
+        self.position = 0
+
+    def read(self, size):
+        start = self.position
+        self.position += size
+        if self.position > len(self.data):
+            raise BoltError('truncated PackStream value')
+        return self.data[start:self.position]
+
+    def read_struct(self, unpacker):
+        value, = unpacker.unpack_from(self.data, self.position)
+        self.position += unpacker.size
+        return value
+
+    def unpack(self):
+        try:
+            marker = self.data[self.position]
+        except IndexError:
+            raise BoltError('truncated PackStream value') from None
+        self.position += 1
+        if marker < 0x80:
+            return marker
+        if marker >= 0xF0:
+            return marker - 0x100
+        high, size = marker & 0xF0, marker & 0x0F
+        if high == 0x80:
+            return self.read(size).decode('utf-8')
+        if high == 0x90:
+            return self.unpack_list(size)
+        if high == 0xA0:
+            return self.unpack_map(size)
+        if high == 0xB0:
+            return self.unpack_structure(size)
+        if marker == 0xC0:
+            return None
+        if marker == 0xC1:
+            return self.read_struct(_FLOAT64)
+        if marker == 0xC2:
+            return False
+        if marker == 0xC3:
+            return True
+        if 0xC8 <= marker <= 0xCB:
+            return self.read_struct(
+                (_INT8, _INT16, _INT32, _INT64)[marker - 0xC8])
+        if 0xCC <= marker <= 0xCE:
+            return bytes(self.read(self.read_size(marker - 0xCC)))
+        if 0xD0 <= marker <= 0xD2:
+            return self.read(self.read_size(marker - 0xD0)).decode('utf-8')
+        if 0xD4 <= marker <= 0xD6:
+            return self.unpack_list(self.read_size(marker - 0xD4))
+        if 0xD8 <= marker <= 0xDA:
+            return self.unpack_map(self.read_size(marker - 0xD8))
+        if 0xDC <= marker <= 0xDD:
+            return self.unpack_structure(self.read_size(marker - 0xDC))
+        raise BoltError('unknown PackStream marker {:#x}'.format(marker))
+
+    def read_size(self, width):
+        return self.read_struct((_UINT8, _UINT16, _UINT32)[width])
+
+    def unpack_list(self, size):
+        return [self.unpack() for _ in range(size)]
+
+    def unpack_map(self, size):
+        result = {}
+        for _ in range(size):
+            key = self.unpack()
+            result[key] = self.unpack()
+        return result
+
+    def unpack_structure(self, size):
+        tag = self.read_struct(_UINT8)
+        return Structure(tag, [self.unpack() for _ in range(size)])
+
+
+def unpack(data):
+    return Unpacker(data).unpack()
+
+
+def encode_message(tag, *fields):
+    """
+    Return the chunked encoding of a message
+    """
+    body = bytearray()
+    pack(Structure(tag, list(fields)), body)
+    message = bytearray()
+    for start in range(0, len(body), MAX_CHUNK_SIZE):
+        chunk = body[start:start + MAX_CHUNK_SIZE]
+        message += _UINT16.pack(len(chunk))
+        message += chunk
+    message += b'\x00\x00'
+    return message
+
+
+def read_message(input):
+    """
+    Read a chunked message from the binary stream `input`,
+    Return its Structure, None at the end of the stream
+    """
+    body = bytearray()
+    while True:
+        header = input.read(2)
+        if len(header) < 2:
+            if body or header:
+                raise ConnectionError('connection closed within a message')
+            return None
+        size, = _UINT16.unpack(header)
+        if size == 0:
+            if body:
+                break
+            # no-op chunk
+            continue
+        chunk = input.read(size)
+        if len(chunk) < size:
+            raise ConnectionError('connection closed within a message')
+        body += chunk
+    message = unpack(body)
+    if not isinstance(message, Structure):
+        raise BoltError('message is not a structure: {!r}'.format(message))
+    return message
+
+
+def http_stats(stats):
+    """
+    Convert the statistics of a Bolt summary to the HTTP endpoint ones
+    """
+    result = {key: stats.get(bolt_key, 0)
+              for key, bolt_key in BOLT_STATS.items()}
+    result['contains_updates'] = any(result.values())
+    return result
+
+
+class BoltConnection():
+    """
+    Connection to the Bolt server `address`, initialized with `auth`
+    """
+
+    def __init__(self, address, auth, timeout=None):
+        self.socket = socket.create_connection(address, timeout)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.input = self.socket.makefile('rb')
+        try:
+            self.socket.sendall(
+                HANDSHAKE + b''.join(_UINT32.pack(v) for v in VERSIONS))
+            version = self.input.read(4)
+            if len(version) < 4:
+                raise ConnectionError('connection closed during handshake')
+            version, = _UINT32.unpack(version)
+            if version not in VERSIONS or version == 0:
+                raise BoltError(
+                    'server does not speak Bolt {}'.format(VERSIONS[0]))
+            summary, _ = self.exchange(
+                [encode_message(INIT, USER_AGENT, auth)])[0]
+            if summary.tag != SUCCESS:
+                raise neo4j.QueryError([summary.fields[0]])
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        self.input.close()
+        self.socket.close()
+
+    def exchange(self, messages):
+        """
+        Send `messages` at once and read their responses,
+        Return a (summary, records) pair for every message
+        """
+        self.socket.sendall(b''.join(messages))
+        responses = []
+        for _ in messages:
+            records = []
+            while True:
+                message = read_message(self.input)
+                if message is None:
+                    raise ConnectionError('connection closed by the server')
+                if message.tag != RECORD:
+                    break
+                records.append(message.fields[0])
+            if message.tag not in (SUCCESS, IGNORED, FAILURE):
+                raise BoltError(
+                    'unexpected message {:#x}'.format(message.tag))
+            responses.append((message, records))
+        return responses
+
+    def run(self, statements):
+        """
+        Run (statement, parameters) pairs in one transaction,
+        Return the results of the statements as the HTTP endpoint does
+        """
+        messages = []
+        for statement, parameters in statements:
+            messages.append(encode_message(RUN, statement, parameters))
+            messages.append(encode_message(PULL_ALL))
+        if len(statements) > 1:
+            messages = ([encode_message(RUN, 'BEGIN', {}),
+                         encode_message(DISCARD_ALL)] + messages +
+                        [encode_message(RUN, 'COMMIT', {}),
+                         encode_message(DISCARD_ALL)])
+        responses = self.exchange(messages)
+        failures = [summary.fields[0] for summary, _ in responses
+                    if summary.tag == FAILURE]
+        if failures:
+            # back to a clean state, rolling back the transaction
+            summary, _ = self.exchange([encode_message(RESET)])[0]
+            if summary.tag != SUCCESS:
+                raise BoltError('reset failed: {!r}'.format(summary))
+            raise neo4j.QueryError(
+                [{'code': failure.get('code', ''),
+                  'message': failure.get('message', '')}
+                 for failure in failures])
+        if len(statements) > 1:
+            responses = responses[2:-2]
+        results = []
+        for (fields, _), (summary, records) in zip(
+                responses[0::2], responses[1::2]):
+            results.append({
+                'columns': fields.fields[0].get('fields', []),
+                'data': [{'row': record} for record in records],
+                'stats': http_stats(summary.fields[0].get('stats', {})),
+            })
+        return {'results': results, 'errors': []}
+
+
+class BoltClient(neo4j.BaseClient):
+    """
+    Client of the Bolt server of `url`, bolt://[user:password@]host[:port].
+
+    Requests go through a pool of connections, opened when needed and
+    kept open up to `pool_size` idle ones; a connection is used by one
+    request at a time, so clients can be shared by threads.
+    """
+
+    def __init__(self, url, timeout=None, pool_size=10):
+        parts = urlsplit(url)
+        if parts.scheme != 'bolt':
+            raise ValueError('not a bolt url: {}'.format(url))
+        self.url = url
+        self.address = (parts.hostname or 'localhost',
+                        parts.port or DEFAULT_PORT)
+        if parts.username:
+            self.auth = {'scheme': 'basic', 'principal': parts.username,
+                         'credentials': parts.password or ''}
+        else:
+            self.auth = {'scheme': 'none'}
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        return BoltConnection(self.address, self.auth, self.timeout)
+
+    def release(self, connection):
+        with self.lock:
+            if len(self.idle) < self.pool_size:
+                self.idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+    def do_query_update_batch(self, queries):
+        """
+        Execute multiple query statements in one transaction,
+        Return result and statistics for each of the statements
+        """
+        connection = self.acquire()
+        try:
+            result = connection.run(
+                [(query['statement'], query['params']) for query in queries])
+        except neo4j.QueryError:
+            self.release(connection)
+            raise
+        except BaseException:
+            # the state of the connection is unknown
+            connection.close()
+            raise
+        self.release(connection)
+        return result
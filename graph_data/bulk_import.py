@@ -0,0 +1,163 @@
+"""
+Files for the offline bulk importer, `neo4j-admin import`.
+
+The importer builds a database from CSV files without transactions,
+far faster than any MERGE based loader. Every group of files has a
+header file of its own, so that the batch files hold data rows only and
+the importer reads them in parallel:
+
+* students.header.csv + NNNNN.students.csv: Student nodes, with the
+  properties of generator.get_student_csv_header, `idno` being the
+  :ID of the Student id space
+* characteristics.header.csv + NNNNN.characteristics.csv: Characteristic
+  nodes, each one written once, in the file of the first batch using it
+  (once per dataset shard when shards are written apart)
+* characteristic_links.header.csv + NNNNN.characteristic_links.csv:
+  `characteristic` relationships
+* friend_links.header.csv + NNNNN.friend_links.csv: `friend`
+  relationships
+
+Node ids, labels, properties and relationship types are those of the
+online loaders: a Characteristic has the id type:value along with its
+type and value. Import ids are strings; integer idnos (ids.IntegerScheme)
+are stored as an `idno:long` property next to a :ID column that is not.
+"""
+import csv
+import os
+
+from . import formats, generator
+
+STUDENT_ID_SPACE = 'Student'
+CHARACTERISTIC_ID_SPACE = 'Characteristic'
+
+# file groups of an import, in the order of the importer arguments
+NODE_GROUPS = ('students', 'characteristics')
+RELATIONSHIP_GROUPS = ('characteristic_links', 'friend_links')
+
+
+def headers(id_scheme):
+    """
+    Return the header of every file group, for `id_scheme` idnos
+    """
+    student_header = list(generator.get_student_csv_header())
+    if id_scheme.integer:
+        student_header[student_header.index('idno')] = 'idno:long'
+        student_header.append(':ID({})'.format(STUDENT_ID_SPACE))
+    else:
+        student_header[student_header.index('idno')] = \
+            'idno:ID({})'.format(STUDENT_ID_SPACE)
+    return {
+        'students': tuple(student_header) + (':LABEL',),
+        'characteristics': (
+            'id:ID({})'.format(CHARACTERISTIC_ID_SPACE), 'type', 'value',
+            ':LABEL'),
+        'characteristic_links': (
+            ':START_ID({})'.format(STUDENT_ID_SPACE),
+            ':END_ID({})'.format(CHARACTERISTIC_ID_SPACE), ':TYPE'),
+        'friend_links': (
+            ':START_ID({})'.format(STUDENT_ID_SPACE),
+            ':END_ID({})'.format(STUDENT_ID_SPACE), ':TYPE'),
+    }
+
+
+def file_name(batch_nr, group):
+    return '{0:05d}.{1}.csv'.format(batch_nr, group)
+
+
+def header_file_name(group):
+    return '{}.header.csv'.format(group)
+
+
+def open_csv(output_dir, name):
+    return open(os.path.join(output_dir, name), 'w', encoding='utf-8',
+                newline='')
+
+
+def write_headers(output_dir, id_scheme):
+    for group, header in headers(id_scheme).items():
+        with open_csv(output_dir, header_file_name(group)) as output:
+            csv.writer(output, dialect=formats.CSV_DIALECT).writerow(header)
+
+
+def write_batch(output_dir, dataset, batch_nr):
+    """
+    Generate batch #`batch_nr` of a dataset straight into its student,
+    characteristic link and friend link files,
+    Return the batch number and the (type, value) characteristics the
+    batch links to, in order of first use
+    """
+    characteristics = {}
+    with open_csv(output_dir, file_name(batch_nr, 'students')) as students, \
+            open_csv(output_dir,
+                     file_name(batch_nr, 'characteristic_links')) as links:
+        student_writer = csv.writer(students, dialect=formats.CSV_DIALECT)
+        link_writer = csv.writer(links, dialect=formats.CSV_DIALECT)
+        integer = dataset.id_scheme.integer
+        for chunk in dataset.chunks(batch_nr):
+            student_writer.writerows(
+                row + ((row[0], STUDENT_ID_SPACE) if integer
+                       else (STUDENT_ID_SPACE,))
+                for row in generator.get_batch_as_csv_rows(chunk))
+            # the online loaders MERGE links, a student picking the same
+            # hobby twice is linked to it once
+            linked = set()
+            for idno, type, value in \
+                    generator.get_batch_characteristic_rows(chunk):
+                if (idno, type, value) in linked:
+                    continue
+                linked.add((idno, type, value))
+                characteristics.setdefault((type, value), None)
+                link_writer.writerow(
+                    (idno, type + ':' + value, 'characteristic'))
+    with open_csv(output_dir, file_name(batch_nr, 'friend_links')) as friends:
+        idnos, friend_idnos = dataset.friends(batch_nr)
+        csv.writer(friends, dialect=formats.CSV_DIALECT).writerows(
+            zip(idnos, friend_idnos, ['friend'] * len(idnos)))
+    return batch_nr, list(characteristics)
+
+
+class CharacteristicNodes():
+    """
+    Characteristic node files of an import, writing every characteristic
+    once whatever the number of batches linking to it
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.written = set()
+
+    def write(self, batch_nr, characteristics):
+        """
+        Write the characteristics of batch #`batch_nr` not written yet,
+        Return the number of characteristics written
+        """
+        new = [characteristic for characteristic in characteristics
+               if characteristic not in self.written]
+        self.written.update(new)
+        with open_csv(self.output_dir,
+                      file_name(batch_nr, 'characteristics')) as output:
+            csv.writer(output, dialect=formats.CSV_DIALECT).writerows(
+                (type + ':' + value, type, value, CHARACTERISTIC_ID_SPACE)
+                for type, value in new)
+        return len(new)
+
+
+def import_arguments(output_dir, sharded=False):
+    """
+    Return the `neo4j-admin import` arguments loading the files of
+    `output_dir`, batch files being matched by a regular expression,
+    `sharded` when they are the files of several dataset shards
+    """
+    output_dir = os.path.abspath(output_dir)
+    # faker descriptions span several lines
+    arguments = ['--multiline-fields=true']
+    if sharded:
+        # every shard writes the characteristics it uses
+        arguments.append('--skip-duplicate-nodes=true')
+    for option, groups in (('--nodes', NODE_GROUPS),
+                           ('--relationships', RELATIONSHIP_GROUPS)):
+        for group in groups:
+            arguments.append('{}={},{}'.format(
+                option, os.path.join(output_dir, header_file_name(group)),
+                os.path.join(output_dir, r'[0-9]+\.{}\.csv'.format(group))))
+    return arguments
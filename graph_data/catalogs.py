@@ -0,0 +1,162 @@
+"""
+Catalogs of the values characteristics are picked from: universities,
+faculties and hobbies.
+
+A catalog is loaded on first use, from its built-in values or from a
+text file with one value per line, optionally followed by a tab and a
+weight. Values are drawn with their weights, or with Zipf weights
+1 / rank ** skew when the catalog is skewed, so that a few values are
+far more popular than the others (and their Characteristic nodes hot).
+Weighted draws use an alias table: O(1) per draw, and vectorized for
+bulk draws of millions of indices.
+
+Uniform catalogs draw exactly like `random.choice` and
+`Generator.integers`, so that datasets generated without weights do not
+change.
+"""
+import random
+
+import numpy
+
+
+class Catalog():
+    """
+    Catalog `name` of the values returned by `default`, a function called
+    on first use unless the catalog is loaded from a file
+    """
+
+    def __init__(self, name, default):
+        self.name = name
+        self.default = default
+        self.configure()
+
+    def configure(self, path=None, skew=0.0):
+        """
+        Load the catalog from `path` instead of the built-in values
+        and/or skew its popularity, on next use
+        """
+        self.path = path
+        self.skew = skew
+        self._values = None
+        self._weights = None
+        self._table = None
+
+    def _load(self):
+        if self.path is None:
+            self._values = tuple(self.default())
+            weights = None
+        else:
+            values, weights = [], []
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    line = line.rstrip('\n')
+                    if not line.strip() or line.startswith('#'):
+                        continue
+                    value, _, weight = line.partition('\t')
+                    values.append(value)
+                    weights.append(float(weight) if weight else 1.0)
+            if not values:
+                raise ValueError('catalog {} is empty: {}'.format(
+                    self.name, self.path))
+            self._values = tuple(values)
+            if len(set(weights)) == 1:
+                weights = None
+        if self.skew:
+            zipf = 1.0 / numpy.arange(
+                1, len(self._values) + 1, dtype=numpy.float64) ** self.skew
+            weights = zipf if weights is None else numpy.asarray(
+                weights) * zipf
+        self._weights = None if weights is None else numpy.asarray(
+            weights, dtype=numpy.float64)
+
+    @property
+    def values(self):
+        if self._values is None:
+            self._load()
+        return self._values
+
+    @property
+    def weights(self):
+        """
+        Return the normalized weights of the values, None if uniform
+        """
+        if self._values is None:
+            self._load()
+        if self._weights is None:
+            return None
+        return self._weights / self._weights.sum()
+
+    @property
+    def uniform(self):
+        return self.weights is None
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def table(self):
+        """
+        Return the alias table of the catalog as (probability, alias)
+        arrays, built on first use
+        """
+        if self._table is None:
+            self._table = alias_table(self.weights)
+        return self._table
+
+    def sample(self, rng, size):
+        """
+        Draw `size` value indices with the numpy generator `rng`
+        """
+        if self.uniform:
+            return rng.integers(0, len(self), size)
+        probability, alias = self.table()
+        index = rng.integers(0, len(probability), size)
+        return numpy.where(rng.random(size) < probability[index],
+                           index, alias[index])
+
+    def choice(self):
+        """
+        Draw one value with the `random` module
+        """
+        if self.uniform:
+            return random.choice(self.values)
+        probability, alias = self.table()
+        index = random.randrange(len(probability))
+        if random.random() >= probability[index]:
+            index = alias[index]
+        return self.values[index]
+
+    def take(self, indices):
+        """
+        Return the values of `indices`
+        """
+        values = self.values
+        return [values[i] for i in indices]
+
+
+def alias_table(weights):
+    """
+    Build the alias table of `weights` with Vose's method,
+    Return (probability, alias) arrays: draw index i uniformly, keep it
+    with probability[i], else take alias[i]
+    """
+    k = len(weights)
+    scaled = numpy.asarray(weights, dtype=numpy.float64) * k / sum(weights)
+    probability = numpy.ones(k, dtype=numpy.float64)
+    alias = numpy.arange(k, dtype=numpy.int64)
+    small = [i for i in range(k) if scaled[i] < 1.0]
+    large = [i for i in range(k) if scaled[i] >= 1.0]
+    while small and large:
+        less = small.pop()
+        more = large.pop()
+        probability[less] = scaled[less]
+        alias[less] = more
+        scaled[more] = scaled[more] + scaled[less] - 1.0
+        if scaled[more] < 1.0:
+            small.append(more)
+        else:
+            large.append(more)
+    # leftovers only differ from 1 by rounding errors
+    return probability, alias
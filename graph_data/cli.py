@@ -1,29 +1,38 @@
 #!/usr/bin/env python
 import csv
+import functools
+import hashlib
+import itertools
 import json
-import logging
 import sys
 import io
+import random
+import threading
 import click
-import structlog
 
-from os import listdir
-from os.path import isfile, join
-from datetime import datetime
-from faker import Factory
+from collections import deque
+from contextlib import contextmanager
+from multiprocessing import Pool
+from queue import Queue
+from os import listdir, makedirs
+from os.path import abspath, basename, isfile, join, splitext
+from datetime import date, datetime
 
-from . import generator, neo4j
+# modules only some commands need (numpy through the generator, neo4j,
+# requests, the benchmarks) are imported by those commands, to keep
+# startup fast
+from . import formats
+from .log import get_logger, init_logger
 
 PY2 = (sys.version_info[0] == 2)
 
-PRETTY_JSON_KWARGS = dict(
-    ensure_ascii=False,
-    indent=2,
-    sort_keys=True)
-
 TMP_DIR = "/tmp"
-logger = structlog.get_logger(__name__)
-fake = Factory.create('en_US')
+logger = get_logger(__name__)
+
+# choices of options whose registries import numpy: topology.MODELS and
+# ids.SCHEMES
+TOPOLOGIES = ('preferential', 'sbm', 'small_world', 'uniform')
+ID_SCHEMES = ('base62', 'int', 'uuid4', 'uuid7')
 
 
 class Namespace():
@@ -35,33 +44,6 @@ class Namespace():
     pass
 
 
-def init_logger():
-    structlog.configure(
-        processors=[
-            structlog.stdlib.filter_by_level,
-            structlog.stdlib.add_logger_name,
-            structlog.stdlib.add_log_level,
-            structlog.stdlib.PositionalArgumentsFormatter(),
-            structlog.processors.TimeStamper(fmt="iso"),
-            structlog.processors.StackInfoRenderer(),
-            structlog.processors.format_exc_info,
-            structlog.processors.JSONRenderer()
-        ],
-        context_class=dict,
-        logger_factory=structlog.stdlib.LoggerFactory(),
-        wrapper_class=structlog.stdlib.BoundLogger,
-        cache_logger_on_first_use=True,
-    )
-
-    logging.basicConfig(
-        format="%(message)s",
-        stream=sys.stdout,
-        level=logging.INFO,
-    )
-
-    logging.getLogger("requests").setLevel(logging.WARNING)
-
-
 def main():
     init_logger()
     return cli(obj=Namespace())
@@ -85,22 +67,143 @@ def main():
     '--batch_size',
     help="batch size",
     default='50')
+@click.option(
+    '--seed',
+    help="seed for reproducible generation (random by default)",
+    default=None)
+@click.option(
+    '--reference_date',
+    help="date generated dates are relative to, as YYYY-MM-DD "
+         "(default is today)",
+    default=None)
+@click.option(
+    '--topology',
+    help="friend graph model",
+    type=click.Choice(TOPOLOGIES),
+    default='uniform')
+@click.option(
+    '--catalog_files',
+    help="files the catalogs are read from instead of the built-in ones, "
+         "as catalog=path,... (catalogs: university, faculty, hobby); "
+         "one value per line, optionally followed by a tab and a weight",
+    default=None)
+@click.option(
+    '--catalog_skew',
+    help="Zipf exponent of the popularity of catalog values, as "
+         "catalog=exponent,... (0 is uniform)",
+    default=None)
+@click.option(
+    '--fast',
+    help="sample faker fields from pools of values drawn once per process "
+         "instead of calling faker for every student",
+    is_flag=True)
+@click.option(
+    '--pool_size',
+    help="number of distinct values of every faker field in fast mode",
+    default=None)
+@click.option(
+    '--pool_sizes',
+    help="pool size of some fields in fast mode, as field=size,... "
+         "(fields: name, description, phone, country, city, street, "
+         "building_number)",
+    default=None)
+@click.option(
+    '--pool_cache',
+    help="JSON file the pools of fast mode are read from, or written to "
+         "when missing or built with another seed or sizes",
+    default=None)
+@click.option(
+    '--id_scheme',
+    help="how idnos are derived from student numbers: random `uuid4`, "
+         "time ordered `uuid7`, dense `int` or short `base62` strings; "
+         "loaders must be given the scheme of the dump",
+    type=click.Choice(ID_SCHEMES),
+    default=None)
+@click.option(
+    '--shard',
+    help="generate or load only shard i/n of the dataset (i from 1 to n): "
+         "a contiguous range of its batches, needs --seed",
+    default=None)
 @click.option(
     '--neo4j_url',
-    help="neo4j url",
+    help="neo4j url, http:// for the HTTP endpoint or bolt:// for Bolt",
     default='http://localhost:7474')
+@click.option(
+    '--neo4j_timeout',
+    help="neo4j request timeout in seconds (default is no timeout)",
+    default=None)
+@click.option(
+    '--neo4j_pool_size',
+    help="number of keep-alive connections to neo4j",
+    default='10')
+@click.option(
+    '--neo4j_gzip',
+    help="gzip compress requests sent to neo4j",
+    is_flag=True)
 @click.pass_context
 def cli(ctx,
         output,
         output_dir,
         batches,
         batch_size,
-        neo4j_url):
+        seed,
+        reference_date,
+        topology,
+        catalog_files,
+        catalog_skew,
+        fast,
+        pool_size,
+        pool_sizes,
+        pool_cache,
+        id_scheme,
+        shard,
+        neo4j_url,
+        neo4j_timeout,
+        neo4j_pool_size,
+        neo4j_gzip):
+    from . import generator, ids
+    from .dataset import VirtualDataset
+    from .pools import DEFAULT_POOL_SIZE, ValuePools
+    from .topology import MODELS
+
     ctx.obj.output_dir = output_dir
     ctx.obj.batches = int(batches)
     ctx.obj.batch_size = int(batch_size)
+    ctx.obj.seed = (int(seed) if seed is not None
+                    else random.SystemRandom().getrandbits(32))
+    ctx.obj.reference_date = (
+        datetime.strptime(reference_date, '%Y-%m-%d').date()
+        if reference_date else date.today())
+    skews = parse_assignments(catalog_skew, float)
+    files = parse_assignments(catalog_files)
+    unknown = (set(skews) | set(files)) - set(generator.CATALOGS)
+    if unknown:
+        raise click.BadParameter(
+            'unknown catalogs: {}, catalogs are {}'.format(
+                ', '.join(sorted(unknown)), ', '.join(generator.CATALOGS)))
+    for name, path in files.items():
+        generator.CATALOGS[name].configure(path, skews.pop(name, 0.0))
+    for name, skew in skews.items():
+        generator.CATALOGS[name].configure(skew=skew)
+    ctx.obj.topology_name = topology
+    ctx.obj.topology = MODELS[topology](ctx.obj.seed)
+    ctx.obj.pools = (
+        ValuePools(ctx.obj.seed, int(pool_size or DEFAULT_POOL_SIZE),
+                   parse_assignments(pool_sizes, int), pool_cache)
+        if fast else None)
+    ctx.obj.id_scheme = ids.scheme(id_scheme or ids.DEFAULT_SCHEME)
+    ctx.obj.shard = parse_shard(shard)
+    if ctx.obj.shard is not None and seed is None:
+        raise click.BadParameter(
+            'shards of a dataset need the same --seed', param_hint='--shard')
+    ctx.obj.dataset = VirtualDataset(
+        ctx.obj.seed, ctx.obj.batch_size, ctx.obj.batches,
+        ctx.obj.reference_date, ctx.obj.topology, ctx.obj.pools,
+        ctx.obj.id_scheme, ctx.obj.shard)
     ctx.obj.neo4j_url = neo4j_url
-    ctx.obj.entity_uuids = []
+    ctx.obj.neo4j_timeout = float(neo4j_timeout) if neo4j_timeout else None
+    ctx.obj.neo4j_pool_size = int(neo4j_pool_size)
+    ctx.obj.neo4j_gzip = neo4j_gzip
     ctx.obj.closeable = False
     if PY2 and output == sys.stdout:
         # The TextIOWrapper in Python 2 chokes on stdin/stdout. :-(
@@ -112,161 +215,1024 @@ def cli(ctx,
         ctx.obj.closeable = True
 
 
+def parse_assignments(text, convert=str):
+    """
+    Parse an option given as `name=value,name=value`,
+    Return a dict of name to converted value
+    """
+    assignments = {}
+    for item in filter(None, (text or '').split(',')):
+        name, _, value = item.partition('=')
+        assignments[name.strip()] = convert(value.strip())
+    return assignments
+
+
+def parse_shard(text):
+    """
+    Parse a shard given as `i/n`,
+    Return (i, n), None if `text` is empty
+    """
+    if not text:
+        return None
+    try:
+        shard, shards = (int(part) for part in text.split('/'))
+    except ValueError:
+        shard, shards = 0, 0
+    if not 1 <= shard <= shards:
+        raise click.BadParameter(
+            'expected i/n with 1 <= i <= n, got {}'.format(text),
+            param_hint='--shard')
+    return shard, shards
+
+
+def shard_fields(ctx):
+    """
+    Return the log fields describing the dataset shard of a command
+    """
+    if ctx.shard is None:
+        return {}
+    batch_nrs = ctx.dataset.batch_nrs()
+    return {'shard': '{}/{}'.format(*ctx.shard),
+            'first_batch': batch_nrs.start, 'last_batch': batch_nrs.stop - 1}
+
+
 @cli.command(help="Generate #`batches` of fake students and dumps "
-                  "them in a `folder`, each batch in a separate file. "
+                  "them in a `folder`, each batch in a separate file "
+                  "along with the friend edges of its students. "
                   "Each batch has #`batch_size` students")
+@click.option(
+    '--workers',
+    help="number of worker processes generating batches",
+    default='1')
+@click.option(
+    '--format',
+    help="batch file format, `ndjson` streams one student per line, "
+         "`columnar` is a binary format that is memory mapped on load, "
+         "`csv` writes the students and characteristics files loaded "
+         "as is by neo4j_load_dump_csv",
+    type=click.Choice(sorted(formats.WRITERS) + [formats.CSV]),
+    default='json')
 @click.pass_context
-def dump(ctx):
-    logger.info('students.faker.dump.start', folder=ctx.obj.output_dir)
+def dump(ctx, workers, format):
+    from .dataset import VirtualDataset
 
-    more_batches = ctx.obj.batches
-    batch_nr = 1
-    while more_batches:
-        start_time = datetime.now()
-        file_name = ('{0:05d}'.format(batch_nr)) + ".json"
-        file_path = ctx.obj.output_dir + "/" + file_name
-        with io.TextIOWrapper(
-                open(file_path, mode='wb'), encoding='utf-8') as output:
-            students = []
-            more_students = ctx.obj.batch_size
-            while more_students:
-                students.append(generator.generate_student())
-                more_students -= 1
-            json.dump({"data": students}, output, **PRETTY_JSON_KWARGS)
-        end_time = datetime.now()
-        duration = end_time - start_time
-        more_batches -= 1
-        batch_nr += 1
-        logger.info(
-            'batch.done', file=file_name,
-            duration_seconds='{:.3f}'.format(duration.total_seconds()))
+    workers = int(workers)
+    logger.info('students.faker.dump.start', folder=ctx.obj.output_dir,
+                seed=ctx.obj.seed,
+                reference_date=ctx.obj.reference_date.isoformat(),
+                workers=workers, format=format, **shard_fields(ctx.obj))
+
+    dataset = ctx.obj.dataset
+    if format == formats.CSV:
+        # CSV files are streamed to disk by whoever generates the batch
+        if workers > 1:
+            with Pool(workers) as pool:
+                for batch_nr in pool.imap(
+                        functools.partial(
+                            write_csv_batch, ctx.obj.output_dir, dataset),
+                        dataset.batch_nrs()):
+                    pass
+        else:
+            for batch_nr in dataset.batch_nrs():
+                write_csv_batch(ctx.obj.output_dir, dataset, batch_nr)
+    elif workers > 1:
+        # batches are generated by the workers and handed over, in order,
+        # to a writer thread so that disk writes overlap with generation
+        pending = Queue(maxsize=2 * workers)
+        writer = threading.Thread(
+            target=write_batches,
+            args=(ctx.obj.output_dir, format, pending))
+        writer.start()
+        try:
+            with Pool(workers) as pool:
+                in_flight = deque()
+                for batch_nr in dataset.batch_nrs():
+                    in_flight.append(pool.apply_async(
+                        generate_batch, (dataset, batch_nr, format)))
+                    if len(in_flight) >= 2 * workers:
+                        pending.put(in_flight.popleft().get())
+                while in_flight:
+                    pending.put(in_flight.popleft().get())
+        finally:
+            pending.put(None)
+            writer.join()
+    else:
+        for batch_nr in dataset.batch_nrs():
+            start_time = datetime.now()
+            file_name = VirtualDataset.batch_file_name(batch_nr, format)
+            with open_batch_file(
+                    ctx.obj.output_dir, file_name, format) as output:
+                formats.WRITERS[format](dataset.chunks(batch_nr), output)
+            with open_batch_file(
+                    ctx.obj.output_dir,
+                    VirtualDataset.friends_file_name(file_name)) as output:
+                formats.write_friends(dataset.friends(batch_nr), output)
+            log_batch_done(file_name, datetime.now() - start_time)
     logger.info('students.faker.dump.done')
 
 
+def write_csv_batch(output_dir, dataset, batch_nr):
+    """
+    Generate batch #`batch_nr` of a dataset straight into its students,
+    characteristics and friends CSV files,
+    Return the batch number
+    """
+    from .dataset import VirtualDataset
+
+    start_time = datetime.now()
+    file_name = VirtualDataset.batch_file_name(
+        batch_nr, formats.extension(formats.CSV))
+    with open_batch_file(output_dir, file_name) as students, \
+            open_batch_file(
+                output_dir,
+                VirtualDataset.characteristics_file_name(file_name)) \
+            as characteristics:
+        formats.write_csv(dataset.chunks(batch_nr), students, characteristics)
+    with open_batch_file(
+            output_dir, VirtualDataset.friends_file_name(file_name)) as output:
+        formats.write_friends(dataset.friends(batch_nr), output)
+    log_batch_done(file_name, datetime.now() - start_time)
+    return batch_nr
+
+
+def generate_batch(dataset, batch_nr, format):
+    """
+    Generate and serialize batch #`batch_nr` of a dataset,
+    Return batch number, serialized batch, serialized friend edges
+    and generation duration
+    """
+    start_time = datetime.now()
+    output = io.BytesIO() if format in formats.BINARY else io.StringIO()
+    formats.WRITERS[format](dataset.chunks(batch_nr), output)
+    friends = io.StringIO()
+    formats.write_friends(dataset.friends(batch_nr), friends)
+    return (batch_nr, output.getvalue(), friends.getvalue(),
+            datetime.now() - start_time)
+
+
+def write_batches(output_dir, format, pending):
+    from .dataset import VirtualDataset
+
+    while True:
+        item = pending.get()
+        if item is None:
+            break
+        batch_nr, data, friends, duration = item
+        start_time = datetime.now()
+        file_name = VirtualDataset.batch_file_name(batch_nr, format)
+        with open_batch_file(output_dir, file_name, format) as output:
+            output.write(data)
+        with open_batch_file(
+                output_dir, VirtualDataset.friends_file_name(file_name)) \
+                as output:
+            output.write(friends)
+        log_batch_done(file_name, duration + datetime.now() - start_time)
+
+
+def open_batch_file(output_dir, file_name, format=None):
+    output = open(output_dir + "/" + file_name, mode='wb')
+    if format in formats.BINARY:
+        return output
+    return io.TextIOWrapper(output, encoding='utf-8')
+
+
+def log_batch_done(file_name, duration):
+    logger.info(
+        'batch.done', file=file_name,
+        duration_seconds='{:.3f}'.format(duration.total_seconds()))
+
+
 @cli.command(help="Generate single batch of fake students."
                   "Batch size is given by batch_size parameter.")
+@click.option(
+    '--batch_nr',
+    help="number of the dataset batch to generate",
+    default='1')
+@click.option(
+    '--format',
+    help="output format, `ndjson` streams one student per line, "
+         "`columnar` is a binary format",
+    type=click.Choice(sorted(formats.WRITERS)),
+    default='json')
 @click.pass_context
-def batch(ctx):
-    students = []
-    more_students = ctx.obj.batch_size
-    while more_students:
-        students.append(generator.generate_student())
-        more_students -= 1
-    json.dump({"data": students}, ctx.obj.output, **PRETTY_JSON_KWARGS)
+def batch(ctx, batch_nr, format):
+    batch_nr = int(batch_nr)
+    dataset = ctx.obj.dataset
+    # batches do not depend on the number of batches in the dataset
+    dataset.batches = max(dataset.batches, batch_nr)
+    output = ctx.obj.output
+    if format in formats.BINARY:
+        output.flush()
+        output = output.buffer
+    formats.WRITERS[format](dataset.chunks(batch_nr), output)
     if ctx.obj.closeable:
         ctx.obj.output.close()
 
 
+@cli.command(help="Generate #`batches` of fake students in `folder` as "
+                  "node and relationship files of the neo4j-admin import "
+                  "offline bulk importer, split by batch")
+@click.option(
+    '--workers',
+    help="number of worker processes generating batches",
+    default='1')
+@click.pass_context
+def neo4j_admin_dump(ctx, workers):
+    from . import bulk_import
+
+    workers = int(workers)
+    logger.info('neo4j.admin.dump.start', folder=ctx.obj.output_dir,
+                seed=ctx.obj.seed,
+                reference_date=ctx.obj.reference_date.isoformat(),
+                workers=workers, **shard_fields(ctx.obj))
+    makedirs(ctx.obj.output_dir, exist_ok=True)
+    bulk_import.write_headers(ctx.obj.output_dir, ctx.obj.id_scheme)
+    nodes = bulk_import.CharacteristicNodes(ctx.obj.output_dir)
+    write_batch = functools.partial(
+        bulk_import.write_batch, ctx.obj.output_dir, ctx.obj.dataset)
+
+    def write(batches):
+        # characteristic nodes are written in batch order, by this process
+        for batch_nr, characteristics in batches:
+            start_time = datetime.now()
+            written = nodes.write(batch_nr, characteristics)
+            logger.info(
+                'neo4j.admin.dump.batch', batch_nr=batch_nr,
+                characteristics=len(characteristics),
+                new_characteristics=written,
+                duration_seconds='{:.3f}'.format(
+                    (datetime.now() - start_time).total_seconds()))
+
+    if workers > 1:
+        with Pool(workers) as pool:
+            write(pool.imap(write_batch, ctx.obj.dataset.batch_nrs()))
+    else:
+        write(map(write_batch, ctx.obj.dataset.batch_nrs()))
+    logger.info('neo4j.admin.dump.done', characteristics=len(nodes.written),
+                import_arguments=bulk_import.import_arguments(
+                    ctx.obj.output_dir, sharded=ctx.obj.shard is not None))
+
+
+def pipeline_options(command):
+    """
+    Add the options of the loader pipeline stages to a command
+    """
+    options = [
+        click.option(
+            '--decode_workers',
+            help="number of processes decoding batch files",
+            default='1'),
+        click.option(
+            '--transform_workers',
+            help="number of threads preparing batches for neo4j",
+            default='1'),
+        click.option(
+            '--send_workers',
+            help="number of threads sending batches to neo4j",
+            default='1'),
+        click.option(
+            '--queue_size',
+            help="number of batches waiting between two pipeline stages",
+            default='4'),
+        click.option(
+            '--resume',
+            help="skip the batches committed by a previous run, as recorded "
+                 "in its progress manifest in output_dir",
+            is_flag=True),
+        click.option(
+            '--missing_friends',
+            help="friends of the students of batch files without a friends "
+                 "file: `none`, or `sample` them uniformly among the "
+                 "students read so far, kept in a memory mapped id "
+                 "registry in TMP_DIR",
+            type=click.Choice(['none', 'sample']),
+            default='none'),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+def dedupe_options(command):
+    """
+    Add the options of the characteristic planner to a command
+    """
+    options = [
+        click.option(
+            '--dedupe_characteristics',
+            help="create every distinct characteristic once, in a phase of "
+                 "its own, and link students to it by id",
+            is_flag=True),
+        click.option(
+            '--dedupe_window',
+            help="number of characteristics remembered as created, past "
+                 "that they are created again",
+            default='1000000'),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+def new_planner(dedupe_characteristics, dedupe_window):
+    from . import ingest
+
+    if not dedupe_characteristics:
+        return None
+    return ingest.CharacteristicPlanner(int(dedupe_window))
+
+
+def new_load_pipeline(name, ctx, source, pipeline_params):
+    """
+    Return a Pipeline listing and decoding the batches of a dump not
+    committed yet, in chunks, its ProgressManifest and the pipeline
+    options, CSV batches are listed but not decoded
+    """
+    from . import ingest
+    from .pipeline import Pipeline
+
+    resume = pipeline_params.pop('resume')
+    missing_friends = pipeline_params.pop('missing_friends')
+    params = {k: int(v) for k, v in pipeline_params.items()}
+    # shards of a dataset may share output_dir
+    prefix = f'{name}.{source}' if ctx.shard is None \
+        else '{}.{}.{}-of-{}'.format(name, source, *ctx.shard)
+    manifest = ingest.ProgressManifest(
+        join(ctx.output_dir, f'{prefix}.progress'), resume)
+    tasks = (task for task in list_dump(ctx, source)
+             if not manifest.done(dump_task_name(task)))
+    pipeline = Pipeline(name, tasks, params['queue_size'])
+    if source != formats.CSV:
+        pipeline.add_stage(
+            'decode', functools.partial(
+                decode_dump_batch, id_scheme=ctx.id_scheme),
+            params['decode_workers'], processes=True, expand=True)
+    if missing_friends == 'sample' and source in formats.READERS:
+        import numpy
+        from .registry import IdRegistry
+
+        # a resumed load samples among the students of the batches
+        # loaded before too
+        registry = IdRegistry(
+            join(TMP_DIR, f'{prefix}.registry'),
+            'r+' if resume else 'w+', id_scheme=ctx.id_scheme)
+        # the registry has a single writer
+        pipeline.add_stage('friends', functools.partial(
+            sample_missing_friends, registry,
+            numpy.random.default_rng(ctx.seed), ctx.output_dir))
+    params['resume'] = resume
+    params['missing_friends'] = missing_friends
+    params.update(shard_fields(ctx))
+    return pipeline, manifest, params
+
+
 @cli.command(help="Loads a dump of generated data into neo4j in JSON mode")
+@click.option(
+    '--source',
+    help="where batches come from: `json`, `ndjson` or `columnar` files in "
+         "output_dir or a `virtual` dataset regenerated from seed, batches "
+         "and batch_size",
+    type=click.Choice(sorted(formats.READERS) + ['virtual']),
+    default='json')
+@click.option(
+    '--concurrency',
+    help="number of concurrent requests, above 1 students are loaded "
+         "in conflict free phases",
+    default='1')
+@click.option(
+    '--target_latency',
+    help="seconds a transaction should take to commit, transactions are "
+         "resized toward it, starting at batch_size students",
+    default='2.0')
+@dedupe_options
+@pipeline_options
 @click.pass_context
-def neo4j_load_dump_json(ctx):
-    neo4j.ctx = ctx.obj
-    neo4j.create_schema()
-    logger.info('neo4j.json.ingest.start', folder=ctx.obj.output_dir)
+def neo4j_load_dump_json(ctx, source, concurrency, target_latency,
+                         dedupe_characteristics, dedupe_window,
+                         **pipeline_params):
+    from . import ingest, neo4j
 
-    batch_files = [f for f in listdir(ctx.obj.output_dir)
-                   if isfile(join(ctx.obj.output_dir, f))
-                   and f.endswith('.json')]
+    target_latency = float(target_latency)
+    concurrency = int(concurrency)
+    planner = new_planner(dedupe_characteristics, dedupe_window)
+    pipeline, manifest, params = new_load_pipeline(
+        'neo4j.json.ingest', ctx.obj, source, pipeline_params)
+    ctx.obj.neo4j_pool_size = max(
+        ctx.obj.neo4j_pool_size, concurrency, params['send_workers'])
+    client = new_neo4j_client(ctx.obj)
+    ingest.retry_transient(client.create_schema)
+    logger.info('neo4j.json.ingest.start', folder=ctx.obj.output_dir,
+                source=source, concurrency=concurrency,
+                target_latency=target_latency,
+                dedupe_characteristics=dedupe_characteristics, **params)
 
-    student_ids = []
-    for file in batch_files:
-        with open(join(ctx.obj.output_dir, file), mode='r',
-                  encoding='utf-8') as input:
-            students = []
-            json_data = json.load(input)
-            for item in json_data['data']:
-                student_ids.append(item['idno'])
+    if concurrency > 1:
+        load_partitioned(ctx.obj, client, pipeline, manifest, concurrency,
+                         target_latency, planner)
+        if planner is not None:
+            planner.report()
+        logger.info('neo4j.json.ingest.done')
+        return
 
-            start_time = datetime.now()
-            for item in json_data['data']:
-                student = {
-                    'idno': item['idno'],
-                    'characteristics': item['characteristics'],
-                    'properties': {k: v for k, v in item.items()
-                                   if k not in ('idno', 'characteristics')}
-                }
-                friends = generator.pick_friends(student_ids)
-                friends = [f for f in friends if f != item['idno']]
-                student['friends'] = friends
-                students.append(student)
-
-            logger.info('neo4j.json.ingest.batch', file=file)
-            rs = neo4j.do_query_update(neo4j.Q_IN_STUDENTS, {'students': students})
-            end_time = datetime.now()
-            neo4j.log_update_query_stats(end_time-start_time, rs)
+    batcher = ingest.AdaptiveBatcher(
+        client,
+        neo4j.Q_IN_STUDENTS if planner is None
+        else neo4j.Q_IN_STUDENTS_BY_KEY, 'students',
+        initial_size=ctx.obj.batch_size, target_latency=target_latency)
+    characteristics_batcher = ingest.AdaptiveBatcher(
+        client, neo4j.Q_IN_CHARACTERISTIC_NODES, 'characteristics',
+        initial_size=ctx.obj.batch_size, target_latency=target_latency)
+
+    def send(chunk):
+        file, (number, last), students = chunk
+        name = ingest.chunk_name(file, number)
+        # chunks committed by a previous run still count for their batch
+        if not manifest.done(name):
+            logger.info('neo4j.json.ingest.batch', file=file, chunk=number)
+            if planner is not None:
+                characteristics, students = ingest.plan_students(
+                    planner, students)
+                characteristics_batcher.load(characteristics)
+                planner.done(characteristics)
+            batcher.load(
+                students, start=manifest.committed_rows(name),
+                on_commit=lambda rows: manifest.commit_rows(name, rows))
+        manifest.commit_chunk(file, number, last)
+        return file
+
+    pipeline.add_stage(
+        'transform', students_payload, params['transform_workers'])
+    pipeline.add_stage('send', send, params['send_workers'])
+    for file in pipeline.run():
+        pass
 
+    if planner is not None:
+        planner.report()
     logger.info('neo4j.json.ingest.done')
 
 
+def students_payload(chunk):
+    """
+    Reshape a decoded chunk into the `students` parameter of
+    Q_IN_STUDENTS,
+    Return batch file name, (chunk number, last) and students
+    """
+    from .columnar import ColumnarBatch
+
+    file, position, data, edges = chunk
+    students = []
+    friends = {}
+    for idno, friend_idno in edges:
+        friends.setdefault(idno, []).append(friend_idno)
+    if isinstance(data, ColumnarBatch):
+        # built from the columns, without row dicts
+        students = data.payloads()
+        for student in students:
+            student['friends'] = friends.get(student['idno'], [])
+        return file, position, students
+    for item in data:
+        student = {
+            'idno': item['idno'],
+            'characteristics': item['characteristics'],
+            'properties': {k: v for k, v in item.items()
+                           if k not in ('idno', 'characteristics')},
+            'friends': friends.get(item['idno'], []),
+        }
+        students.append(student)
+    return file, position, students
+
+
+def load_partitioned(ctx, client, pipeline, manifest, concurrency,
+                     target_latency, planner=None):
+    """
+    Load the chunks decoded by `pipeline` through a PartitionScheduler,
+    `concurrency` batches worth of students at a time
+    """
+    from . import ingest
+
+    scheduler = ingest.PartitionScheduler(
+        client, concurrency, ctx.batch_size, target_latency=target_latency,
+        planner=planner)
+    chunks, students, friends = [], [], []
+
+    def flush():
+        logger.info('neo4j.json.ingest.batch', files=sorted(
+            {file for file, _ in chunks}))
+        scheduler.load(students, friends)
+        for file, position in chunks:
+            manifest.commit_chunk(file, *position)
+
+    try:
+        for file, (number, last), data, edges in pipeline.run():
+            if manifest.done(ingest.chunk_name(file, number)):
+                manifest.commit_chunk(file, number, last)
+                continue
+            chunks.append((file, (number, last)))
+            students.extend(data)
+            friends.extend(edges)
+            if len(students) >= concurrency * ctx.batch_size:
+                flush()
+                chunks, students, friends = [], [], []
+        if chunks:
+            flush()
+    finally:
+        scheduler.close()
+
+
 @cli.command(help="Loads a dump of generated data into neo4j in CSV mode")
+@click.option(
+    '--source',
+    help="where batches come from: `json`, `ndjson` or `columnar` files in "
+         "output_dir, converted to CSV in TMP_DIR, `csv` files in "
+         "output_dir, loaded as they are, or a `virtual` dataset "
+         "regenerated from seed, batches and batch_size",
+    type=click.Choice(sorted(formats.READERS) + [formats.CSV, 'virtual']),
+    default='json')
+@click.option(
+    '--concurrency',
+    help="number of concurrent LOAD CSV statements, above 1 CSV files are "
+         "hash partitioned and loaded in conflict free rounds instead of "
+         "by the send workers",
+    default='1')
+@click.option(
+    '--shard_rows',
+    help="CSV files of more rows are split into shards of that many rows, "
+         "loaded in parallel by the send workers",
+    default='1000000')
+@click.option(
+    '--commit_size',
+    help="number of rows the server commits at once while loading a shard",
+    default='10000')
+@dedupe_options
+@pipeline_options
 @click.pass_context
-def neo4j_load_dump_csv(ctx):
-    neo4j.ctx = ctx.obj
-    neo4j.create_schema()
-    logger.info('neo4j.csv.ingest.start', folder=ctx.obj.output_dir)
-
-    csv.register_dialect(
-        "gdata", quotechar='"',
-        quoting=csv.QUOTE_NONNUMERIC,
-        doublequote=True,
-    )
-    batch_files = [f for f in listdir(ctx.obj.output_dir)
-                   if isfile(join(ctx.obj.output_dir, f))
-                   and f.endswith('.json')]
+def neo4j_load_dump_csv(ctx, source, concurrency, shard_rows, commit_size,
+                        dedupe_characteristics, dedupe_window,
+                        **pipeline_params):
+    from . import ingest
 
-    student_ids = []
-    for file in batch_files:
-        with open(join(ctx.obj.output_dir, file), mode='r',
-                  encoding='utf-8') as input:
-            (students_csv_buffer,
-             students_csv_writer,
-             characteristics_csv_buffer,
-             characteristics_csv_writer,
-             friends_csv_buffer,
-             friends_csv_writer) = new_csv_writters()
-            json_data = json.load(input)
-            for item in json_data['data']:
-                students_csv_writer.writerow(
-                    generator.get_student_as_csv_row(item))
-                characteristics_csv_writer.writerows(
-                    generator.get_student_characteristic_rows(item))
-
-                student_ids.append(item['idno'])
-                friends = generator.pick_friends(student_ids)
-                friends = [f for f in friends if f != item['idno']]
-                for friend_idno in friends:
-                    friends_csv_writer.writerow((item['idno'], friend_idno))
-
-            pref = file[:-4]
-            with open(f'{TMP_DIR}/{pref}_students.csv', 'w+') as f:
-                f.write(students_csv_buffer.getvalue())
-            with open(f'{TMP_DIR}/{pref}_characteristics.csv', 'w+') as f:
-                f.write(characteristics_csv_buffer.getvalue())
-            with open(f'{TMP_DIR}/{pref}_friends.csv', 'w+') as f:
-                f.write(friends_csv_buffer.getvalue())
+    concurrency = int(concurrency)
+    shard_rows = int(shard_rows)
+    commit_size = int(commit_size)
+    planner = new_planner(dedupe_characteristics, dedupe_window)
+    pipeline, manifest, params = new_load_pipeline(
+        'neo4j.csv.ingest', ctx.obj, source, pipeline_params)
+    ctx.obj.neo4j_pool_size = max(
+        ctx.obj.neo4j_pool_size, params['send_workers'], concurrency)
+    client = new_neo4j_client(ctx.obj)
+    ingest.retry_transient(client.create_schema)
+    logger.info('neo4j.csv.ingest.start', folder=ctx.obj.output_dir,
+                source=source, concurrency=concurrency,
+                shard_rows=shard_rows, commit_size=commit_size,
+                dedupe_characteristics=dedupe_characteristics, **params)
 
-            start_time = datetime.now()
-            logger.info('neo4j.csv.ingest.batch', file=pref)
-            queries = []
-            csv_load_phases = {
-                'students': neo4j.Q_IN_CSV_STUDENTS,
-                'characteristics': neo4j.Q_IN_CSV_CHARACTERISTICS,
-                'friends': neo4j.Q_IN_CSV_FRIENDS
-            }
-            for phase in csv_load_phases.keys():
-                queries.append({
-                    'statement': csv_load_phases[phase].format(
-                        file=f"{TMP_DIR}/{pref}_{phase}.csv"),
-                    'params': {}})
-            rs = neo4j.do_query_update_batch(queries)
-            end_time = datetime.now()
-            neo4j.log_update_query_stats(end_time - start_time, rs)
+    def split(kind, path):
+        if concurrency <= 1:
+            return formats.split_csv(path, shard_rows, TMP_DIR)
+        # partitions of the file, then shards of the partitions
+        parts = formats.partition_csv(
+            path, ingest.csv_partition(kind, concurrency), TMP_DIR)
+        return {partition: formats.split_csv(part, shard_rows, TMP_DIR)
+                for partition, (part, _) in parts.items()}
 
+    def shard(batch):
+        file, csv_files = batch
+        logger.info('neo4j.csv.ingest.batch', file=file)
+        return file, csv_files, {kind: split(kind, path)
+                                 for kind, path in csv_files.items()}
+
+    pipeline.add_stage(
+        'transform',
+        dump_csv_files if source == formats.CSV else write_tmp_csv,
+        params['transform_workers'])
+    pipeline.add_stage('shard', shard, params['transform_workers'])
+    # every phase needs the nodes of the previous ones, over all batches
+    chunks = list(pipeline.run())
+    if planner is not None:
+        nodes = plan_csv_chunks(
+            planner, [(file, csv_files) for file, csv_files, _ in chunks])
+    batches = []
+    for file, csv_files, shards in chunks:
+        if planner is None:
+            shards['characteristic_nodes'] = shards['characteristics']
+        else:
+            shards['characteristic_nodes'] = split(
+                'characteristic_nodes', nodes[csv_files['characteristics']])
+        batches.append((file, shards))
+    phases = (ingest.CSV_PHASES if ctx.obj.shard is None
+              else ingest.SHARDED_CSV_PHASES)
+    if concurrency > 1:
+        loader = ingest.PartitionedCsvLoader(
+            client, concurrency, commit_size, manifest,
+            id_scheme=ctx.obj.id_scheme, phases=phases)
+    else:
+        loader = ingest.CsvShardLoader(
+            client, params['send_workers'], commit_size, manifest,
+            id_scheme=ctx.obj.id_scheme, phases=phases)
+    loader.load(batches)
+
+    if planner is not None:
+        planner.report()
     logger.info('neo4j.csv.ingest.done')
 
 
+def plan_csv_chunks(planner, chunks):
+    """
+    Plan the characteristic nodes of the (batch file name, CSV files by
+    phase) `chunks` in batch order, on a single thread, so that every
+    run plans a characteristic into the same nodes file,
+    Return the paths of the nodes files by characteristics file path
+    """
+    paths = sorted((file, csv_files['characteristics'])
+                   for file, csv_files in chunks)
+    return {path: plan_csv_characteristics(planner, path)
+            for _, path in paths}
+
+
+def plan_csv_characteristics(planner, path):
+    """
+    Write the characteristics of the characteristics CSV file `path` that
+    `planner` did not create yet, once each, to a CSV file in TMP_DIR
+    named after its content,
+    Return the path of that file
+    """
+    characteristics = {}
+    references = 0
+    with open(path, encoding='utf-8', newline='') as input:
+        reader = csv.reader(input, dialect=formats.CSV_DIALECT)
+        next(reader, None)
+        for idno, type, value in reader:
+            key = type + ':' + value
+            characteristics.setdefault(
+                key, {'id': key, 'type': type, 'value': value})
+            references += 1
+    new = planner.plan(characteristics, references)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, dialect=formats.CSV_DIALECT)
+    writer.writerow(('type', 'value'))
+    writer.writerows((characteristic['type'], characteristic['value'])
+                     for characteristic in new)
+    content = buffer.getvalue()
+    # a resumed load skips committed batches and may plan the nodes of a
+    # batch differently: the name of a nodes file differs if its content
+    # does, so that the manifest never takes it for the one committed
+    digest = hashlib.blake2b(content.encode('utf-8'), digest_size=8)
+    root, extension = splitext(basename(path).replace(
+        'characteristics', 'characteristic_nodes'))
+    nodes_path = join(TMP_DIR, '{}.{}{}'.format(
+        root, digest.hexdigest(), extension))
+    with open(nodes_path, 'w', encoding='utf-8', newline='') as output:
+        output.write(content)
+    # the characteristic nodes of all the batches are loaded before any
+    # characteristic link
+    planner.done(new)
+    return nodes_path
+
+
+def write_tmp_csv(chunk):
+    """
+    Write a decoded chunk as students, characteristics and friends CSV
+    files in TMP_DIR,
+    Return batch file name and the paths of the CSV files by phase
+    """
+    from . import generator
+    from .columnar import ColumnarBatch
+
+    file, (number, _), data, edges = chunk
+    (students_csv_buffer,
+     students_csv_writer,
+     characteristics_csv_buffer,
+     characteristics_csv_writer,
+     friends_csv_buffer,
+     friends_csv_writer) = new_csv_writters()
+    if isinstance(data, ColumnarBatch):
+        students_csv_writer.writerows(data.csv_rows())
+        characteristics_csv_writer.writerows(data.characteristic_rows())
+    else:
+        for item in data:
+            students_csv_writer.writerow(
+                generator.get_student_as_csv_row(item))
+            characteristics_csv_writer.writerows(
+                generator.get_student_characteristic_rows(item))
+    friends_csv_writer.writerows(edges)
+
+    pref = '{}.{}'.format(file, number)
+    with open(f'{TMP_DIR}/{pref}_students.csv', 'w+') as f:
+        f.write(students_csv_buffer.getvalue())
+    with open(f'{TMP_DIR}/{pref}_characteristics.csv', 'w+') as f:
+        f.write(characteristics_csv_buffer.getvalue())
+    with open(f'{TMP_DIR}/{pref}_friends.csv', 'w+') as f:
+        f.write(friends_csv_buffer.getvalue())
+    return file, {phase: f'{TMP_DIR}/{pref}_{phase}.csv'
+                  for phase in ('students', 'characteristics', 'friends')}
+
+
+def dump_csv_files(task):
+    """
+    Find the CSV files of a batch listed by list_dump from a `csv` dump,
+    Return batch file name and the paths of the CSV files by phase
+    """
+    from .dataset import VirtualDataset
+
+    source, output_dir, file = task
+    output_dir = abspath(output_dir)
+    return file, {
+        'students': join(output_dir, file),
+        'characteristics': join(
+            output_dir, VirtualDataset.characteristics_file_name(file)),
+        'friends': join(output_dir, VirtualDataset.friends_file_name(file)),
+    }
+
+
+def baseline_option(command):
+    """
+    Add the --baseline option of the benchmark commands
+    """
+    return click.option(
+        '--baseline',
+        help="results of an earlier run to compare with, exits with status "
+             "1 on regressions",
+        type=click.File('r'),
+        default=None)(command)
+
+
+def write_benchmark_results(ctx, results, baseline):
+    """
+    Write the results document of a benchmark to the output, then exit
+    with status 1 if they regress from the `baseline` results file
+    """
+    from . import benchmark
+
+    json.dump(results, ctx.obj.output, **formats.PRETTY_JSON_KWARGS)
+    ctx.obj.output.write('\n')
+    ctx.obj.output.flush()
+    if ctx.obj.closeable:
+        ctx.obj.output.close()
+    if baseline is not None and benchmark.compare_results(
+            json.load(baseline), results):
+        ctx.exit(1)
+
+
+@cli.command(help="Benchmarks the loaders against a fake neo4j server: "
+                  "dumps #`batches` of #`batch_size` students in "
+                  "`output_dir` and loads them in every loader mode")
+@click.option(
+    '--modes',
+    help="comma separated loader modes: json, json_ndjson, json_columnar, "
+         "json_virtual, json_gzip, json_concurrent, json_dedupe, "
+         "json_bolt, json_uuid7, json_int, json_base62, csv, csv_dump, "
+         "csv_dedupe, csv_bolt, csv_int (default is all)",
+    default=None)
+@click.option(
+    '--latency',
+    help="seconds the fake server adds to every request",
+    default='0.0')
+@click.option(
+    '--rows_per_second',
+    help="write throughput of the fake server (default is unlimited)",
+    default=None)
+@click.option(
+    '--max_rows',
+    help="larger transactions fail with an out of memory error",
+    default=None)
+@click.option(
+    '--failure_rate',
+    help="share of transactions failing with a deadlock",
+    default='0.0')
+@click.option(
+    '--http_error_rate',
+    help="share of requests answered with a 503",
+    default='0.0')
+@baseline_option
+@click.pass_context
+def neo4j_benchmark(ctx, modes, latency, rows_per_second, max_rows,
+                    failure_rate, http_error_rate, baseline):
+    from . import benchmark
+
+    makedirs(ctx.obj.output_dir, exist_ok=True)
+    dataset_args = [
+        '--output_dir', ctx.obj.output_dir,
+        '--batches', str(ctx.obj.batches),
+        '--batch_size', str(ctx.obj.batch_size),
+        '--seed', str(ctx.obj.seed),
+        '--reference_date', ctx.obj.reference_date.isoformat(),
+        '--topology', ctx.obj.topology_name,
+    ]
+    results = benchmark.run_ingest_benchmark(
+        dataset_args, ctx.obj.batches * ctx.obj.batch_size,
+        modes=modes.split(',') if modes else None,
+        latency=float(latency),
+        rows_per_second=float(rows_per_second) if rows_per_second else None,
+        max_rows=int(max_rows) if max_rows else None,
+        failure_rate=float(failure_rate),
+        http_error_rate=float(http_error_rate))
+    write_benchmark_results(ctx, results, baseline)
+
+
+@cli.command(help="Benchmarks student generation: the cost of every "
+                  "generated field, students/sec and memory of the row and "
+                  "bulk generators, and the serializers")
+@click.option(
+    '--students',
+    help="number of students generated by each measure",
+    default='2000')
+@baseline_option
+@click.pass_context
+def generator_benchmark(ctx, students, baseline):
+    from . import benchmark
+
+    results = benchmark.run_generator_benchmark(
+        int(students), seed=ctx.obj.seed)
+    write_benchmark_results(ctx, results, baseline)
+
+
+@cli.command(help="Benchmarks startup: times `graph-data --help`, a one "
+                  "student `batch` and the import of the command line in "
+                  "fresh interpreters and lists the heaviest imports")
+@click.option(
+    '--repeat',
+    help="number of runs of every command line",
+    default='5')
+@baseline_option
+@click.pass_context
+def startup_benchmark(ctx, repeat, baseline):
+    from . import benchmark
+
+    results = benchmark.run_startup_benchmark(int(repeat))
+    write_benchmark_results(ctx, results, baseline)
+
+
+def new_neo4j_client(ctx):
+    """
+    Return a client of ctx.neo4j_url, over Bolt for bolt:// urls,
+    over HTTP otherwise
+    """
+    from . import neo4j
+
+    if ctx.neo4j_url.startswith('bolt://'):
+        from . import bolt
+
+        return bolt.BoltClient(
+            ctx.neo4j_url, timeout=ctx.neo4j_timeout,
+            pool_size=ctx.neo4j_pool_size)
+    return neo4j.Neo4jClient(
+        ctx.neo4j_url, timeout=ctx.neo4j_timeout,
+        gzip=ctx.neo4j_gzip, pool_size=ctx.neo4j_pool_size)
+
+
+def list_dump(ctx, source):
+    """
+    Iterate over the batches of a dump, of the dataset shard only if
+    sharded,
+    Yield a decode_dump_batch task for each batch
+    """
+    if source == 'virtual':
+        for batch_nr in ctx.dataset.batch_nrs():
+            yield source, ctx.dataset, batch_nr
+        return
+
+    batch_files = sorted(f for f in listdir(ctx.output_dir)
+                         if isfile(join(ctx.output_dir, f))
+                         and f.endswith('.' + formats.extension(source)))
+    if ctx.shard is not None:
+        batch_nrs = ctx.dataset.batch_nrs()
+        batch_files = [f for f in batch_files
+                       if int(f.split('.')[0]) in batch_nrs]
+    for file in batch_files:
+        yield source, ctx.output_dir, file
+
+
+def dump_task_name(task):
+    """
+    Return the batch file name of a decode_dump_batch task
+    """
+    from .dataset import VirtualDataset
+
+    source, location, item = task
+    if source == 'virtual':
+        return VirtualDataset.batch_file_name(item)
+    return item
+
+
+def decode_dump_batch(task, id_scheme=None):
+    """
+    Read or regenerate a batch listed by list_dump, idnos of friends
+    files being `id_scheme` idnos,
+    Yield (batch file name, (chunk number, last), students, edges) for
+    every chunk of at most CHUNK_SIZE students of the batch, students
+    being a list of rows or, for columnar files, a columnar.ColumnarBatch
+    and edges the list of (idno, friend idno) edges of these students
+    """
+    from .dataset import VirtualDataset
+
+    source, location, item = task
+    if source == 'virtual':
+        dataset, batch_nr = location, item
+        yield from number_chunks(
+            VirtualDataset.batch_file_name(batch_nr),
+            ((list(students), list(zip(*edges))) for students, edges in zip(
+                dataset.chunks(batch_nr), dataset.chunk_friends(batch_nr))))
+        return
+
+    output_dir, file = location, item
+    if source in formats.BINARY:
+        input = open(join(output_dir, file), mode='rb')
+    else:
+        input = open(join(output_dir, file), mode='r', encoding='utf-8')
+    with input, open_friends_file(output_dir, file, id_scheme) as friends:
+        edges = {}
+        for idno, friend_idno in friends:
+            edges.setdefault(idno, []).append((idno, friend_idno))
+        yield from number_chunks(
+            file, split_students(formats.READERS[source](input), edges))
+
+
+def split_students(data, edges):
+    """
+    Split the students read from a batch file in chunks of at most
+    CHUNK_SIZE students, `edges` mapping idnos to their (idno, friend
+    idno) edges,
+    Yield (students, edges of these students) chunks, then the edges of
+    no student of the file, if any, with no students
+    """
+    from .columnar import ColumnarBatch
+    from .dataset import CHUNK_SIZE
+
+    if isinstance(data, ColumnarBatch):
+        # a ColumnarBatch is handed over to other processes as its path
+        chunks = (data.slice(start, start + CHUNK_SIZE)
+                  for start in range(0, len(data), CHUNK_SIZE))
+    else:
+        data = iter(data)
+        chunks = iter(lambda: list(itertools.islice(data, CHUNK_SIZE)), [])
+    for chunk in chunks:
+        idnos = (chunk.idnos() if isinstance(chunk, ColumnarBatch)
+                 else [student['idno'] for student in chunk])
+        yield chunk, [edge for idno in idnos
+                      for edge in edges.pop(idno, ())]
+    others = [edge for idno_edges in edges.values() for edge in idno_edges]
+    if others:
+        yield [], others
+
+
+def number_chunks(file, chunks):
+    """
+    Number the (students, edges) chunks of batch `file`,
+    Yield (file, (chunk number, last), students, edges) items, at least
+    one for an empty batch
+    """
+    previous = [], []
+    number = 0
+    for number, chunk in enumerate(chunks):
+        if number:
+            yield (file, (number - 1, False)) + previous
+        previous = chunk
+    yield (file, (number, True)) + previous
+
+
+def sample_missing_friends(registry, rng, output_dir, chunk):
+    """
+    Register the students of a decoded chunk and, if the batch file has
+    no friends file, draw their friends among the registered students,
+    Return the chunk
+    """
+    from .columnar import ColumnarBatch
+    from .dataset import VirtualDataset
+    from .registry import sample_friends
+
+    file, position, data, edges = chunk
+    idnos = (data.idnos() if isinstance(data, ColumnarBatch)
+             else [item['idno'] for item in data])
+    registry.add(idnos)
+    if isfile(join(output_dir, VirtualDataset.friends_file_name(file))):
+        return chunk
+    return file, position, data, sample_friends(registry, idnos, rng)
+
+
+@contextmanager
+def open_friends_file(output_dir, file, id_scheme=None):
+    """
+    Open the friend edges of a batch file,
+    Yield an iterable of (idno, friend idno) edges
+    """
+    from .dataset import VirtualDataset
+
+    friends_path = join(output_dir, VirtualDataset.friends_file_name(file))
+    if not isfile(friends_path):
+        logger.warning('friends.file.missing', file=file)
+        yield ()
+        return
+    with open(friends_path, mode='r', encoding='utf-8', newline='') as input:
+        yield formats.read_friends(
+            input, id_scheme.parse if id_scheme is not None
+            and id_scheme.integer else None)
+
+
 def new_csv_writters():
-    dialect = csv.get_dialect("gdata")
+    from . import generator
+
+    dialect = csv.get_dialect(formats.CSV_DIALECT)
     students_csv_buffer = io.StringIO()
     characteristics_csv_buffer = io.StringIO()
     friends_csv_buffer = io.StringIO()
@@ -282,7 +1248,7 @@ def new_csv_writters():
     characteristics_csv_writer.writerow(
         generator.get_student_characteristic_csv_header()
     )
-    friends_csv_writer.writerow(('idno', 'friend_idno'))
+    friends_csv_writer.writerow(formats.FRIENDS_CSV_HEADER)
     return (
         students_csv_buffer, students_csv_writer,
         characteristics_csv_buffer, characteristics_csv_writer,
@@ -0,0 +1,391 @@
+"""
+Binary columnar batch files.
+
+A file starts with MAGIC, followed by the length of a JSON header
+(little endian uint32) and the header itself. The header lists every
+buffer of the file as [dtype, offset, count]; buffers are 8 byte aligned
+so that the reader can map them as numpy arrays without copying.
+
+Columns come in four kinds:
+
+* fixed: a single `data` buffer with one fixed-width value per student
+* text: utf-8 `data` and `offsets`, value i is data[offsets[i]:offsets[i+1]]
+* dict: `codes` into a text dictionary (`dict_data`, `dict_offsets`)
+* list: dictionary encoded values grouped per student by `list_offsets`,
+  used for characteristics a student can have several of
+"""
+import json
+import mmap
+import struct
+
+import numpy
+
+from . import generator
+
+MAGIC = b'GDCOL001'
+ALIGNMENT = 8
+
+TEXT_COLUMNS = ('name', 'description', 'phone', 'street', 'address')
+DICT_COLUMNS = ('country', 'city', 'university', 'faculty')
+DATE_COLUMNS = ('date_of_birth', 'date_enrolled')
+# student properties, in the order of generator.get_student_csv_header
+PROPERTY_COLUMNS = ('name', 'description', 'phone', 'country', 'city',
+                    'address', 'university', 'faculty', 'date_of_birth',
+                    'date_enrolled')
+
+
+def _encode_text(values):
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+    numpy.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return offsets, numpy.frombuffer(b''.join(encoded), dtype=numpy.uint8)
+
+
+def _encode_dict(values):
+    index = {}
+    codes = numpy.fromiter(
+        (index.setdefault(value, len(index)) for value in values),
+        dtype=numpy.uint32, count=len(values))
+    dict_offsets, dict_data = _encode_text(list(index))
+    return {'codes': codes, 'dict_offsets': dict_offsets,
+            'dict_data': dict_data}
+
+
+def encode_batch(batch):
+    """
+    Encode a StudentBatch into columns,
+    Return a dict of column name to (kind, {buffer name: array})
+    """
+    text = generator.batch_text_columns(batch)
+    columns = {}
+    if batch.idno and isinstance(batch.idno[0], int):
+        # ids.IntegerScheme
+        idno = numpy.array(batch.idno, dtype=numpy.int64)
+    else:
+        idno = numpy.array(batch.idno, dtype=bytes)
+    columns['idno'] = ('fixed', {'data': idno})
+    for name in TEXT_COLUMNS:
+        offsets, data = _encode_text(getattr(batch, name))
+        columns[name] = ('text', {'offsets': offsets, 'data': data})
+    for name in DICT_COLUMNS:
+        values = text[name] if name in text else getattr(batch, name)
+        columns[name] = ('dict', _encode_dict(values))
+    for name in DATE_COLUMNS:
+        columns[name] = ('fixed', {'data': getattr(batch, name)})
+    columns['year_graduated'] = (
+        'fixed', {'data': batch.year_graduated.astype(numpy.int16)})
+    hobby = _encode_dict(text['hobby'])
+    hobby['list_offsets'] = batch.hobby_offsets
+    columns['hobby'] = ('list', hobby)
+    return columns
+
+
+def write_columnar(chunks, output):
+    """
+    Write the chunks of a batch as a single binary columnar file,
+    `output` must be a binary stream
+    """
+    batch = generator.concat_batches(list(chunks))
+    columns = encode_batch(batch)
+
+    header = {'rows': len(batch), 'columns': {}}
+    buffers = []
+    for name, (kind, arrays) in columns.items():
+        header['columns'][name] = {'kind': kind, 'buffers': {}}
+        for buffer_name, array in arrays.items():
+            array = numpy.ascontiguousarray(array)
+            header['columns'][name]['buffers'][buffer_name] = [
+                array.dtype.str, None, len(array)]
+            buffers.append((header['columns'][name]['buffers'][buffer_name],
+                            array))
+
+    # offsets depend on the header length, which depends on the offsets;
+    # reserve room for them by sizing the header with maximal offsets
+    for entry, _ in buffers:
+        entry[1] = 2 ** 63 - 1
+    start = _align(len(MAGIC) + 4 + len(json.dumps(header)))
+    position = start
+    for entry, array in buffers:
+        entry[1] = position
+        position = _align(position + array.nbytes)
+    encoded_header = json.dumps(header).encode()
+    encoded_header += b' ' * (start - len(MAGIC) - 4 - len(encoded_header))
+
+    output.write(MAGIC)
+    output.write(struct.pack('<I', len(encoded_header)))
+    output.write(encoded_header)
+    written = start
+    for entry, array in buffers:
+        output.write(b'\0' * (entry[1] - written))
+        output.write(array.tobytes())
+        written = entry[1] + array.nbytes
+
+
+def _align(position):
+    return (position + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def read_columnar(input):
+    """
+    Memory map a binary columnar file,
+    Return a ColumnarBatch
+    """
+    buffer = mmap.mmap(input.fileno(), 0, access=mmap.ACCESS_READ)
+    return ColumnarBatch(buffer, path=getattr(input, 'name', None))
+
+
+def _decode_text(offsets, data, start, stop):
+    """
+    Decode values start..stop of a text column into a list of str
+    """
+    base = offsets[start]
+    raw = bytes(data[base:offsets[stop]])
+    decoded = raw.decode('utf-8')
+    bounds = (offsets[start:stop + 1] - base).tolist()
+    if len(decoded) != len(raw):
+        # non ascii data: byte offsets are not character offsets
+        return [raw[begin:end].decode('utf-8')
+                for begin, end in zip(bounds, bounds[1:])]
+    return [decoded[begin:end] for begin, end in zip(bounds, bounds[1:])]
+
+
+def _lookup(values, codes):
+    """
+    Return [values[code] for code in codes], indexing in numpy
+    """
+    table = numpy.empty(len(values), dtype=object)
+    table[:] = values
+    return table[codes].tolist()
+
+
+def _fixed_text(column):
+    """
+    Return the values of a fixed column as str, converting each distinct
+    value once
+    """
+    if column.dtype.kind == 'S':
+        return [value.decode('ascii') for value in column.tolist()]
+    distinct, codes = numpy.unique(column, return_inverse=True)
+    return _lookup(distinct.astype(str).tolist(), codes)
+
+
+class ColumnarBatch():
+    """
+    Zero-copy view over the rows start..stop of a binary columnar file.
+
+    Columns are numpy arrays mapped straight from the file. Loaders build
+    their payloads and CSV rows from the columns; rows are only decoded
+    into dicts when the batch is iterated. Students having the same
+    characteristic share its {type, value} dict.
+
+    Pickling a batch of a file given by `path` only copies the path and
+    the rows, the file is mapped again when unpickled.
+    """
+
+    def __init__(self, buffer, start=0, stop=None, path=None):
+        if bytes(buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError('not a columnar batch file')
+        header_length, = struct.unpack_from('<I', buffer, len(MAGIC))
+        self.header = json.loads(bytes(
+            buffer[len(MAGIC) + 4:len(MAGIC) + 4 + header_length]))
+        self.buffer = buffer
+        self.path = path
+        self.start = start
+        self.stop = self.header['rows'] if stop is None else stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getstate__(self):
+        if self.path is None:
+            raise TypeError('only batches read from a file are pickled')
+        return {'path': self.path, 'start': self.start, 'stop': self.stop}
+
+    def __setstate__(self, state):
+        with open(state['path'], 'rb') as input:
+            buffer = mmap.mmap(input.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__init__(buffer, state['start'], state['stop'], state['path'])
+
+    def slice(self, start, stop):
+        """
+        Return a view over rows start..stop of this batch
+        """
+        stop = min(stop, len(self))
+        return ColumnarBatch(
+            self.buffer, self.start + start, self.start + stop, self.path)
+
+    def kind(self, name):
+        return self.header['columns'][name]['kind']
+
+    def array(self, name, buffer_name):
+        """
+        Return a whole buffer of a column, mapped from the file
+        """
+        dtype, offset, count = \
+            self.header['columns'][name]['buffers'][buffer_name]
+        return numpy.frombuffer(
+            self.buffer, dtype=numpy.dtype(dtype), count=count, offset=offset)
+
+    def column(self, name):
+        """
+        Return the values of a fixed column, or the codes of a dict
+        column, for the rows of this batch
+        """
+        kind = self.kind(name)
+        if kind == 'fixed':
+            return self.array(name, 'data')[self.start:self.stop]
+        if kind == 'dict':
+            return self.array(name, 'codes')[self.start:self.stop]
+        raise TypeError('{} is a {} column'.format(name, kind))
+
+    def dictionary(self, name):
+        offsets = self.array(name, 'dict_offsets')
+        return _decode_text(
+            offsets, self.array(name, 'dict_data'), 0, len(offsets) - 1)
+
+    def values(self, name):
+        """
+        Decode the values of a column for the rows of this batch
+        """
+        kind = self.kind(name)
+        if kind == 'text':
+            return _decode_text(self.array(name, 'offsets'),
+                                self.array(name, 'data'),
+                                self.start, self.stop)
+        if kind == 'dict':
+            return _lookup(self.dictionary(name), self.column(name))
+        if kind == 'list':
+            dictionary = self.dictionary(name)
+            offsets = self.array(name, 'list_offsets')
+            codes = self.array(name, 'codes')
+            return [[dictionary[code] for code in
+                     codes[offsets[i]:offsets[i + 1]].tolist()]
+                    for i in range(self.start, self.stop)]
+        return _fixed_text(self.column(name))
+
+    def idnos(self):
+        """
+        Return the idnos of the rows of this batch, integer idnos stay
+        numbers
+        """
+        idno = self.column('idno')
+        if idno.dtype.kind == 'i':
+            return idno.tolist()
+        return [value.decode('ascii') for value in idno.tolist()]
+
+    def _shared(self, type, name):
+        # one characteristic dict per distinct value of a column, by row
+        if self.kind(name) == 'dict':
+            return _lookup([{'type': type, 'value': value}
+                            for value in self.dictionary(name)],
+                           self.column(name))
+        return _share(type, self.values(name))
+
+    def characteristics(self):
+        """
+        Return the characteristics of every row as a list of {type, value}
+        dicts, in the order of generator.student_characteristics
+        """
+        year_enrolled = _share('year_enrolled', _fixed_text(
+            self.column('date_enrolled').astype('datetime64[Y]').astype(int)
+            + 1970))
+        year_graduated = self.column('year_graduated')
+        graduated = _share('year_graduated', _fixed_text(year_graduated))
+        fixed = zip(
+            self._shared('country', 'country'), self._shared('city', 'city'),
+            self._shared('university', 'university'),
+            self._shared('faculty', 'faculty'),
+            self._shared('street', 'street'),
+            self._shared('date_of_birth', 'date_of_birth'),
+            year_enrolled, graduated, year_graduated.tolist())
+        # hobbies of all the rows, each row taking a slice
+        offsets = self.array('hobby', 'list_offsets')
+        hobbies = _lookup([{'type': 'hobby', 'value': value}
+                           for value in self.dictionary('hobby')],
+                          self.array('hobby', 'codes')[
+                              offsets[self.start]:offsets[self.stop]])
+        offsets = (offsets[self.start:self.stop + 1]
+                   - offsets[self.start]).tolist()
+        result = []
+        for (country, city, university, faculty, street, date_of_birth,
+             enrolled, graduated, year), begin, end in zip(
+                fixed, offsets, offsets[1:]):
+            characteristics = [country, city, university, faculty, street,
+                               date_of_birth, enrolled]
+            if year:
+                characteristics.append(graduated)
+            characteristics += hobbies[begin:end]
+            result.append(characteristics)
+        return result
+
+    def _property_columns(self):
+        # values of the student properties, in row order
+        return [self.values(name) for name in PROPERTY_COLUMNS]
+
+    def payloads(self):
+        """
+        Return the rows of this batch in the form of the `students`
+        parameter of neo4j.Q_IN_STUDENTS, without friends
+        """
+        return [{
+            'idno': idno,
+            'characteristics': characteristics,
+            'properties': {
+                'name': name,
+                'description': description,
+                'phone': phone,
+                'country': country,
+                'city': city,
+                'address': address,
+                'university': university,
+                'faculty': faculty,
+                'date_of_birth': date_of_birth,
+                'date_enrolled': date_enrolled,
+            },
+        } for (idno, characteristics, name, description, phone, country,
+               city, address, university, faculty, date_of_birth,
+               date_enrolled) in zip(self.idnos(), self.characteristics(),
+                                     *self._property_columns())]
+
+    def csv_rows(self):
+        """
+        Return the rows of this batch as student CSV rows, see
+        generator.get_student_csv_header
+        """
+        return list(zip(self.idnos(), *self._property_columns()))
+
+    def characteristic_rows(self):
+        """
+        Return the (idno, type, value) characteristic CSV rows of this
+        batch
+        """
+        return [(idno, characteristic['type'], characteristic['value'])
+                for idno, characteristics in zip(
+                    self.idnos(), self.characteristics())
+                for characteristic in characteristics]
+
+    def __iter__(self):
+        for (idno, characteristics, name, description, phone, country,
+             city, address, university, faculty, date_of_birth,
+             date_enrolled) in zip(self.idnos(), self.characteristics(),
+                                   *self._property_columns()):
+            yield {
+                'idno': idno,
+                'name': name,
+                'description': description,
+                'phone': phone,
+                'country': country,
+                'city': city,
+                'address': address,
+                'university': university,
+                'faculty': faculty,
+                'date_of_birth': date_of_birth,
+                'date_enrolled': date_enrolled,
+                'characteristics': characteristics,
+            }
+
+
+def _share(type, values):
+    # characteristic dicts of `values`, one per distinct value
+    shared = {value: {'type': type, 'value': value} for value in set(values)}
+    return [shared[value] for value in values]
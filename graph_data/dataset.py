@@ -0,0 +1,158 @@
+import datetime
+
+import numpy
+
+from . import generator, ids
+from .topology import UniformTopology
+
+# number of students generated at once, bounds the memory used by a batch;
+# fields are drawn a chunk at a time, so batches of more students than
+# that change with it
+CHUNK_SIZE = 10000
+
+
+class VirtualDataset():
+    """
+    Dataset defined by a master seed, a batch size and a batch count.
+
+    Batches are never stored: each one is generated on demand from a seed
+    derived from the master seed and the batch number, so any batch can be
+    regenerated on its own, byte-identically, in O(batch_size) time.
+    Dates are computed relative to `reference_date` instead of today, so
+    the dataset does not change from one day to the next. Students are
+    numbered from 0 in batch order and their idno is derived from their
+    number by `id_scheme` (ids.IdScheme, random UUIDs by default), so
+    friend edges drawn from `topology` (uniform by default) can be
+    written along with each batch. A topology that clusters
+    students by university decides the university of every student.
+    Faker fields are sampled from `pools` (pools.ValuePools) if given.
+
+    A dataset split in `shard` = (i, n) shards only has the batches of
+    shard #i of n (from 1): a contiguous range of batches, thus of
+    student numbers and of idnos derived from them. Friend edges point to
+    earlier students, of this shard or of previous ones, by their idnos.
+
+    The catalogs are global to a process: a pickled dataset carries the
+    configuration of generator.CATALOGS and applies it when unpickled, so
+    that worker processes, forked or spawned, generate the same students.
+    """
+
+    def __init__(self, seed, batch_size, batches, reference_date=None,
+                 topology=None, pools=None, id_scheme=None, shard=None):
+        self.seed = seed
+        self.batch_size = batch_size
+        self.batches = batches
+        self.reference_date = reference_date or datetime.date.today()
+        self.topology = topology or UniformTopology(seed)
+        self.pools = pools
+        self.id_scheme = id_scheme or ids.scheme(ids.DEFAULT_SCHEME)
+        self.shard = shard
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['catalogs'] = generator.catalog_settings()
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        generator.configure_catalogs(state.pop('catalogs'))
+        self.__dict__.update(state)
+
+    def __len__(self):
+        return self.batches
+
+    def __iter__(self):
+        for batch_nr in self.batch_nrs():
+            yield batch_nr, self.batch(batch_nr)
+
+    def batch_nrs(self):
+        """
+        Return the range of batch numbers of the dataset, or of its shard
+        """
+        if self.shard is None:
+            return range(1, self.batches + 1)
+        shard, shards = self.shard
+        return range(self.batches * (shard - 1) // shards + 1,
+                     self.batches * shard // shards + 1)
+
+    def first_student(self, batch_nr):
+        """
+        Return the number of the first student of batch #`batch_nr`
+        """
+        return (batch_nr - 1) * self.batch_size
+
+    def chunks(self, batch_nr):
+        """
+        Regenerate batch #`batch_nr` (starting from 1),
+        Yield columnar StudentBatch chunks of at most CHUNK_SIZE students
+
+        The generator state is shared, so chunks of different batches
+        must not be interleaved.
+        """
+        if not 1 <= batch_nr <= self.batches:
+            raise IndexError(
+                'batch {} out of range 1..{}'.format(batch_nr, self.batches))
+        generator.reseed(generator.batch_seed(self.seed, batch_nr))
+        first = self.first_student(batch_nr)
+        for start in range(0, self.batch_size, CHUNK_SIZE):
+            size = min(CHUNK_SIZE, self.batch_size - start)
+            yield generator.generate_students(
+                size, today=self.reference_date,
+                university=self.topology.blocks(
+                    first + start, first + start + size),
+                idno=self.id_scheme.idnos(
+                    self.seed, numpy.arange(first + start,
+                                            first + start + size)),
+                pools=self.pools)
+
+    def students(self, batch_nr):
+        """
+        Regenerate batch #`batch_nr`,
+        Yield students in row form, one chunk in memory at a time
+        """
+        for chunk in self.chunks(batch_nr):
+            yield from chunk
+
+    def batch(self, batch_nr):
+        """
+        Regenerate batch #`batch_nr`,
+        Return a columnar StudentBatch
+        """
+        return generator.concat_batches(list(self.chunks(batch_nr)))
+
+    def friends(self, batch_nr):
+        """
+        Draw the friend edges of the students of batch #`batch_nr`,
+        Return (idnos, friend idnos) lists
+        """
+        first = self.first_student(batch_nr)
+        sources, targets = self.topology.edges(first, first + self.batch_size)
+        return (self.id_scheme.idnos(self.seed, sources),
+                self.id_scheme.idnos(self.seed, targets))
+
+    def chunk_friends(self, batch_nr):
+        """
+        Draw the friend edges of the students of batch #`batch_nr`,
+        Yield (idnos, friend idnos) lists for every chunk of students
+        yielded by `chunks`
+        """
+        first = self.first_student(batch_nr)
+        sources, targets = self.topology.edges(first, first + self.batch_size)
+        # edges are sorted by source
+        bounds = numpy.searchsorted(sources, numpy.arange(
+            first, first + self.batch_size + CHUNK_SIZE, CHUNK_SIZE))
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            yield (self.id_scheme.idnos(self.seed, sources[start:stop]),
+                   self.id_scheme.idnos(self.seed, targets[start:stop]))
+
+    @staticmethod
+    def batch_file_name(batch_nr, extension='json'):
+        return '{0:05d}.{1}'.format(batch_nr, extension)
+
+    @staticmethod
+    def friends_file_name(batch_file_name):
+        return batch_file_name.split('.')[0] + '.friends.csv'
+
+    @staticmethod
+    def characteristics_file_name(batch_file_name):
+        return batch_file_name.split('.')[0] + '.characteristics.csv'
@@ -0,0 +1,358 @@
+"""
+In-process stand-in for the neo4j HTTP transactional endpoint.
+
+FakeNeo4jServer answers POST /db/data/transaction/commit with bodies
+shaped like the ones of neo4j: a `results` entry with `stats` per
+statement, or `errors` with neo4j status codes. Statements are not
+executed; their statistics are estimated from the parameters (or, for
+LOAD CSV, from the CSV file) so that loaders and their logs behave as
+against a database.
+
+The server can add a fixed `latency` to every request, cap its
+throughput at `rows_per_second` (shared by all connections, like a
+database doing the writes), fail transactions of more than `max_rows`
+rows with an out of memory error and inject transient errors or 5xx
+responses at random.
+
+FakeBoltServer puts a Bolt (version 1) front end on a FakeNeo4jServer,
+sharing its behaviour and statistics: statements run when their RUN
+message arrives, and the connection is dropped instead of answering
+with a 5xx.
+"""
+import csv
+import gzip
+import json
+import random
+import re
+import socketserver
+import struct
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import bolt
+from .neo4j import STATS_KEYS
+
+COMMIT_ENDPOINT = '/db/data/transaction/commit'
+
+DEADLOCK_ERROR = 'Neo.TransientError.Transaction.DeadlockDetected'
+OUT_OF_MEMORY_ERROR = 'Neo.TransientError.General.OutOfMemoryError'
+
+_LOAD_CSV = re.compile(r"LOAD CSV WITH HEADERS FROM 'file://([^']*)'")
+_PERIODIC_COMMIT = re.compile(r"USING PERIODIC COMMIT (\d+)")
+
+
+class FakeNeo4jServer():
+    """
+    Fake neo4j server listening on `port` (any free port by default),
+    run in a background thread between `start` and `stop`
+    """
+
+    def __init__(self, port=0, latency=0.0, rows_per_second=None,
+                 max_rows=None, failure_rate=0.0, failure_code=DEADLOCK_ERROR,
+                 http_error_rate=0.0, seed=None):
+        self.latency = latency
+        self.rows_per_second = rows_per_second
+        self.max_rows = max_rows
+        self.failure_rate = failure_rate
+        self.failure_code = failure_code
+        self.http_error_rate = http_error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        # time at which the writes accepted so far are done
+        self.busy_until = 0.0
+        self.reset_stats()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        self.server.daemon_threads = True
+        self.server.fake = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {'requests': 0, 'statements': 0, 'rows': 0,
+                          'bytes_received': 0, 'failures': 0}
+
+    def commit(self, body, size=None):
+        """
+        Handle the body of a commit request, `size` bytes on the wire,
+        Return the HTTP status and the response document
+        """
+        request = json.loads(body)
+        return self.execute(request.get('statements', []),
+                            len(body) if size is None else size)
+
+    def execute(self, statements, size):
+        """
+        Run `statements`, {statement, parameters} dicts, in a transaction
+        received in `size` bytes,
+        Return the HTTP status and the response document
+        """
+        rows = sum(statement_rows(statement) for statement in statements)
+        # rows held by the largest transaction of the request
+        transaction_rows = sum(
+            statement_rows(statement, periodic=True)
+            for statement in statements)
+        with self.lock:
+            self.stats['requests'] += 1
+            self.stats['statements'] += len(statements)
+            self.stats['bytes_received'] += size
+            http_error = self.random.random() < self.http_error_rate
+            failure = self.random.random() < self.failure_rate
+            # writes of concurrent requests queue behind each other
+            start = max(time.monotonic(), self.busy_until)
+            if self.rows_per_second:
+                self.busy_until = start + rows / self.rows_per_second
+            done = max(start, self.busy_until) + self.latency
+        time.sleep(max(0.0, done - time.monotonic()))
+
+        if http_error:
+            self._count('failures')
+            return 503, {'errors': []}
+        if self.max_rows is not None and transaction_rows > self.max_rows:
+            self._count('failures')
+            return 200, error_document(
+                OUT_OF_MEMORY_ERROR,
+                'There is not enough memory to perform the current task')
+        if failure:
+            self._count('failures')
+            return 200, error_document(
+                self.failure_code, 'Injected failure')
+        self._count('rows', rows)
+        return 200, {
+            'results': [{'columns': [], 'data': [],
+                         'stats': statement_stats(statement)}
+                        for statement in statements],
+            'errors': [],
+        }
+
+    def _count(self, key, value=1):
+        with self.lock:
+            self.stats[key] += value
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        size = int(self.headers['Content-Length'])
+        body = self.rfile.read(size)
+        if self.path != COMMIT_ENDPOINT:
+            self.respond(404, {'errors': []})
+            return
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        status, document = self.server.fake.commit(body, size)
+        self.respond(status, document)
+
+    def respond(self, status, document):
+        data = json.dumps(document).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeBoltServer():
+    """
+    Bolt server listening on `port` (any free port by default) in front
+    of the FakeNeo4jServer `fake`, run in a background thread between
+    `start` and `stop`
+    """
+
+    def __init__(self, fake, port=0):
+        self.fake = fake
+        self.server = socketserver.ThreadingTCPServer(
+            ('127.0.0.1', port), _BoltHandler)
+        self.server.daemon_threads = True
+        self.server.fake = fake
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'bolt://{}:{}'.format(host, port)
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class _CountingReader():
+    """
+    Binary stream counting the bytes read from `input`
+    """
+
+    def __init__(self, input):
+        self.input = input
+        self.count = 0
+
+    def read(self, size):
+        data = self.input.read(size)
+        self.count += len(data)
+        return data
+
+
+class _BoltHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        handshake = self.rfile.read(20)
+        if len(handshake) < 20 or handshake[:4] != bolt.HANDSHAKE:
+            return
+        if 1 not in struct.unpack('>4I', handshake[4:]):
+            self.wfile.write(struct.pack('>I', 0))
+            return
+        self.wfile.write(struct.pack('>I', 1))
+        input = _CountingReader(self.rfile)
+        # a failure ignores the requests up to the next reset
+        failed = False
+        stats = None
+        while True:
+            message = bolt.read_message(input)
+            if message is None:
+                return
+            if message.tag in (bolt.RESET, bolt.ACK_FAILURE):
+                failed = False
+                self.respond(bolt.SUCCESS, {})
+            elif message.tag == bolt.INIT:
+                self.respond(bolt.SUCCESS, {'server': 'Neo4j/3.5.0'})
+            elif failed:
+                self.respond(bolt.IGNORED)
+            elif message.tag == bolt.RUN:
+                statement, parameters = message.fields
+                if statement.strip().upper() in (
+                        'BEGIN', 'COMMIT', 'ROLLBACK'):
+                    stats = None
+                    self.respond(bolt.SUCCESS, {'fields': []})
+                    continue
+                status, document = self.server.fake.execute(
+                    [{'statement': statement, 'parameters': parameters}],
+                    input.count)
+                input.count = 0
+                if status != 200:
+                    return
+                if document['errors']:
+                    failed = True
+                    self.respond(bolt.FAILURE, document['errors'][0])
+                    continue
+                stats = document['results'][0]['stats']
+                self.respond(bolt.SUCCESS, {'fields': []})
+            elif message.tag in (bolt.PULL_ALL, bolt.DISCARD_ALL):
+                metadata = {}
+                if stats is not None:
+                    metadata['stats'] = {
+                        bolt_key: stats[key]
+                        for key, bolt_key in bolt.BOLT_STATS.items()
+                        if stats[key]}
+                stats = None
+                self.respond(bolt.SUCCESS, metadata)
+            else:
+                self.respond(bolt.FAILURE, {
+                    'code': 'Neo.ClientError.Request.Invalid',
+                    'message': 'Unsupported message {:#x}'.format(
+                        message.tag)})
+                failed = True
+
+    def respond(self, tag, *fields):
+        self.wfile.write(bolt.encode_message(tag, *fields))
+
+
+def error_document(code, message):
+    return {'results': [], 'errors': [{'code': code, 'message': message}]}
+
+
+def statement_rows(statement, periodic=False):
+    """
+    Return the number of rows a statement writes: the length of its list
+    parameters, or of its LOAD CSV file; with `periodic`, the rows of its
+    largest transaction when it commits periodically
+    """
+    rows = sum(len(value) for value in statement.get('parameters', {}).values()
+               if isinstance(value, list))
+    match = _LOAD_CSV.search(statement['statement'])
+    if match:
+        try:
+            with open(match.group(1), encoding='utf-8') as f:
+                rows += max(0, sum(1 for _ in f) - 1)
+        except OSError:
+            pass
+    match = _PERIODIC_COMMIT.search(statement['statement'])
+    if periodic and match:
+        rows = min(rows, int(match.group(1)))
+    return rows
+
+
+def statement_stats(statement):
+    """
+    Estimate the statistics neo4j would report for a statement
+    """
+    stats = dict.fromkeys(STATS_KEYS, 0)
+    query = statement['statement']
+    if 'CREATE CONSTRAINT' in query:
+        stats['constraints_added'] = 1
+    elif 'CREATE INDEX' in query:
+        stats['indexes_added'] = 1
+    for value in statement.get('parameters', {}).values():
+        if not isinstance(value, list):
+            continue
+        for row in value:
+            stats['nodes_created'] += 1
+            if not isinstance(row, dict):
+                continue
+            stats['labels_added'] += 1
+            stats['properties_set'] += len(row.get('properties', row))
+            stats['relationships_created'] += (
+                len(row.get('characteristics', ())) +
+                len(row.get('characteristic_ids', ())) +
+                len(row.get('friends', ())))
+    match = _LOAD_CSV.search(query)
+    if match:
+        try:
+            with open(match.group(1), encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    stats['nodes_created'] += 1
+                    stats['properties_set'] += len(row)
+        except OSError:
+            pass
+    stats['contains_updates'] = any(
+        stats[key] for key in STATS_KEYS if key != 'contains_updates')
+    return stats
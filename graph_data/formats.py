@@ -0,0 +1,233 @@
+import csv
+import json
+import os
+
+# generator and columnar (numpy) are imported by the readers and writers
+# that need them, option choices only need the names of the formats
+
+PRETTY_JSON_KWARGS = dict(
+    ensure_ascii=False,
+    indent=2,
+    sort_keys=True)
+
+COMPACT_JSON_KWARGS = dict(
+    ensure_ascii=False,
+    separators=(',', ':'))
+
+CSV_DIALECT = 'gdata'
+
+csv.register_dialect(
+    CSV_DIALECT, quotechar='"',
+    quoting=csv.QUOTE_NONNUMERIC,
+    doublequote=True,
+)
+
+FRIENDS_CSV_HEADER = ('idno', 'friend_idno')
+
+# dump format writing the files of the LOAD CSV queries
+CSV = 'csv'
+
+
+def write_json(chunks, output):
+    """
+    Write the chunks of a batch as a single pretty printed JSON document,
+    the whole batch is held in memory
+    """
+    students = [student for chunk in chunks for student in chunk]
+    json.dump({"data": students}, output, **PRETTY_JSON_KWARGS)
+
+
+def write_ndjson(chunks, output):
+    """
+    Write the chunks of a batch as newline delimited JSON, one student
+    per line, each chunk is written as soon as it is generated
+    """
+    for chunk in chunks:
+        for student in chunk:
+            output.write(json.dumps(student, **COMPACT_JSON_KWARGS))
+            output.write('\n')
+
+
+def write_csv(chunks, students_output, characteristics_output):
+    """
+    Write the chunks of a batch as students and characteristics CSV, the
+    files loaded by the LOAD CSV queries, each chunk is written as soon
+    as it is generated
+    """
+    from . import generator
+
+    students = csv.writer(students_output, dialect=CSV_DIALECT)
+    characteristics = csv.writer(characteristics_output, dialect=CSV_DIALECT)
+    students.writerow(generator.get_student_csv_header())
+    characteristics.writerow(
+        generator.get_student_characteristic_csv_header())
+    for chunk in chunks:
+        students.writerows(generator.get_batch_as_csv_rows(chunk))
+        characteristics.writerows(
+            generator.get_batch_characteristic_rows(chunk))
+
+
+def write_columnar(chunks, output):
+    from .columnar import write_columnar
+
+    write_columnar(chunks, output)
+
+
+def read_columnar(input):
+    """
+    Return the columnar.ColumnarBatch of a columnar file
+    """
+    from .columnar import read_columnar
+
+    return read_columnar(input)
+
+
+def read_json(input):
+    return json.load(input)['data']
+
+
+def read_ndjson(input):
+    """
+    Iterate over the students of a newline delimited JSON file
+    """
+    for line in input:
+        if line.strip():
+            yield json.loads(line)
+
+
+def write_friends(edges, output):
+    """
+    Write (idnos, friend idnos) edges as CSV
+    """
+    writer = csv.writer(output, dialect=CSV_DIALECT)
+    writer.writerow(FRIENDS_CSV_HEADER)
+    writer.writerows(zip(*edges))
+
+
+def read_friends(input, parse=None):
+    """
+    Iterate over the (idno, friend idno) edges of a friends CSV file,
+    idnos are converted by `parse` (ids.IdScheme.parse) if given
+    """
+    reader = csv.reader(input, dialect=CSV_DIALECT)
+    next(reader, None)
+    if parse is None:
+        for idno, friend_idno in reader:
+            yield idno, friend_idno
+    else:
+        for idno, friend_idno in reader:
+            yield parse(idno), parse(friend_idno)
+
+
+def csv_records(input):
+    """
+    Iterate over the records of a binary CSV stream as raw bytes, a
+    record ends with the first line break outside of quotes
+    """
+    record = []
+    quotes = 0
+    for line in input:
+        record.append(line)
+        # quotes inside fields are doubled, the parity tells whether the
+        # line break is inside a field
+        quotes += line.count(b'"')
+        if quotes % 2 == 0:
+            yield b''.join(record)
+            record = []
+            quotes = 0
+    if record:
+        yield b''.join(record)
+
+
+def split_csv(path, rows, directory):
+    """
+    Split the CSV file `path` into shards of at most `rows` records in
+    `directory`, each with the header of `path`, without decoding it,
+    Return [(shard path, records)], `path` itself if it is small enough
+    """
+    with open(path, 'rb') as input:
+        count = sum(1 for _ in csv_records(input)) - 1
+    if count <= rows:
+        return [(path, max(count, 0))]
+
+    name = os.path.basename(path)
+    if name.endswith('.csv'):
+        name = name[:-4]
+    shards = []
+    output = None
+    try:
+        with open(path, 'rb') as input:
+            records = csv_records(input)
+            header = next(records)
+            for i, record in enumerate(records):
+                if i % rows == 0:
+                    if output is not None:
+                        output.close()
+                    shard = os.path.join(directory, '{}.{:04d}.csv'.format(
+                        name, len(shards)))
+                    shards.append((shard, min(rows, count - i)))
+                    output = open(shard, 'wb')
+                    output.write(header)
+                output.write(record)
+    finally:
+        if output is not None:
+            output.close()
+    return shards
+
+
+def partition_csv(path, key, directory):
+    """
+    Split the CSV file `path` into one file per partition in `directory`,
+    each with the header of `path`, `key` mapping the fields of a record,
+    as strings, to its partition, a tuple of ints,
+    Return {partition: (path, records)} for the partitions with records
+    """
+    name = os.path.basename(path)
+    if name.endswith('.csv'):
+        name = name[:-4]
+    parts = {}
+    outputs = {}
+    try:
+        with open(path, 'rb') as input:
+            records = csv_records(input)
+            header = next(records, None)
+            for record in records:
+                fields = next(csv.reader([record.decode('utf-8')]))
+                partition = key(fields)
+                output = outputs.get(partition)
+                if output is None:
+                    part = os.path.join(directory, '{}.p{}.csv'.format(
+                        name, '-'.join(str(group) for group in partition)))
+                    parts[partition] = [part, 0]
+                    output = outputs[partition] = open(part, 'wb')
+                    output.write(header)
+                output.write(record)
+                parts[partition][1] += 1
+    finally:
+        for output in outputs.values():
+            output.close()
+    return {partition: tuple(part) for partition, part in parts.items()}
+
+
+WRITERS = {
+    'json': write_json,
+    'ndjson': write_ndjson,
+    'columnar': write_columnar,
+}
+
+READERS = {
+    'json': read_json,
+    'ndjson': read_ndjson,
+    'columnar': read_columnar,
+}
+
+# formats written to and read from binary streams
+BINARY = ('columnar',)
+
+
+def extension(format):
+    """
+    Return the extension of the batch files of a dump `format`, CSV
+    batches are a students file along with a characteristics file
+    """
+    return 'students.csv' if format == CSV else format
@@ -1,9 +1,16 @@
 import datetime
-from uuid import uuid4
-from faker import Factory
+import hashlib
+from uuid import UUID
+import numpy
 import random
 
-fake = Factory.create('en_US')
+from .catalogs import Catalog
+
+# faker is created on first use, see get_fake
+_fake = None
+# seed to give faker when it is created
+_fake_seed = None
+_rng = numpy.random.default_rng()
 
 CHARACTERISTIC_TYPES = (
     'country',
@@ -65,14 +72,55 @@ def get_student_characteristic_rows(student: dict):
     return result
 
 
+def reseed(seed):
+    """
+    Reset the random state used for generation, so that the students
+    generated afterwards only depend on `seed`
+    """
+    global _rng, _fake_seed
+    random.seed(seed)
+    if _fake is None:
+        _fake_seed = seed
+    else:
+        _fake.seed(seed)
+    _rng = numpy.random.default_rng(seed)
+
+
+def get_fake():
+    """
+    Return the faker generator, importing and creating it on first use
+    """
+    global _fake
+    if _fake is None:
+        from faker import Factory
+        _fake = Factory.create('en_US')
+        if _fake_seed is not None:
+            _fake.seed(_fake_seed)
+    return _fake
+
+
+def batch_seed(seed, batch_nr):
+    """
+    Derive the seed of batch #`batch_nr` from the dataset `seed`
+    """
+    digest = hashlib.blake2b(
+        '{}:{}'.format(seed, batch_nr).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def random_idno():
+    return str(UUID(int=random.getrandbits(128), version=4))
+
+
 def generate_student():
+    fake = get_fake()
     date_of_birth = fake.date_time_between(start_date='-45y', end_date='-22y')
     street_name = fake.street_name()
     building_number = fake.building_number()
 
     date_enrolled = random_date_enrolled(date_of_birth)
     student = {
-        'idno': str(uuid4()),
+        'idno': random_idno(),
         'name': fake.name(),
         'description': fake.text(),
         'phone': fake.phone_number(),
@@ -118,741 +166,1018 @@ def random_date_enrolled(dob):
     return date
 
 
-def pick_friends(student_ids):
-    if len(student_ids) < 50:
-        return []
+class StudentBatch():
+    """
+    Columnar batch of students, as returned by `generate_students`.
+
+    Text fields produced by faker are plain lists, everything else is
+    kept in numpy arrays: catalog fields as indices into the university,
+    faculty and hobby CATALOGS, dates as datetime64 and graduation years
+    as integers (0 when the student did not graduate yet). Hobbies of
+    student `i` are `hobby[hobby_offsets[i]:hobby_offsets[i + 1]]`.
+    """
+
+    def __init__(self, **columns):
+        self.__dict__.update(columns)
+
+    def __len__(self):
+        return len(self.idno)
+
+    def __iter__(self):
+        return iter_students(self)
+
+
+def generate_students(n, today=None, university=None, idno=None,
+                      pools=None):
+    """
+    Generate a batch of `n` students in bulk, `university` and `idno`
+    optionally give the university index and the idno of every student,
+    faker fields are sampled from `pools` (pools.ValuePools) if given,
+    Return a columnar StudentBatch
+    """
+    today = numpy.datetime64(today or datetime.date.today(), 'D')
+    current_year = today.astype('datetime64[Y]').astype(int) + 1970
+
+    date_of_birth = today - _rng.integers(22 * 365, 45 * 365, n,
+                                          endpoint=True)
+    year_of_birth = date_of_birth.astype('datetime64[Y]').astype(int) + 1970
+    year_enrolled = _rng.integers(year_of_birth + 19, current_year)
+    date_enrolled = (
+        (year_enrolled - 1970).astype('datetime64[Y]').astype('datetime64[M]')
+        + _rng.integers(5, 9, n)).astype('datetime64[D]') \
+        + _rng.integers(0, 27, n)
+    # students enrolled more than 4 years ago have a graduation year
+    graduated = current_year - year_enrolled > 4
+    year_graduated = numpy.zeros(n, dtype=numpy.int64)
+    year_graduated[graduated] = _rng.integers(
+        year_enrolled[graduated], current_year - 4)
+
+    hobby_offsets = numpy.zeros(n + 1, dtype=numpy.int64)
+    numpy.cumsum(_rng.integers(2, 5, n), out=hobby_offsets[1:])
+
+    if pools is None:
+        fake = get_fake()
+        street = [fake.street_name() for _ in range(n)]
+        text = {
+            'name': [fake.name() for _ in range(n)],
+            'description': [fake.text() for _ in range(n)],
+            'phone': [fake.phone_number() for _ in range(n)],
+            'country': [fake.country() for _ in range(n)],
+            'city': [fake.city() for _ in range(n)],
+            'address': ['{} {}'.format(fake.building_number(), street_name)
+                        for street_name in street],
+        }
     else:
-        friends = []
-        friends_nr = random.choice(range(5, 20))
-        while friends_nr:
-            friends.append(random.choice(student_ids))
-            friends_nr -= 1
-        return friends
+        street = pools.sample('street', n)
+        text = {field: pools.sample(field, n) for field in
+                ('name', 'description', 'phone', 'country', 'city')}
+        text['address'] = [
+            '{} {}'.format(building_number, street_name)
+            for building_number, street_name in zip(
+                pools.sample('building_number', n), street)]
+    return StudentBatch(
+        idno=random_idnos(n) if idno is None else idno,
+        name=text['name'],
+        description=text['description'],
+        phone=text['phone'],
+        country=text['country'],
+        city=text['city'],
+        street=street,
+        address=text['address'],
+        university=(CATALOGS['university'].sample(_rng, n)
+                    if university is None else university),
+        faculty=CATALOGS['faculty'].sample(_rng, n),
+        date_of_birth=date_of_birth,
+        date_enrolled=date_enrolled,
+        year_graduated=year_graduated,
+        hobby_offsets=hobby_offsets,
+        hobby=CATALOGS['hobby'].sample(_rng, hobby_offsets[-1]),
+    )
 
 
-def random_university():
-    # Randomly return one university name from the following list
-    universities = [
-        "Harvard University",
-        "Stanford University",
-        "Massachusetts Institute of Technology (MIT)",
-        "University of California-Berkeley",
-        "University of Cambridge",
-        "Princeton University",
-        "California Institute of Technology",
-        "Columbia University",
-        "University of Chicago",
-        "University of Oxford",
-        "Yale University",
-        "University of California, Los Angeles",
-        "Cornell University",
-        "University of California, San Diego",
-        "University of Washington",
-        "University of Pennsylvania",
-        "The Johns Hopkins University",
-        "University of California, San Francisco",
-        "Swiss Federal Institute of Technology Zurich",
-        "University College London",
-        "The University of Tokyo",
-        "The Imperial College of Science, Technology and Medicine",
-        "University of Michigan-Ann Arbor",
-        "University of Toronto",
-        "University of Wisconsin - Madison",
-        "Kyoto University",
-        "New York University",
-        "Northwestern University",
-        "University of Illinois at Urbana-Champaign",
-        "University of Minnesota, Twin Cities",
-        "Duke University",
-        "Washington University in St. Louis",
-        "Rockefeller University",
-        "University of Colorado at Boulder",
-        "Pierre and Marie Curie University - Paris 6",
-        "University of North Carolina at Chapel Hill",
-        "University of British Columbia",
-        "The University of Manchester",
-        "The University of Texas at Austin",
-        "University of Copenhagen",
-        "University of California, Santa Barbara",
-        "University of Paris Sud (Paris 11)",
-        "University of Maryland, College Park",
-        "The University of Melbourne",
-        "The University of Edinburgh",
-        "The University of Texas Southwestern Medical Center at Dallas",
-        "Karolinska Institute",
-        "University of California, Irvine",
-        "Heidelberg University",
-        "University of Munich",
-        "University of Southern California",
-        "Rutgers, The State University of New Jersey - New Brunswick",
-        "Technical University Munich",
-        "Vanderbilt University",
-        "University of California, Davis",
-        "University of Zurich",
-        "Utrecht University",
-        "Pennsylvania State University - University Park",
-        "King's College London",
-        "Purdue University - West Lafayette",
-        "Uppsala University",
-        "Carnegie Mellon University",
-        "University of Bristol",
-        "The Ohio State University - Columbus",
-        "University of Pittsburgh-Pittsburgh Campus",
-        "University of Geneva",
-        "Ecole Normale Superieure - Paris",
-        "McGill University",
-        "University of Oslo",
-        "Ghent University",
-        "The Hebrew University of Jerusalem",
-        "Boston University",
-        "University of Helsinki",
-        "Aarhus University",
-        "Brown University",
-        "The Australian National University",
-        "Leiden University",
-        "Osaka University",
-        "Stockholm University",
-        "Technion-Israel Institute of Technology",
-        "University of Florida",
-        "Rice University",
-        "University of Groningen",
-        "Moscow State University",
-        "The University of Queensland",
-        "University of Arizona",
-        "University of Utah",
-        "Arizona State University",
-        "The University of Western Australia",
-        "McMaster University",
-        "University of Basel",
-        "University of Rochester",
-        "University of California, Santa Cruz",
-        "University of Bonn",
-        "University of Strasbourg",
-        "KU Leuven",
-        "Swiss Federal Institute of Technology Lausanne",
-        "Texas A & M University",
-        "Georgia Institute of Technology",
-        "VU University Amsterdam",
-        "Aix Marseille University",
-        "Baylor College of Medicine",
-        "Cardiff University",
-        "Case Western Reserve University",
-        "Catholic University of Louvain",
-        "Emory University",
-        "Hokkaido University",
-        "Indiana University Bloomington",
-        "Joseph Fourier University (Grenoble 1)",
-        "London School of Economics and Political Science",
-        "Lund University",
-        "Mayo Medical School",
-        "Michigan State University",
-        "Monash University",
-        "Nagoya University",
-        "National Taiwan University",
-        "National University of Singapore",
-        "Peking University",
-        "Radboud University Nijmegen",
-        "Seoul National University",
-        "Shanghai Jiao Tong University",
-        "Technical University of Denmark",
-        "The University of Glasgow",
-        "The University of New South Wales",
-        "The University of Sheffield",
-        "The University of Texas M. D. Anderson Cancer Center",
-        "Tohoku University",
-        "Tsinghua University",
-        "Tufts University",
-        "University Libre Bruxelles",
-        "University of Alberta",
-        "University of Amsterdam",
-        "University of Birmingham",
-        "University of California, Riverside",
-        "University of Frankfurt",
-        "University of Freiburg",
-        "University of Goettingen",
-        "University of Leeds",
-        "University of Liverpool",
-        "University of Massachusetts Amherst",
-        "University of Massachusetts Medical School - Worcester",
-        "University of Montreal",
-        "University of Nottingham",
-        "University of Sao Paulo",
-        "University of Southampton",
-        "University of Sydney",
-        "University of Virginia",
-        "University of Wageningen",
-        "University Paris Diderot - Paris 7",
-        "Weizmann Institute of Science",
-        "Erasmus University",
-        "Fudan University",
-        "George Mason University",
-        "Icahn School of Medicine at Mount Sinai",
-        "Iowa State University",
-        "King Abdulaziz University",
-        "King Saud University",
-        "Kyushu University",
-        "Nanyang Technological University",
-        "North Carolina State University - Raleigh",
-        "Oregon Health and Science University",
-        "Oregon State University",
-        "Tel Aviv University",
-        "The Chinese University of Hong Kong",
-        "The University of Adelaide",
-        "The University of Calgary",
-        "The University of Georgia",
-        "The University of Hong Kong",
-        "Tokyo Institute of Technology",
-        "Trinity College Dublin",
-        "University of Barcelona",
-        "University of Bern",
-        "University of Bologna",
-        "University of Buenos Aires",
-        "University of Delaware",
-        "University of East Anglia",
-        "University of Gothenburg",
-        "University of Hamburg",
-        "University of Hawaii at Manoa",
-        "University of Illinois at Chicago",
-        "University of Iowa",
-        "University of Kiel",
-        "University of Koeln",
-        "University of Lausanne",
-        "University of Miami",
-        "University of Milan",
-        "University of Muenster",
-        "University of Padua",
-        "University of Paris Descartes (Paris 5)",
-        "University of Pisa",
-        "University of Roma - La Sapienza",
-        "University of Science and Technology of China",
-        "University of Sussex",
-        "University of Tuebingen",
-        "University of Turin",
-        "University of Vienna",
-        "University of Warwick",
-        "University of Wuerzburg",
-        "Virginia Commonwealth University",
-        "Zhejiang University",
-        "Autonomous University of Barcelona",
-        "Autonomous University of Madrid",
-        "Beijing Normal University",
-        "Charles University in Prague",
-        "City University of Hong Kong",
-        "Claude Bernard University Lyon 1",
-        "Colorado State University",
-        "Dalhousie University",
-        "Dartmouth College",
-        "Delft University of Technology",
-        "Durham University",
-        "Ecole Normale Superieure - Lyon",
-        "Florida State University",
-        "Harbin Institute of Technology",
-        "Huazhong University of Science and Technology",
-        "Karlsruhe Institute of Technology (KIT)",
-        "Kobe University",
-        "Korea Advanced Institute of Science and Technology",
-        "Korea University",
-        "Laval University",
-        "Louisiana State University - Baton Rouge",
-        "Maastricht University",
-        "Macquarie University",
-        "Medical University of Vienna",
-        "Nanjing University",
-        "National Autonomous University of Mexico",
-        "National Cheng Kung University",
-        "National Tsing Hua University",
-        "Newcastle University",
-        "Northeastern University",
-        "Norwegian University of Science and Technology - NTNU",
-        "Paul Sabatier University (Toulouse 3)",
-        "Polytechnic Institute of Milan",
-        "Queen Mary, University of London",
-        "Queen's University",
-        "Rensselaer Polytechnic Institute",
-        "Royal Institute of Technology",
-        "RWTH Aachen University",
-        "Simon Fraser University",
-        "State University of New York at Buffalo",
-        "Stony Brook University",
-        "Sun Yat-sen University",
-        "Sungkyunkwan University",
-        "Swedish University of Agricultural Sciences",
-        "The George Washington University",
-        "The Hong Kong University of Science and Technology",
-        "The University of Alabama at Birmingham",
-        "The University of Auckland",
-        "The University of Dundee",
-        "The University of New Mexico - Albuquerque",
-        "The University of Texas Health Science Center at Houston",
-        "TU Dresden",
-        "Umea University",
-        "University College Dublin",
-        "University of Aberdeen",
-        "University of Bergen",
-        "University of Bochum",
-        "University of Bordeaux",
-        "University of Cape Town",
-        "University of Cincinnati",
-        "University of Erlangen-Nuremberg",
-        "University of Exeter",
-        "University of Florence",
-        "University of Guelph",
-        "University of Houston",
-        "University of Innsbruck",
-        "University of Kansas",
-        "University of Kentucky",
-        "University of Leicester",
-        "University of Leipzig",
-        "University of Liege",
-        "University of Lisbon",
-        "University of Lorraine",
-        "University of Mainz",
-        "University of Marburg",
-        "University of Maryland, Baltimore",
-        "University of Missouri - Columbia",
-        "University of Montpellier 2",
-        "University of Nebraska - Lincoln",
-        "University of Notre Dame",
-        "University of Oregon",
-        "University of Otago",
-        "University of Ottawa",
-        "University of South Carolina - Columbia",
-        "University of South Florida",
-        "University of St Andrews",
-        "University of Stuttgart",
-        "University of Tennessee - Knoxville",
-        "University of the Witwatersrand",
-        "University of Tsukuba",
-        "University of Valencia",
-        "University of Victoria",
-        "University of Waterloo",
-        "University of York",
-        "Virginia Polytechnic Institute and State University",
-        "Washington State University",
-        "Western University (The University of Western Ontario)",
-        "Xian Jiao Tong University",
-        "Yeshiva University",
-        "Yonsei University",
-        "Beihang University",
-        "Brandeis University",
-        "Brigham Young University",
-        "Central South University",
-        "Chalmers University of Technology",
-        "Chiba University",
-        "China Agricultural University",
-        "City University of New York City College",
-        "Complutense University of Madrid",
-        "Curtin University",
-        "Dalian University of Technology",
-        "Drexel University",
-        "Ecole Polytechnique",
-        "Eindhoven University of Technology",
-        "Eotvos Lorand University",
-        "ESPCI ParisTech",
-        "Federal University of Minas Gerais",
-        "Federal University of Rio de Janeiro",
-        "Flinders University",
-        "Georgetown University",
-        "Griffith University",
-        "Hannover Medical School",
-        "Hanyang University",
-        "Hiroshima University",
-        "Indian Institute of Science",
-        "Indiana University-Purdue University at Indianapolis",
-        "Jagiellonian University",
-        "James Cook University",
-        "Jilin University",
-        "Keio University",
-        "Kyung Hee University",
-        "Lancaster University",
-        "Lanzhou University",
-        "Linkoping University",
-        "London School of Hygiene & Tropical Medicine",
-        "Nankai University",
-        "National and Kapodistrian University of Athens",
-        "National Chiao Tung University",
-        "Pohang University of Science and Technology",
-        "Polytechnic University of Valencia",
-        "Queen's University Belfast",
-        "Saint Petersburg State University",
-        "San Diego State University",
-        "Scuola Normale Superiore - Pisa",
-        "Shandong University",
-        "Sichuan University",
-        "South China University of Technology",
-        "Southeast University",
-        "SUNY at Albany",
-        "Swinburne University of Technology",
-        "Technical University of Berlin",
-        "Temple University",
-        "The Hong Kong Polytechnic University",
-        "The University of Montana - Missoula",
-        "The University of Reading",
-        "The University of Texas at Dallas",
-        "The University of Texas Health Science Center at San Antonio",
-        "Thomas Jefferson University",
-        "Tokyo Medical and Dental University",
-        "Tongji University",
-        "Tulane University",
-        "UNESP",
-        "University of Antwerp",
-        "University of Belgrade",
-        "University of Campinas",
-        "University of Central Florida",
-        "University of Colorado at Denver",
-        "University of Connecticut",
-        "University of Duesseldorf",
-        "University of Duisburg-Essen",
-        "University of Giessen",
-        "University of Granada",
-        "University of Halle-Wittenberg",
-        "University of Konstanz",
-        "University of Malaya",
-        "University of Manitoba",
-        "University of Milan - Bicocca",
-        "University of Naples Federico II",
-        "University of Newcastle",
-        "University of Oulu",
-        "University of Paris Dauphine (Paris 9)",
-        "University of Pompeu Fabra",
-        "University of Porto",
-        "University of Rhode Island",
-        "University of Roma - Tor Vergata",
-        "University of Saskatchewan",
-        "University of Southern Denmark",
-        "University of Tasmania",
-        "University of Technology, Sydney",
-        "University of Tehran",
-        "University of Turku",
-        "University of Twente",
-        "University of Ulm",
-        "University of Vermont",
-        "University of Warsaw",
-        "University of Wollongong",
-        "Vrije University Brussel",
-        "Wake Forest University",
-        "Wayne State University",
-        "Xiamen University",
-        "Aalborg University",
-        "Aalto University",
-        "Aristotle University of Thessaloniki",
-        "Auburn University",
-        "Bar-Ilan University",
-        "Ben-Gurion University of the Negev",
-        "Bielefeld University",
-        "Boston College",
-        "Brunel University",
-        "Cairo University",
-        "Capital University of Medical Sciences",
-        "Carleton University",
-        "Catholic University of Chile",
-        "Catholic University of Korea",
-        "Catholic University of the Sacred Heart",
-        "Chang Gung University",
-        "Clemson University",
-        "Deakin University",
-        "East China University of Science and Technology",
-        "Ewha Womans University",
-        "Federal University of Rio Grande do Sul",
-        "Istanbul University",
-        "Kanazawa University",
-        "Kansas State University",
-        "Kent State University",
-        "King Abdullah University of Science and Technology",
-        "King Fahd University of Petroleum & Minerals",
-        "Medical University of Graz",
-        "Medical University of South Carolina",
-        "MINES ParisTech",
-        "Nanjing Medical University",
-        "National Sun Yat-Sen University",
-        "National Yang Ming University",
-        "Okayama University",
-        "Oklahoma State University",
-        "Osaka City University",
-        "Peking Union Medical College",
-        "Polytechnic University of Catalonia",
-        "Rush University",
-        "Saint Louis University",
-        "Soochow University",
-        "State University of New York Health Science Center at Brooklyn",
-        "Stellenbosch University",
-        "Stockholm School of Economics",
-        "Syracuse University",
-        "Technical University Darmstadt",
-        "Technical University of Braunschweig",
-        "The Open University",
-        "The University of Texas Medical Branch at Galveston",
-        "Tianjin University",
-        "Tilburg University",
-        "Tokyo University of Science",
-        "University College Cork",
-        "University of Alaska - Fairbanks",
-        "University of Arkansas at Fayetteville",
-        "University of Arkansas at Little Rock",
-        "University of Auvergne",
-        "University of Bath",
-        "University of Bayreuth",
-        "University of Bremen",
-        "University of Cagliari",
-        "University of Canterbury",
-        "University of Chile",
-        "University of Coimbra",
-        "University of Eastern Finland",
-        "University of Essex",
-        "University of Ferrara",
-        "University of Genova",
-        "University of Graz",
-        "University of Hannover",
-        "University of Jena",
-        "University of KwaZulu-Natal",
-        "University of Ljubljana",
-        "University of Maryland, Baltimore County",
-        "University of New Hampshire - Durham",
-        "University of Nice Sophia Antipolis",
-        "University of Oklahoma - Norman",
-        "University of Palermo",
-        "University of Parma",
-        "University of Pavia",
-        "University of Perugia",
-        "University of Quebec",
-        "University of Regensburg",
-        "University of Rennes 1",
-        "University of Rostock",
-        "University of Santiago Compostela",
-        "University of Science, Malaysia",
-        "University of Surrey",
-        "University of Szeged",
-        "University of Tennessee Health Science Center",
-        "University of the Basque Country",
-        "University of Trieste",
-        "University of Wyoming",
-        "University of Zaragoza",
-        "Utah State University",
-        "Victoria University of Wellington",
-        "Vienna University of Technology",
-        "Waseda University",
-        "Wuhan University",
-        "York University",
+def concat_batches(batches):
+    """
+    Concatenate StudentBatch objects into a single StudentBatch
+    """
+    if len(batches) == 1:
+        return batches[0]
+    columns = {}
+    for name in batches[0].__dict__:
+        if name == 'hobby_offsets':
+            continue
+        parts = [getattr(b, name) for b in batches]
+        if isinstance(parts[0], list):
+            columns[name] = [v for part in parts for v in part]
+        else:
+            columns[name] = numpy.concatenate(parts)
+    offsets = [batches[0].hobby_offsets]
+    for b in batches[1:]:
+        offsets.append(b.hobby_offsets[1:] + offsets[-1][-1])
+    columns['hobby_offsets'] = numpy.concatenate(offsets)
+    return StudentBatch(**columns)
+
+
+def random_indices(size, n):
+    """
+    Draw `n` indices below `size` uniformly with the random state of the
+    generator
+    """
+    return _rng.integers(0, size, n).tolist()
+
+
+def random_idnos(n):
+    return _format_uuids(_rng.integers(0, 256, (n, 16), dtype=numpy.uint8))
+
+
+def mix64(x):
+    """
+    Return the splitmix64 finalizer of `x`, an array of uint64: a
+    bijection scrambling its bits, used to derive values from indices
+    """
+    x = x + numpy.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> numpy.uint64(30))) * numpy.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> numpy.uint64(27))) * numpy.uint64(0x94D049BB133111EB)
+    return x ^ (x >> numpy.uint64(31))
+
+
+def index_idnos(seed, indices):
+    """
+    Derive the idno of the students numbered `indices` in the dataset
+    generated from `seed`, without generating them
+    """
+    key = mix64(numpy.array([seed % 2 ** 64], dtype=numpy.uint64))
+    indices = numpy.asarray(indices, dtype=numpy.uint64) * numpy.uint64(2)
+    raw = numpy.empty((len(indices), 2), dtype=numpy.uint64)
+    raw[:, 0] = mix64(key + indices)
+    raw[:, 1] = mix64(key + indices + numpy.uint64(1))
+    return _format_uuids(raw.view(numpy.uint8).reshape(len(indices), 16))
+
+
+def _format_uuids(raw):
+    n = len(raw)
+    # set the version 4 and variant bits, like uuid4() does
+    raw[:, 6] = raw[:, 6] & 0x0f | 0x40
+    raw[:, 8] = raw[:, 8] & 0x3f | 0x80
+    digits = raw.tobytes().hex()
+    return ['{}-{}-{}-{}-{}'.format(
+        digits[i:i + 8], digits[i + 8:i + 12], digits[i + 12:i + 16],
+        digits[i + 16:i + 20], digits[i + 20:i + 32])
+        for i in range(0, 32 * n, 32)]
+
+
+def batch_text_columns(batch):
+    """
+    Convert the non-text columns of a StudentBatch into lists of
+    strings, the way they appear in the row form of a student
+    """
+    return {
+        'university': CATALOGS['university'].take(batch.university),
+        'faculty': CATALOGS['faculty'].take(batch.faculty),
+        'date_of_birth': batch.date_of_birth.astype(str).tolist(),
+        'date_enrolled': batch.date_enrolled.astype(str).tolist(),
+        'year_enrolled': (batch.date_enrolled.astype('datetime64[Y]')
+                          .astype(int) + 1970).astype(str).tolist(),
+        'year_graduated': batch.year_graduated.astype(str).tolist(),
+        'hobby': CATALOGS['hobby'].take(batch.hobby),
+    }
+
+
+def student_characteristics(country, city, university, faculty, street,
+                            date_of_birth, year_enrolled, year_graduated,
+                            hobbies):
+    """
+    Return the (type, value) characteristics of a student,
+    `year_graduated` is None when the student did not graduate yet
+    """
+    characteristics = [
+        ('country', country),
+        ('city', city),
+        ('university', university),
+        ('faculty', faculty),
+        ('street', street),
+        ('date_of_birth', date_of_birth),
+        ('year_enrolled', year_enrolled),
     ]
-    return random.choice(universities)
+    if year_graduated is not None:
+        characteristics.append(('year_graduated', year_graduated))
+    for hobby in hobbies:
+        characteristics.append(('hobby', hobby))
+    return characteristics
+
+
+def _batch_characteristics(batch, text, i):
+    return student_characteristics(
+        batch.country[i], batch.city[i],
+        text['university'][i], text['faculty'][i], batch.street[i],
+        text['date_of_birth'][i], text['year_enrolled'][i],
+        text['year_graduated'][i] if batch.year_graduated[i] else None,
+        text['hobby'][batch.hobby_offsets[i]:batch.hobby_offsets[i + 1]])
+
+
+def iter_students(batch):
+    """
+    Iterate over a StudentBatch in row form,
+    each student is a dict like the ones made by `generate_student`
+    """
+    text = batch_text_columns(batch)
+    for i in range(len(batch)):
+        yield {
+            'idno': batch.idno[i],
+            'name': batch.name[i],
+            'description': batch.description[i],
+            'phone': batch.phone[i],
+            'country': batch.country[i],
+            'city': batch.city[i],
+            'address': batch.address[i],
+            'university': text['university'][i],
+            'faculty': text['faculty'][i],
+            'date_of_birth': text['date_of_birth'][i],
+            'date_enrolled': text['date_enrolled'][i],
+            'characteristics': [
+                {'type': key, 'value': value}
+                for key, value in _batch_characteristics(batch, text, i)],
+        }
+
+
+def get_batch_as_csv_rows(batch):
+    text = batch_text_columns(batch)
+    return list(zip(batch.idno,
+                    batch.name,
+                    batch.description,
+                    batch.phone,
+                    batch.country,
+                    batch.city,
+                    batch.address,
+                    text['university'],
+                    text['faculty'],
+                    text['date_of_birth'],
+                    text['date_enrolled'],))
+
+
+def get_batch_characteristic_rows(batch):
+    text = batch_text_columns(batch)
+    result = []
+    for i in range(len(batch)):
+        for key, value in _batch_characteristics(batch, text, i):
+            result.append((batch.idno[i], key, value))
+    return result
+
+
+def random_university():
+    # Randomly return one university name from the university catalog
+    return CATALOGS['university'].choice()
 
 
 def random_faculty():
-    # Randomly return one faculty name from the following list
-    faculties = [
-        "Accountancy",
-        "Allied Health and Communicative Disorders",
-        "Anthropology",
-        "Art and Design",
-        "Biological Sciences ",
-        "Chemistry and Biochemistry",
-        "Communication",
-        "Computer Science",
-        "Counseling, Adult and Higher Education",
-        "Economics",
-        "Educational Technology, Research and Assessment",
-        "Electrical Engineering",
-        "English",
-        "Environmental Studies",
-        "Family, Consumer and Nutrition Sciences",
-        "Finance",
-        "Foreign Languages and Literatures",
-        "Geography",
-        "Geology and Environmental Geosciences",
-        "History",
-        "Industrial and Systems Engineering",
-        "Kinesiology and Physical Education",
-        "Leadership, Educational Psychology and Foundations",
-        "Literacy and Elementary Education",
-        "Management",
-        "Marketing",
-        "Mathematical Sciences",
-        "Mechanical Engineering",
-        "Military Science",
-        "Music",
-        "Non-Governmental Organization Leadership & Development",
-        "Nursing and Health Studies",
-        "Operations Management and Information Systems",
-        "Philosophy",
-        "Physics",
-        "Political Science",
-        "Psychology",
-        "Public and Global Affairs",
-        "Public Administration",
-        "Sociology",
-        "Special and Early Education",
-        "Statistics",
-        "Technology",
-        "Theatre and Dance",
-    ]
-    return random.choice(faculties)
+    # Randomly return one faculty name from the faculty catalog
+    return CATALOGS['faculty'].choice()
 
 
 def random_hobby():
-    # Randomly return one hobby name from the following list
-    hobbies = [
-        "3D printing",
-        "Amateur radio",
-        "Acting",
-        "Baton twirling",
-        "Board games",
-        "Book restoration",
-        "Cabaret",
-        "Calligraphy",
-        "Candle making",
-        "Computer programming",
-        "Coffee roasting",
-        "Cooking",
-        "Coloring",
-        "Cosplaying",
-        "Couponing",
-        "Creative writing",
-        "Crocheting",
-        "Crossword puzzles",
-        "Cryptography",
-        "Dance",
-        "Digital arts",
-        "Drama",
-        "Drawing",
-        "Do it yourself",
-        "Electronics",
-        "Embroidery",
-        "Fashion",
-        "Flower arranging",
-        "Foreign language learning",
-        "Gaming (tabletop games and role-playing games)",
-        "Gambling",
-        "Genealogy",
-        "Glassblowing",
-        "Gunsmithing",
-        "Homebrewing",
-        "Ice skating",
-        "Jewelry making",
-        "Jigsaw puzzles",
-        "Juggling",
-        "Knapping",
-        "Knitting",
-        "Kabaddi",
-        "Knife making",
-        "Kombucha Brewing",
-        "Lacemaking",
-        "Lapidary",
-        "Lego building",
-        "Lockpicking",
-        "Lucid dreaming",
-        "Machining",
-        "Macrame",
-        "Metalworking",
-        "Magic",
-        "Model building",
-        "Listening to music",
-        "Origami",
-        "Painting",
-        "Playing musical instruments",
-        "Pet",
-        "Poi",
-        "Pottery",
-        "Puzzles",
-        "Quilting",
-        "Reading",
-        "Scrapbooking",
-        "Sculpting",
-        "Sewing",
-        "Singing",
-        "Sketching",
-        "Soapmaking",
-        "Stand-up comedy",
-        "Table tennis",
-        "Video gaming",
-        "Watching movies",
-        "Web surfing",
-        "Whittling",
-        "Wood carving",
-        "Woodworking",
-        "Worldbuilding",
-        "Writing",
-        "Yoga",
-        "Yo-yoing",
-        "Air sports",
-        "Archery",
-        "Astronomy",
-        "Backpacking",
-        "BASE jumping",
-        "Baseball",
-        "Basketball",
-        "Beekeeping",
-        "Bird watching",
-        "Blacksmithing",
-        "Board sports",
-        "Bodybuilding",
-        "Brazilian jiu-jitsu",
-        "Community",
-        "Cycling",
-        "Camping",
-        "Dowsing",
-        "Driving",
-        "Fishing ",
-        "Flag Football",
-        "Flying",
-        "Flying disc",
-        "Foraging",
-        "Gardening",
-        "Geocaching",
-        "Ghost hunting",
-        "Graffiti",
-        "Handball",
-        "Hiking",
-        "Hooping",
-        "Horseback riding",
-        "Hunting",
-        "Inline skating",
-        "Jogging",
-        "Kayaking",
-        "Kite flying",
-        "Kitesurfing",
-        "LARPing",
-        "Letterboxing",
-        "Metal detecting",
-        "Motor sports",
-        "Mountain biking",
-        "Mountaineering",
-        "Mushroom hunting/Mycology",
-        "Netball",
-        "Nordic skating",
-        "Orienteering",
-        "Paintball",
-        "Parkour",
-        "Photography",
-        "Polo",
-        "Rafting",
-        "Rappelling",
-        "Rock climbing",
-        "Roller skating",
-        "Rugby",
-        "Running",
-        "Sailing",
-        "Sand art",
-        "Scouting",
-        "Scuba diving",
-        "Sculling or Rowing",
-        "Topiary",
-        "Shooting",
-        "Shopping",
-        "Skateboarding",
-        "Skiing",
-        "Skimboarding",
-        "Skydiving",
-        "Slacklining",
-        "Snowboarding",
-        "Stone skipping",
-        "Surfing",
-        "Swimming",
-        "Taekwondo",
-        "Tai chi",
-        "Urban exploration",
-        "Vacation",
-        "Vehicle restoration",
-        "Walking",
-        "Water sports",
-    ]
-    return random.choice(hobbies)
+    # Randomly return one hobby name from the hobby catalog
+    return CATALOGS['hobby'].choice()
+
+
+UNIVERSITIES = (
+    "Harvard University",
+    "Stanford University",
+    "Massachusetts Institute of Technology (MIT)",
+    "University of California-Berkeley",
+    "University of Cambridge",
+    "Princeton University",
+    "California Institute of Technology",
+    "Columbia University",
+    "University of Chicago",
+    "University of Oxford",
+    "Yale University",
+    "University of California, Los Angeles",
+    "Cornell University",
+    "University of California, San Diego",
+    "University of Washington",
+    "University of Pennsylvania",
+    "The Johns Hopkins University",
+    "University of California, San Francisco",
+    "Swiss Federal Institute of Technology Zurich",
+    "University College London",
+    "The University of Tokyo",
+    "The Imperial College of Science, Technology and Medicine",
+    "University of Michigan-Ann Arbor",
+    "University of Toronto",
+    "University of Wisconsin - Madison",
+    "Kyoto University",
+    "New York University",
+    "Northwestern University",
+    "University of Illinois at Urbana-Champaign",
+    "University of Minnesota, Twin Cities",
+    "Duke University",
+    "Washington University in St. Louis",
+    "Rockefeller University",
+    "University of Colorado at Boulder",
+    "Pierre and Marie Curie University - Paris 6",
+    "University of North Carolina at Chapel Hill",
+    "University of British Columbia",
+    "The University of Manchester",
+    "The University of Texas at Austin",
+    "University of Copenhagen",
+    "University of California, Santa Barbara",
+    "University of Paris Sud (Paris 11)",
+    "University of Maryland, College Park",
+    "The University of Melbourne",
+    "The University of Edinburgh",
+    "The University of Texas Southwestern Medical Center at Dallas",
+    "Karolinska Institute",
+    "University of California, Irvine",
+    "Heidelberg University",
+    "University of Munich",
+    "University of Southern California",
+    "Rutgers, The State University of New Jersey - New Brunswick",
+    "Technical University Munich",
+    "Vanderbilt University",
+    "University of California, Davis",
+    "University of Zurich",
+    "Utrecht University",
+    "Pennsylvania State University - University Park",
+    "King's College London",
+    "Purdue University - West Lafayette",
+    "Uppsala University",
+    "Carnegie Mellon University",
+    "University of Bristol",
+    "The Ohio State University - Columbus",
+    "University of Pittsburgh-Pittsburgh Campus",
+    "University of Geneva",
+    "Ecole Normale Superieure - Paris",
+    "McGill University",
+    "University of Oslo",
+    "Ghent University",
+    "The Hebrew University of Jerusalem",
+    "Boston University",
+    "University of Helsinki",
+    "Aarhus University",
+    "Brown University",
+    "The Australian National University",
+    "Leiden University",
+    "Osaka University",
+    "Stockholm University",
+    "Technion-Israel Institute of Technology",
+    "University of Florida",
+    "Rice University",
+    "University of Groningen",
+    "Moscow State University",
+    "The University of Queensland",
+    "University of Arizona",
+    "University of Utah",
+    "Arizona State University",
+    "The University of Western Australia",
+    "McMaster University",
+    "University of Basel",
+    "University of Rochester",
+    "University of California, Santa Cruz",
+    "University of Bonn",
+    "University of Strasbourg",
+    "KU Leuven",
+    "Swiss Federal Institute of Technology Lausanne",
+    "Texas A & M University",
+    "Georgia Institute of Technology",
+    "VU University Amsterdam",
+    "Aix Marseille University",
+    "Baylor College of Medicine",
+    "Cardiff University",
+    "Case Western Reserve University",
+    "Catholic University of Louvain",
+    "Emory University",
+    "Hokkaido University",
+    "Indiana University Bloomington",
+    "Joseph Fourier University (Grenoble 1)",
+    "London School of Economics and Political Science",
+    "Lund University",
+    "Mayo Medical School",
+    "Michigan State University",
+    "Monash University",
+    "Nagoya University",
+    "National Taiwan University",
+    "National University of Singapore",
+    "Peking University",
+    "Radboud University Nijmegen",
+    "Seoul National University",
+    "Shanghai Jiao Tong University",
+    "Technical University of Denmark",
+    "The University of Glasgow",
+    "The University of New South Wales",
+    "The University of Sheffield",
+    "The University of Texas M. D. Anderson Cancer Center",
+    "Tohoku University",
+    "Tsinghua University",
+    "Tufts University",
+    "University Libre Bruxelles",
+    "University of Alberta",
+    "University of Amsterdam",
+    "University of Birmingham",
+    "University of California, Riverside",
+    "University of Frankfurt",
+    "University of Freiburg",
+    "University of Goettingen",
+    "University of Leeds",
+    "University of Liverpool",
+    "University of Massachusetts Amherst",
+    "University of Massachusetts Medical School - Worcester",
+    "University of Montreal",
+    "University of Nottingham",
+    "University of Sao Paulo",
+    "University of Southampton",
+    "University of Sydney",
+    "University of Virginia",
+    "University of Wageningen",
+    "University Paris Diderot - Paris 7",
+    "Weizmann Institute of Science",
+    "Erasmus University",
+    "Fudan University",
+    "George Mason University",
+    "Icahn School of Medicine at Mount Sinai",
+    "Iowa State University",
+    "King Abdulaziz University",
+    "King Saud University",
+    "Kyushu University",
+    "Nanyang Technological University",
+    "North Carolina State University - Raleigh",
+    "Oregon Health and Science University",
+    "Oregon State University",
+    "Tel Aviv University",
+    "The Chinese University of Hong Kong",
+    "The University of Adelaide",
+    "The University of Calgary",
+    "The University of Georgia",
+    "The University of Hong Kong",
+    "Tokyo Institute of Technology",
+    "Trinity College Dublin",
+    "University of Barcelona",
+    "University of Bern",
+    "University of Bologna",
+    "University of Buenos Aires",
+    "University of Delaware",
+    "University of East Anglia",
+    "University of Gothenburg",
+    "University of Hamburg",
+    "University of Hawaii at Manoa",
+    "University of Illinois at Chicago",
+    "University of Iowa",
+    "University of Kiel",
+    "University of Koeln",
+    "University of Lausanne",
+    "University of Miami",
+    "University of Milan",
+    "University of Muenster",
+    "University of Padua",
+    "University of Paris Descartes (Paris 5)",
+    "University of Pisa",
+    "University of Roma - La Sapienza",
+    "University of Science and Technology of China",
+    "University of Sussex",
+    "University of Tuebingen",
+    "University of Turin",
+    "University of Vienna",
+    "University of Warwick",
+    "University of Wuerzburg",
+    "Virginia Commonwealth University",
+    "Zhejiang University",
+    "Autonomous University of Barcelona",
+    "Autonomous University of Madrid",
+    "Beijing Normal University",
+    "Charles University in Prague",
+    "City University of Hong Kong",
+    "Claude Bernard University Lyon 1",
+    "Colorado State University",
+    "Dalhousie University",
+    "Dartmouth College",
+    "Delft University of Technology",
+    "Durham University",
+    "Ecole Normale Superieure - Lyon",
+    "Florida State University",
+    "Harbin Institute of Technology",
+    "Huazhong University of Science and Technology",
+    "Karlsruhe Institute of Technology (KIT)",
+    "Kobe University",
+    "Korea Advanced Institute of Science and Technology",
+    "Korea University",
+    "Laval University",
+    "Louisiana State University - Baton Rouge",
+    "Maastricht University",
+    "Macquarie University",
+    "Medical University of Vienna",
+    "Nanjing University",
+    "National Autonomous University of Mexico",
+    "National Cheng Kung University",
+    "National Tsing Hua University",
+    "Newcastle University",
+    "Northeastern University",
+    "Norwegian University of Science and Technology - NTNU",
+    "Paul Sabatier University (Toulouse 3)",
+    "Polytechnic Institute of Milan",
+    "Queen Mary, University of London",
+    "Queen's University",
+    "Rensselaer Polytechnic Institute",
+    "Royal Institute of Technology",
+    "RWTH Aachen University",
+    "Simon Fraser University",
+    "State University of New York at Buffalo",
+    "Stony Brook University",
+    "Sun Yat-sen University",
+    "Sungkyunkwan University",
+    "Swedish University of Agricultural Sciences",
+    "The George Washington University",
+    "The Hong Kong University of Science and Technology",
+    "The University of Alabama at Birmingham",
+    "The University of Auckland",
+    "The University of Dundee",
+    "The University of New Mexico - Albuquerque",
+    "The University of Texas Health Science Center at Houston",
+    "TU Dresden",
+    "Umea University",
+    "University College Dublin",
+    "University of Aberdeen",
+    "University of Bergen",
+    "University of Bochum",
+    "University of Bordeaux",
+    "University of Cape Town",
+    "University of Cincinnati",
+    "University of Erlangen-Nuremberg",
+    "University of Exeter",
+    "University of Florence",
+    "University of Guelph",
+    "University of Houston",
+    "University of Innsbruck",
+    "University of Kansas",
+    "University of Kentucky",
+    "University of Leicester",
+    "University of Leipzig",
+    "University of Liege",
+    "University of Lisbon",
+    "University of Lorraine",
+    "University of Mainz",
+    "University of Marburg",
+    "University of Maryland, Baltimore",
+    "University of Missouri - Columbia",
+    "University of Montpellier 2",
+    "University of Nebraska - Lincoln",
+    "University of Notre Dame",
+    "University of Oregon",
+    "University of Otago",
+    "University of Ottawa",
+    "University of South Carolina - Columbia",
+    "University of South Florida",
+    "University of St Andrews",
+    "University of Stuttgart",
+    "University of Tennessee - Knoxville",
+    "University of the Witwatersrand",
+    "University of Tsukuba",
+    "University of Valencia",
+    "University of Victoria",
+    "University of Waterloo",
+    "University of York",
+    "Virginia Polytechnic Institute and State University",
+    "Washington State University",
+    "Western University (The University of Western Ontario)",
+    "Xian Jiao Tong University",
+    "Yeshiva University",
+    "Yonsei University",
+    "Beihang University",
+    "Brandeis University",
+    "Brigham Young University",
+    "Central South University",
+    "Chalmers University of Technology",
+    "Chiba University",
+    "China Agricultural University",
+    "City University of New York City College",
+    "Complutense University of Madrid",
+    "Curtin University",
+    "Dalian University of Technology",
+    "Drexel University",
+    "Ecole Polytechnique",
+    "Eindhoven University of Technology",
+    "Eotvos Lorand University",
+    "ESPCI ParisTech",
+    "Federal University of Minas Gerais",
+    "Federal University of Rio de Janeiro",
+    "Flinders University",
+    "Georgetown University",
+    "Griffith University",
+    "Hannover Medical School",
+    "Hanyang University",
+    "Hiroshima University",
+    "Indian Institute of Science",
+    "Indiana University-Purdue University at Indianapolis",
+    "Jagiellonian University",
+    "James Cook University",
+    "Jilin University",
+    "Keio University",
+    "Kyung Hee University",
+    "Lancaster University",
+    "Lanzhou University",
+    "Linkoping University",
+    "London School of Hygiene & Tropical Medicine",
+    "Nankai University",
+    "National and Kapodistrian University of Athens",
+    "National Chiao Tung University",
+    "Pohang University of Science and Technology",
+    "Polytechnic University of Valencia",
+    "Queen's University Belfast",
+    "Saint Petersburg State University",
+    "San Diego State University",
+    "Scuola Normale Superiore - Pisa",
+    "Shandong University",
+    "Sichuan University",
+    "South China University of Technology",
+    "Southeast University",
+    "SUNY at Albany",
+    "Swinburne University of Technology",
+    "Technical University of Berlin",
+    "Temple University",
+    "The Hong Kong Polytechnic University",
+    "The University of Montana - Missoula",
+    "The University of Reading",
+    "The University of Texas at Dallas",
+    "The University of Texas Health Science Center at San Antonio",
+    "Thomas Jefferson University",
+    "Tokyo Medical and Dental University",
+    "Tongji University",
+    "Tulane University",
+    "UNESP",
+    "University of Antwerp",
+    "University of Belgrade",
+    "University of Campinas",
+    "University of Central Florida",
+    "University of Colorado at Denver",
+    "University of Connecticut",
+    "University of Duesseldorf",
+    "University of Duisburg-Essen",
+    "University of Giessen",
+    "University of Granada",
+    "University of Halle-Wittenberg",
+    "University of Konstanz",
+    "University of Malaya",
+    "University of Manitoba",
+    "University of Milan - Bicocca",
+    "University of Naples Federico II",
+    "University of Newcastle",
+    "University of Oulu",
+    "University of Paris Dauphine (Paris 9)",
+    "University of Pompeu Fabra",
+    "University of Porto",
+    "University of Rhode Island",
+    "University of Roma - Tor Vergata",
+    "University of Saskatchewan",
+    "University of Southern Denmark",
+    "University of Tasmania",
+    "University of Technology, Sydney",
+    "University of Tehran",
+    "University of Turku",
+    "University of Twente",
+    "University of Ulm",
+    "University of Vermont",
+    "University of Warsaw",
+    "University of Wollongong",
+    "Vrije University Brussel",
+    "Wake Forest University",
+    "Wayne State University",
+    "Xiamen University",
+    "Aalborg University",
+    "Aalto University",
+    "Aristotle University of Thessaloniki",
+    "Auburn University",
+    "Bar-Ilan University",
+    "Ben-Gurion University of the Negev",
+    "Bielefeld University",
+    "Boston College",
+    "Brunel University",
+    "Cairo University",
+    "Capital University of Medical Sciences",
+    "Carleton University",
+    "Catholic University of Chile",
+    "Catholic University of Korea",
+    "Catholic University of the Sacred Heart",
+    "Chang Gung University",
+    "Clemson University",
+    "Deakin University",
+    "East China University of Science and Technology",
+    "Ewha Womans University",
+    "Federal University of Rio Grande do Sul",
+    "Istanbul University",
+    "Kanazawa University",
+    "Kansas State University",
+    "Kent State University",
+    "King Abdullah University of Science and Technology",
+    "King Fahd University of Petroleum & Minerals",
+    "Medical University of Graz",
+    "Medical University of South Carolina",
+    "MINES ParisTech",
+    "Nanjing Medical University",
+    "National Sun Yat-Sen University",
+    "National Yang Ming University",
+    "Okayama University",
+    "Oklahoma State University",
+    "Osaka City University",
+    "Peking Union Medical College",
+    "Polytechnic University of Catalonia",
+    "Rush University",
+    "Saint Louis University",
+    "Soochow University",
+    "State University of New York Health Science Center at Brooklyn",
+    "Stellenbosch University",
+    "Stockholm School of Economics",
+    "Syracuse University",
+    "Technical University Darmstadt",
+    "Technical University of Braunschweig",
+    "The Open University",
+    "The University of Texas Medical Branch at Galveston",
+    "Tianjin University",
+    "Tilburg University",
+    "Tokyo University of Science",
+    "University College Cork",
+    "University of Alaska - Fairbanks",
+    "University of Arkansas at Fayetteville",
+    "University of Arkansas at Little Rock",
+    "University of Auvergne",
+    "University of Bath",
+    "University of Bayreuth",
+    "University of Bremen",
+    "University of Cagliari",
+    "University of Canterbury",
+    "University of Chile",
+    "University of Coimbra",
+    "University of Eastern Finland",
+    "University of Essex",
+    "University of Ferrara",
+    "University of Genova",
+    "University of Graz",
+    "University of Hannover",
+    "University of Jena",
+    "University of KwaZulu-Natal",
+    "University of Ljubljana",
+    "University of Maryland, Baltimore County",
+    "University of New Hampshire - Durham",
+    "University of Nice Sophia Antipolis",
+    "University of Oklahoma - Norman",
+    "University of Palermo",
+    "University of Parma",
+    "University of Pavia",
+    "University of Perugia",
+    "University of Quebec",
+    "University of Regensburg",
+    "University of Rennes 1",
+    "University of Rostock",
+    "University of Santiago Compostela",
+    "University of Science, Malaysia",
+    "University of Surrey",
+    "University of Szeged",
+    "University of Tennessee Health Science Center",
+    "University of the Basque Country",
+    "University of Trieste",
+    "University of Wyoming",
+    "University of Zaragoza",
+    "Utah State University",
+    "Victoria University of Wellington",
+    "Vienna University of Technology",
+    "Waseda University",
+    "Wuhan University",
+    "York University",
+)
+
+
+FACULTIES = (
+    "Accountancy",
+    "Allied Health and Communicative Disorders",
+    "Anthropology",
+    "Art and Design",
+    "Biological Sciences ",
+    "Chemistry and Biochemistry",
+    "Communication",
+    "Computer Science",
+    "Counseling, Adult and Higher Education",
+    "Economics",
+    "Educational Technology, Research and Assessment",
+    "Electrical Engineering",
+    "English",
+    "Environmental Studies",
+    "Family, Consumer and Nutrition Sciences",
+    "Finance",
+    "Foreign Languages and Literatures",
+    "Geography",
+    "Geology and Environmental Geosciences",
+    "History",
+    "Industrial and Systems Engineering",
+    "Kinesiology and Physical Education",
+    "Leadership, Educational Psychology and Foundations",
+    "Literacy and Elementary Education",
+    "Management",
+    "Marketing",
+    "Mathematical Sciences",
+    "Mechanical Engineering",
+    "Military Science",
+    "Music",
+    "Non-Governmental Organization Leadership & Development",
+    "Nursing and Health Studies",
+    "Operations Management and Information Systems",
+    "Philosophy",
+    "Physics",
+    "Political Science",
+    "Psychology",
+    "Public and Global Affairs",
+    "Public Administration",
+    "Sociology",
+    "Special and Early Education",
+    "Statistics",
+    "Technology",
+    "Theatre and Dance",
+)
+
+
+HOBBIES = (
+    "3D printing",
+    "Amateur radio",
+    "Acting",
+    "Baton twirling",
+    "Board games",
+    "Book restoration",
+    "Cabaret",
+    "Calligraphy",
+    "Candle making",
+    "Computer programming",
+    "Coffee roasting",
+    "Cooking",
+    "Coloring",
+    "Cosplaying",
+    "Couponing",
+    "Creative writing",
+    "Crocheting",
+    "Crossword puzzles",
+    "Cryptography",
+    "Dance",
+    "Digital arts",
+    "Drama",
+    "Drawing",
+    "Do it yourself",
+    "Electronics",
+    "Embroidery",
+    "Fashion",
+    "Flower arranging",
+    "Foreign language learning",
+    "Gaming (tabletop games and role-playing games)",
+    "Gambling",
+    "Genealogy",
+    "Glassblowing",
+    "Gunsmithing",
+    "Homebrewing",
+    "Ice skating",
+    "Jewelry making",
+    "Jigsaw puzzles",
+    "Juggling",
+    "Knapping",
+    "Knitting",
+    "Kabaddi",
+    "Knife making",
+    "Kombucha Brewing",
+    "Lacemaking",
+    "Lapidary",
+    "Lego building",
+    "Lockpicking",
+    "Lucid dreaming",
+    "Machining",
+    "Macrame",
+    "Metalworking",
+    "Magic",
+    "Model building",
+    "Listening to music",
+    "Origami",
+    "Painting",
+    "Playing musical instruments",
+    "Pet",
+    "Poi",
+    "Pottery",
+    "Puzzles",
+    "Quilting",
+    "Reading",
+    "Scrapbooking",
+    "Sculpting",
+    "Sewing",
+    "Singing",
+    "Sketching",
+    "Soapmaking",
+    "Stand-up comedy",
+    "Table tennis",
+    "Video gaming",
+    "Watching movies",
+    "Web surfing",
+    "Whittling",
+    "Wood carving",
+    "Woodworking",
+    "Worldbuilding",
+    "Writing",
+    "Yoga",
+    "Yo-yoing",
+    "Air sports",
+    "Archery",
+    "Astronomy",
+    "Backpacking",
+    "BASE jumping",
+    "Baseball",
+    "Basketball",
+    "Beekeeping",
+    "Bird watching",
+    "Blacksmithing",
+    "Board sports",
+    "Bodybuilding",
+    "Brazilian jiu-jitsu",
+    "Community",
+    "Cycling",
+    "Camping",
+    "Dowsing",
+    "Driving",
+    "Fishing ",
+    "Flag Football",
+    "Flying",
+    "Flying disc",
+    "Foraging",
+    "Gardening",
+    "Geocaching",
+    "Ghost hunting",
+    "Graffiti",
+    "Handball",
+    "Hiking",
+    "Hooping",
+    "Horseback riding",
+    "Hunting",
+    "Inline skating",
+    "Jogging",
+    "Kayaking",
+    "Kite flying",
+    "Kitesurfing",
+    "LARPing",
+    "Letterboxing",
+    "Metal detecting",
+    "Motor sports",
+    "Mountain biking",
+    "Mountaineering",
+    "Mushroom hunting/Mycology",
+    "Netball",
+    "Nordic skating",
+    "Orienteering",
+    "Paintball",
+    "Parkour",
+    "Photography",
+    "Polo",
+    "Rafting",
+    "Rappelling",
+    "Rock climbing",
+    "Roller skating",
+    "Rugby",
+    "Running",
+    "Sailing",
+    "Sand art",
+    "Scouting",
+    "Scuba diving",
+    "Sculling or Rowing",
+    "Topiary",
+    "Shooting",
+    "Shopping",
+    "Skateboarding",
+    "Skiing",
+    "Skimboarding",
+    "Skydiving",
+    "Slacklining",
+    "Snowboarding",
+    "Stone skipping",
+    "Surfing",
+    "Swimming",
+    "Taekwondo",
+    "Tai chi",
+    "Urban exploration",
+    "Vacation",
+    "Vehicle restoration",
+    "Walking",
+    "Water sports",
+)
+
+# built-in values above are the defaults, see catalogs.Catalog.configure
+CATALOGS = {
+    'university': Catalog('university', lambda: UNIVERSITIES),
+    'faculty': Catalog('faculty', lambda: FACULTIES),
+    'hobby': Catalog('hobby', lambda: HOBBIES),
+}
+
+
+def catalog_settings():
+    """
+    Return the configuration of the CATALOGS, as {name: (path, skew)}
+    """
+    return {name: (catalog.path, catalog.skew)
+            for name, catalog in CATALOGS.items()}
+
+
+def configure_catalogs(settings):
+    """
+    Configure the CATALOGS as returned by catalog_settings, catalogs
+    already configured alike keep their loaded values
+    """
+    for name, (path, skew) in settings.items():
+        catalog = CATALOGS[name]
+        if (catalog.path, catalog.skew) != (path, skew):
+            catalog.configure(path, skew)
@@ -0,0 +1,200 @@
+"""
+Student idno schemes.
+
+The idno of a student is derived from the dataset seed and the number of
+the student in the dataset, so that any batch, and the friend edges
+pointing to it, are regenerated with the same idnos. Schemes trade key
+size for index locality, which drive the cost of the Student(idno)
+uniqueness constraint:
+
+* uuid4: random UUID strings (36 characters), the default
+* uuid7: time ordered UUID strings (version 7), the timestamp growing
+  with the student number, so that consecutive students are neighbours
+  in the index
+* int: dense 64-bit integers, the student number plus 1: students of a
+  batch take a range of ids every generator agrees on without
+  coordination, and keys are small and perfectly ordered
+* base62: 11 character strings encoding a 64-bit value derived from the
+  student number, random like uuid4 but a third of its size
+
+Every scheme packs its idnos into 128 bits, the way the id registry
+keeps them. Integer idnos are numbers in JSON and columnar files and
+over Bolt; in CSV files they are text, converted back by `parse` and,
+in LOAD CSV queries, by the expression of `csv_value`.
+"""
+import abc
+
+import numpy
+
+from . import generator
+
+
+class IdScheme(abc.ABC):
+    """
+    Base scheme: string idnos
+    """
+    name = None
+    integer = False
+
+    @abc.abstractmethod
+    def idnos(self, seed, indices):
+        """
+        Return the idnos of the students numbered `indices` in the
+        dataset generated from `seed`
+        """
+
+    @abc.abstractmethod
+    def pack(self, idnos):
+        """
+        Pack idnos into a (n, 2) uint64 array
+        """
+
+    @abc.abstractmethod
+    def unpack(self, packed):
+        """
+        Return the idnos of a (n, 2) uint64 array made by `pack`
+        """
+
+    def parse(self, text):
+        """
+        Return the idno written as `text` in a CSV file
+        """
+        return text
+
+    def csv_value(self, column):
+        """
+        Return the Cypher expression of the idno in `column` of a
+        LOAD CSV line
+        """
+        return 'line.{}'.format(column)
+
+    def __reduce__(self):
+        # schemes are singletons
+        return scheme, (self.name,)
+
+
+BASE62 = numpy.frombuffer(
+    b'0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz',
+    dtype=numpy.uint8)
+# value of every base62 digit, by ASCII code
+_BASE62_VALUES = numpy.zeros(256, dtype=numpy.uint64)
+_BASE62_VALUES[BASE62] = numpy.arange(62, dtype=numpy.uint64)
+
+
+def _key(seed):
+    return generator.mix64(numpy.array([seed % 2 ** 64], dtype=numpy.uint64))
+
+
+class UuidScheme(IdScheme):
+    """
+    Random UUIDs, version 4
+    """
+    name = 'uuid4'
+
+    def idnos(self, seed, indices):
+        return generator.index_idnos(seed, indices)
+
+    def pack(self, idnos):
+        digits = ''.join(idnos).replace('-', '')
+        return numpy.frombuffer(bytes.fromhex(digits), dtype='>u8') \
+            .astype(numpy.uint64).reshape(len(idnos), 2)
+
+    def unpack(self, packed):
+        digits = numpy.asarray(packed).astype('>u8').tobytes().hex()
+        return ['{}-{}-{}-{}-{}'.format(
+            digits[i:i + 8], digits[i + 8:i + 12], digits[i + 12:i + 16],
+            digits[i + 16:i + 20], digits[i + 20:i + 32])
+            for i in range(0, len(digits), 32)]
+
+
+class TimeOrderedUuidScheme(UuidScheme):
+    """
+    UUIDs version 7: a 48-bit millisecond timestamp, EPOCH_MS plus the
+    student number, followed by random bits
+    """
+    name = 'uuid7'
+    # 2020-01-01
+    EPOCH_MS = 1577836800000
+
+    def idnos(self, seed, indices):
+        key = _key(seed)
+        indices = numpy.asarray(indices, dtype=numpy.uint64)
+        random_a = generator.mix64(key + indices * numpy.uint64(2))
+        random_b = generator.mix64(
+            key + indices * numpy.uint64(2) + numpy.uint64(1))
+        packed = numpy.empty((len(indices), 2), dtype=numpy.uint64)
+        packed[:, 0] = (
+            (numpy.uint64(self.EPOCH_MS) + indices) << numpy.uint64(16)
+            | numpy.uint64(0x7000)
+            | random_a >> numpy.uint64(52))
+        packed[:, 1] = (random_b >> numpy.uint64(2)
+                        | numpy.uint64(0x8000000000000000))
+        return self.unpack(packed)
+
+
+class IntegerScheme(IdScheme):
+    """
+    Dense integers, the student number plus 1
+    """
+    name = 'int'
+    integer = True
+
+    def idnos(self, seed, indices):
+        return (numpy.asarray(indices, dtype=numpy.int64) + 1).tolist()
+
+    def pack(self, idnos):
+        packed = numpy.zeros((len(idnos), 2), dtype=numpy.uint64)
+        packed[:, 1] = numpy.asarray(idnos, dtype=numpy.int64)
+        return packed
+
+    def unpack(self, packed):
+        return numpy.asarray(packed)[:, 1].astype(numpy.int64).tolist()
+
+    def parse(self, text):
+        return int(text)
+
+    def csv_value(self, column):
+        return 'toInteger(line.{})'.format(column)
+
+
+class Base62Scheme(IdScheme):
+    """
+    Fixed width base62 strings of a 64-bit value, a bijection of the
+    student number, digits in ASCII order
+    """
+    name = 'base62'
+    # 62 ** 11 > 2 ** 64
+    WIDTH = 11
+
+    def idnos(self, seed, indices):
+        packed = numpy.zeros((len(indices), 2), dtype=numpy.uint64)
+        packed[:, 1] = generator.mix64(
+            _key(seed) + numpy.asarray(indices, dtype=numpy.uint64))
+        return self.unpack(packed)
+
+    def pack(self, idnos):
+        digits = _BASE62_VALUES[numpy.frombuffer(
+            ''.join(idnos).encode('ascii'), dtype=numpy.uint8)]
+        packed = numpy.zeros((len(idnos), 2), dtype=numpy.uint64)
+        for column in digits.reshape(len(idnos), self.WIDTH).T:
+            packed[:, 1] = packed[:, 1] * numpy.uint64(62) + column
+        return packed
+
+    def unpack(self, packed):
+        values = numpy.asarray(packed)[:, 1].copy()
+        digits = numpy.empty((len(values), self.WIDTH), dtype=numpy.uint8)
+        for i in range(self.WIDTH - 1, -1, -1):
+            digits[:, i] = BASE62[values % numpy.uint64(62)]
+            values //= numpy.uint64(62)
+        text = digits.tobytes().decode('ascii')
+        return [text[i:i + self.WIDTH]
+                for i in range(0, len(text), self.WIDTH)]
+
+
+SCHEMES = {cls.name: cls() for cls in (
+    UuidScheme, TimeOrderedUuidScheme, IntegerScheme, Base62Scheme)}
+DEFAULT_SCHEME = 'uuid4'
+
+
+def scheme(name):
+    return SCHEMES[name]
@@ -0,0 +1,694 @@
+"""
+Concurrent ingest without lock conflicts.
+
+Students are hash partitioned into `concurrency` groups, characteristics
+too. Writes run in phases, and each phase in rounds where no two
+requests running at the same time touch the same node:
+
+1. nodes: every worker MERGEs the students and the characteristics of
+   its own groups
+2. characteristic links: in round r, worker w links the students of
+   group w to the characteristics of group (w + r) % concurrency
+3. friend links: each round pairs student groups two by two (round
+   robin), the worker of pair (a, b) links students of a and b to each
+   other; a last round links students within their own group
+
+Rounds are separated by barriers, and transient errors (deadlocks, lock
+timeouts) are retried.
+
+Rows are sent in transactions sized by an AdaptiveBatcher, which aims at
+a target commit latency and splits transactions the server cannot
+commit for lack of memory or time.
+
+CSV files are loaded by a CsvShardLoader: LOAD CSV statements commit
+every few thousand rows on the server, files are split into shards
+loaded in parallel, and phases (student nodes, characteristic nodes,
+characteristic links, friend links) run one after the other over all
+the shards. The load of a dataset shard first MERGEs the friend nodes,
+which can belong to other dataset shards. A PartitionedCsvLoader loads
+CSV files split by the same partitions in the same conflict free rounds.
+
+A CharacteristicPlanner lets loaders create every distinct
+characteristic once, in a phase of its own, and link students to it by
+id, instead of MERGEing a characteristic for every student having it.
+
+Loaders record committed batches, or the committed chunks of batches
+loaded in chunks, in a ProgressManifest, so that an interrupted load can
+resume where it stopped.
+"""
+import json
+import os
+import threading
+import time
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+
+from . import ids, neo4j
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+TRANSIENT_ERROR = 'Neo.TransientError.'
+# errors a smaller transaction is expected to avoid
+SPLIT_ERRORS = (
+    'Neo.TransientError.General.OutOfMemoryError',
+    'Neo.TransientError.General.MemoryPoolOutOfMemoryError',
+    'Neo.TransientError.General.TransactionMemoryLimit',
+    'Neo.TransientError.Transaction.MaximumTransactionLimitReached',
+    'Neo.ClientError.Transaction.TransactionTimedOut',
+    'Neo.TransientError.Transaction.TransactionTimedOut',
+)
+# a request timing out, over HTTP or Bolt
+TIMEOUT_ERRORS = (requests.exceptions.Timeout, TimeoutError)
+
+
+def partition(key, partitions):
+    return zlib.crc32(str(key).encode('utf-8')) % partitions
+
+
+def characteristic_id(characteristic):
+    return characteristic['type'] + ':' + characteristic['value']
+
+
+def csv_partition(kind, groups):
+    """
+    Return the function mapping the fields of a record of a `kind` CSV
+    file (CSV_PHASES) to its partition: the groups of the nodes it writes
+    """
+    if kind == 'students':
+        return lambda fields: (partition(fields[0], groups),)
+    if kind == 'characteristic_nodes':
+        return lambda fields: (
+            partition(fields[0] + ':' + fields[1], groups),)
+    if kind == 'characteristics':
+        return lambda fields: (
+            partition(fields[0], groups),
+            partition(fields[1] + ':' + fields[2], groups))
+    if kind == 'friends':
+        return lambda fields: (partition(fields[0], groups),
+                               partition(fields[1], groups))
+    raise ValueError('unknown CSV file kind: {}'.format(kind))
+
+
+def pair_rounds(groups):
+    """
+    Split every pair of distinct groups into rounds of disjoint pairs,
+    using the circle method
+    """
+    order = list(range(groups)) + ([None] if groups % 2 else [])
+    rounds = []
+    for _ in range(len(order) - 1):
+        pairs = [(order[i], order[-1 - i]) for i in range(len(order) // 2)]
+        rounds.append([pair for pair in pairs if None not in pair])
+        order = [order[0], order[-1]] + order[1:-1]
+    return rounds
+
+
+class PartitionScheduler():
+    """
+    Load students and friend edges with `concurrency` requests in
+    flight, each request carrying at most `chunk_size` rows
+    """
+
+    def __init__(self, client, concurrency, chunk_size, retries=5,
+                 target_latency=None, planner=None):
+        self.client = client
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.target_latency = target_latency
+        self.planner = planner
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        # one batcher per query, shared by the workers
+        self.batchers = {}
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.executor.shutdown()
+
+    def load(self, students, friends):
+        """
+        Load `students`, in the row form of generator.generate_student,
+        and their (idno, friend idno) edges
+        """
+        groups = self.concurrency
+        student_groups = [[] for _ in range(groups)]
+        characteristic_groups = [{} for _ in range(groups)]
+        # links[student group][characteristic group]
+        links = [[[] for _ in range(groups)] for _ in range(groups)]
+        for student in students:
+            group = partition(student['idno'], groups)
+            student_groups[group].append({
+                'idno': student['idno'],
+                'properties': {k: v for k, v in student.items()
+                               if k not in ('idno', 'characteristics')}
+            })
+            for characteristic in student['characteristics']:
+                key = characteristic_id(characteristic)
+                characteristic_group = partition(key, groups)
+                characteristic_groups[characteristic_group][key] = {
+                    'id': key,
+                    'type': characteristic['type'],
+                    'value': characteristic['value'],
+                }
+                links[group][characteristic_group].append(
+                    {'idno': student['idno'], 'id': key})
+        # friend_links[student group][friend group]
+        friend_links = [[[] for _ in range(groups)] for _ in range(groups)]
+        for idno, friend_idno in friends:
+            friend_links[partition(idno, groups)][
+                partition(friend_idno, groups)].append(
+                    {'idno': idno, 'friend_idno': friend_idno})
+        if self.planner is None:
+            characteristic_groups = [
+                list(group.values()) for group in characteristic_groups]
+        else:
+            # characteristics created by earlier loads are not MERGEd
+            characteristic_groups = [
+                self.planner.plan(group, sum(
+                    len(links[w][g]) for w in range(groups)))
+                for g, group in enumerate(characteristic_groups)]
+
+        self.run_phase('nodes', [
+            [(neo4j.Q_IN_STUDENT_NODES, 'students', student_groups[w]),
+             (neo4j.Q_IN_CHARACTERISTIC_NODES, 'characteristics',
+              characteristic_groups[w])]
+            for w in range(groups)])
+        if self.planner is not None:
+            for group in characteristic_groups:
+                self.planner.done(group)
+        self.run_phase('characteristic_links', *[
+            [[(neo4j.Q_IN_CHARACTERISTIC_LINKS, 'links',
+               links[w][(w + r) % groups])] for w in range(groups)]
+            for r in range(groups)])
+        self.run_phase('friend_links', *[
+            [[(neo4j.Q_IN_FRIEND_LINKS, 'friends',
+               friend_links[a][b] + friend_links[b][a])]
+             for a, b in pairs]
+            for pairs in pair_rounds(groups)
+        ] + [[[(neo4j.Q_IN_FRIEND_LINKS, 'friends', friend_links[w][w])]
+              for w in range(groups)]])
+
+    def run_phase(self, phase, *rounds):
+        """
+        Run the rounds of a phase one after the other, the tasks of a
+        round in parallel; a task is a list of (query, parameter, rows)
+        """
+        start_time = datetime.now()
+        results = []
+        for tasks in rounds:
+            futures = [self.executor.submit(self.run_task, task)
+                       for task in tasks]
+            for future in futures:
+                results.extend(future.result())
+        neo4j.log_update_query_stats(
+            datetime.now() - start_time, {'results': results}, phase=phase)
+
+    def run_task(self, task):
+        results = []
+        for query, parameter, rows in task:
+            results.extend(self.batcher(query, parameter).load(rows))
+        return results
+
+    def batcher(self, query, parameter):
+        with self.lock:
+            if query not in self.batchers:
+                self.batchers[query] = AdaptiveBatcher(
+                    self.client, query, parameter,
+                    initial_size=self.chunk_size,
+                    target_latency=self.target_latency,
+                    retries=self.retries)
+            return self.batchers[query]
+
+
+class AdaptiveBatcher():
+    """
+    Send the rows of `parameter` of `query` in transactions whose size
+    follows the measured commit latency toward `target_latency` seconds.
+
+    A transaction that fails for lack of memory or time is halved and its
+    halves are sent again, down to `min_size` rows; without a target
+    latency the size only shrinks on such failures.
+    """
+
+    def __init__(self, client, query, parameter, initial_size=1000,
+                 target_latency=None, min_size=1, max_size=100000,
+                 retries=5):
+        self.client = client
+        self.query = query
+        self.parameter = parameter
+        self.size = max(min_size, min(initial_size, max_size))
+        self.target_latency = target_latency
+        self.min_size = min_size
+        self.max_size = max_size
+        self.retries = retries
+
+    def load(self, rows, start=0, on_commit=None):
+        """
+        Send `rows` from `start` in as many transactions as needed,
+        calling `on_commit` with the number of rows committed so far after
+        every transaction,
+        Return the statement results of all the transactions
+        """
+        results = []
+        position = start
+        while position < len(rows):
+            chunk = rows[position:position + self.size]
+            results.extend(self.commit(chunk))
+            position += len(chunk)
+            if on_commit is not None:
+                on_commit(position)
+        return results
+
+    def commit(self, chunk):
+        start_time = time.monotonic()
+        try:
+            result = retry_transient(
+                self.client.do_query_update,
+                self.query, {self.parameter: chunk},
+                retries=self.retries)
+        except (neo4j.QueryError,) + TIMEOUT_ERRORS as e:
+            if not needs_split(e) or len(chunk) <= self.min_size:
+                raise
+            self.size = max(self.min_size, min(self.size, len(chunk) // 2))
+            logger.warning('neo4j.ingest.split', transaction_size=len(chunk),
+                           next_transaction_size=self.size, error=str(e))
+            return self.load(chunk)
+        duration = time.monotonic() - start_time
+        self.adjust(len(chunk), duration)
+        neo4j.log_update_query_stats(
+            timedelta(seconds=duration), result,
+            transaction_size=len(chunk),
+            next_transaction_size=self.size,
+            rows_per_second='{:.1f}'.format(len(chunk) / (duration or 1e-6)))
+        return result['results']
+
+    def adjust(self, rows, duration):
+        """
+        Resize transactions after `rows` committed in `duration` seconds,
+        by at most a factor 2 per commit
+        """
+        if not self.target_latency or rows < self.size:
+            # a short final chunk tells little about the right size
+            return
+        ratio = self.target_latency / max(duration, 1e-3)
+        size = int(self.size * min(2.0, max(0.5, ratio)))
+        self.size = max(self.min_size, min(size, self.max_size))
+
+
+# phases of a CSV load: name, CSV file of the batch and query
+CSV_PHASES = (
+    ('students', 'students', neo4j.Q_IN_CSV_STUDENTS),
+    ('characteristic_nodes', 'characteristic_nodes',
+     neo4j.Q_IN_CSV_CHARACTERISTIC_NODES),
+    ('characteristic_links', 'characteristics',
+     neo4j.Q_IN_CSV_CHARACTERISTIC_LINKS),
+    ('friend_links', 'friends', neo4j.Q_IN_CSV_FRIENDS),
+)
+
+# phases of the CSV load of a shard of a dataset, friends can be students
+# of other shards
+SHARDED_CSV_PHASES = CSV_PHASES[:-1] + (
+    ('friend_nodes', 'friends', neo4j.Q_IN_CSV_FRIEND_NODES),
+) + CSV_PHASES[-1:]
+
+
+class CsvShardLoader():
+    """
+    Load CSV shards with LOAD CSV, `concurrency` shards at a time, the
+    server committing every `commit_size` rows.
+
+    Every phase loads the shards of all the batches before the next one
+    starts, so that the nodes a relationship links exist. Shards of a
+    phase run in parallel; the deadlocks of concurrent relationship
+    writes are retried, and a shard the server cannot load for lack of
+    memory or time is loaded again with smaller commits. Loading a shard
+    again is harmless, the queries MERGE. Idnos are read as `id_scheme`
+    (ids.IdScheme) idnos, `phases` are CSV_PHASES or SHARDED_CSV_PHASES.
+    """
+
+    def __init__(self, client, concurrency, commit_size, manifest,
+                 retries=5, id_scheme=None, phases=CSV_PHASES):
+        self.client = client
+        self.phases = phases
+        self.id_scheme = id_scheme or ids.scheme(ids.DEFAULT_SCHEME)
+        self.concurrency = concurrency
+        self.commit_size = commit_size
+        self.manifest = manifest
+        self.retries = retries
+
+    def load(self, batches):
+        """
+        Load `batches`, a list of (batch file name, shards) where shards
+        maps the students, characteristic nodes, characteristics and
+        friends CSV files of the batch to lists of (shard path, rows)
+        """
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for phase, kind, query in self.phases:
+                self.run_phase(executor, phase, query,
+                               self.rounds(phase, kind, batches))
+        self.manifest.commit(*[file for file, _ in batches])
+
+    def rounds(self, phase, kind, batches):
+        """
+        Return the rounds of tasks of `phase`, a task being a list of
+        (name, path, rows) shards: a single round where every shard not
+        loaded yet is a task
+        """
+        shards = [(shard_name(file, phase, path), path, rows)
+                  for file, files in batches
+                  for path, rows in files[kind]]
+        return [[[shard] for shard in shards
+                 if not self.manifest.done(shard[0])]]
+
+    def run_phase(self, executor, phase, query, rounds):
+        """
+        Run the rounds of a phase one after the other, the tasks of a
+        round in parallel and the shards of a task in turn
+        """
+        shards = [shard for tasks in rounds for task in tasks
+                  for shard in task]
+        if not shards:
+            return
+        start_time = datetime.now()
+        results = []
+        for tasks in rounds:
+            futures = [executor.submit(self.run_task, query, task)
+                       for task in tasks if task]
+            for future in futures:
+                results.extend(future.result())
+        duration = datetime.now() - start_time
+        rows = sum(shard[2] for shard in shards)
+        neo4j.log_update_query_stats(
+            duration, {'results': results}, phase=phase,
+            shards=len(shards), rows=rows,
+            rows_per_second='{:.1f}'.format(
+                rows / (duration.total_seconds() or 1e-6)))
+
+    def load_shard(self, query, name, path, rows):
+        commit_size = self.commit_size
+        while True:
+            try:
+                result = retry_transient(
+                    self.client.do_query_update,
+                    query.format(
+                        file=path, commit_size=commit_size,
+                        idno=self.id_scheme.csv_value('idno'),
+                        friend_idno=self.id_scheme.csv_value('friend_idno')),
+                    retries=self.retries)
+                break
+            except (neo4j.QueryError,) + TIMEOUT_ERRORS as e:
+                if not needs_split(e) or commit_size <= 1:
+                    raise
+                commit_size //= 2
+                # the next shards start from the smaller size
+                self.commit_size = min(self.commit_size, commit_size)
+                logger.warning('neo4j.ingest.split', shard=name,
+                               next_commit_size=commit_size, error=str(e))
+        self.manifest.commit(name)
+        return result['results']
+
+    def run_task(self, query, task):
+        results = []
+        for shard in task:
+            results.extend(self.load_shard(query, *shard))
+        return results
+
+
+class PartitionedCsvLoader(CsvShardLoader):
+    """
+    Load CSV shards split by csv_partition into `concurrency` groups,
+    `batches` mapping every kind of CSV file to {partition: [(shard
+    path, rows)]}.
+
+    Like the PartitionScheduler phases, concurrent LOAD CSV statements
+    never write the same nodes, instead of retrying their deadlocks:
+    node phases load the shards of a group one after the other, the
+    groups in parallel, and link phases run in rounds of disjoint pairs
+    of groups.
+    """
+
+    def rounds(self, phase, kind, batches):
+        groups = self.concurrency
+        parts = {}
+        for file, files in batches:
+            for partition, shards in files[kind].items():
+                parts.setdefault(partition, []).extend(
+                    (name, path, rows) for name, path, rows in (
+                        (shard_name(file, phase, path), path, rows)
+                        for path, rows in shards)
+                    if not self.manifest.done(name))
+
+        def task(*partitions):
+            return [shard for partition in partitions
+                    for shard in parts.get(partition, [])]
+
+        if phase == 'characteristic_links':
+            # (student group, characteristic group)
+            return [[task((w, (w + r) % groups)) for w in range(groups)]
+                    for r in range(groups)]
+        if phase == 'friend_links':
+            return [[task((a, b), (b, a)) for a, b in pairs]
+                    for pairs in pair_rounds(groups)
+                    ] + [[task((w, w)) for w in range(groups)]]
+        # node phases write the nodes of the last group of a partition
+        return [[task(*[partition for partition in sorted(parts)
+                        if partition[-1] == g])
+                 for g in range(groups)]]
+
+
+class CharacteristicPlanner():
+    """
+    Plan the creation of Characteristic nodes so that each distinct
+    characteristic is MERGEd once per load instead of once per student.
+
+    Loaders create the characteristics returned by `plan` in a phase of
+    their own, tell the planner with `done` once they are committed, and
+    link students to them by id. The ids of the characteristics created
+    are kept up to `window` of them; past that the planner forgets them
+    and characteristics are MERGEd again, once per window.
+    """
+
+    def __init__(self, window=1000000):
+        self.window = window
+        self.created = set()
+        self.references = 0
+        self.merged = 0
+        self.lock = threading.Lock()
+
+    def plan(self, characteristics, references):
+        """
+        Take the distinct `characteristics` of a batch, a dict of
+        {id, type, value} dicts by id, linked to `references` times,
+        Return the characteristics to create
+        """
+        with self.lock:
+            self.references += references
+            # concurrent batches may both create a characteristic not
+            # committed yet, MERGE keeps it unique
+            new = [characteristic
+                   for key, characteristic in characteristics.items()
+                   if key not in self.created]
+            self.merged += len(new)
+        return new
+
+    def done(self, characteristics):
+        """
+        Record that `characteristics` are committed
+        """
+        with self.lock:
+            if len(self.created) + len(characteristics) > self.window:
+                self.created.clear()
+            self.created.update(
+                characteristic['id'] for characteristic in characteristics)
+
+    @property
+    def merges_avoided(self):
+        return self.references - self.merged
+
+    def report(self, **kwargs):
+        with self.lock:
+            logger.info('neo4j.ingest.plan', references=self.references,
+                        merged=self.merged,
+                        merges_avoided=self.merges_avoided, **kwargs)
+
+
+def plan_students(planner, students):
+    """
+    Plan the load of `students`, in the form of the `students` parameter
+    of Q_IN_STUDENTS,
+    Return the characteristics to create first and the students in the
+    form of the `students` parameter of Q_IN_STUDENTS_BY_KEY
+    """
+    characteristics = {}
+    references = 0
+    planned = []
+    for student in students:
+        ids = []
+        for characteristic in student['characteristics']:
+            key = characteristic_id(characteristic)
+            characteristics.setdefault(key, {
+                'id': key,
+                'type': characteristic['type'],
+                'value': characteristic['value'],
+            })
+            ids.append(key)
+        references += len(ids)
+        planned.append({
+            'idno': student['idno'],
+            'properties': student['properties'],
+            'friends': student['friends'],
+            'characteristic_ids': ids,
+        })
+    return planner.plan(characteristics, references), planned
+
+
+def shard_name(file, phase, path):
+    """
+    Return the name of the shard `path` of batch `file` in the manifest
+    """
+    return '{}:{}:{}'.format(file, phase, os.path.basename(path))
+
+
+def chunk_name(file, number):
+    """
+    Return the name of chunk #`number` of batch `file` in the manifest
+    """
+    return '{}:{}'.format(file, number)
+
+
+def needs_split(error):
+    """
+    Tell whether a failed transaction could succeed with fewer rows:
+    read timeouts and neo4j memory and timeout errors, not connection
+    timeouts
+    """
+    if isinstance(error, (requests.exceptions.ReadTimeout, TimeoutError)):
+        return True
+    if not isinstance(error, neo4j.QueryError):
+        return False
+    return any(err.get('code') in SPLIT_ERRORS for err in error.errors)
+
+
+def retry_transient(func, *args, retries=5):
+    """
+    Call `func`, retrying transient neo4j errors, connection errors and
+    server errors (5xx) with an exponentially growing delay
+    """
+    attempt = 0
+    while True:
+        try:
+            return func(*args)
+        except (neo4j.QueryError, requests.exceptions.ConnectionError,
+                requests.exceptions.HTTPError, ConnectionError) as e:
+            if not is_transient(e) or attempt >= retries:
+                raise
+            attempt += 1
+            logger.warning('neo4j.ingest.retry', attempt=attempt,
+                           error=str(e))
+            time.sleep(min(0.1 * 2 ** attempt, 30.0))
+
+
+def is_transient(error):
+    """
+    Tell whether sending the same request again could succeed
+    """
+    if isinstance(error, (requests.exceptions.ConnectionError,
+                          ConnectionError)):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError):
+        return (error.response is not None and
+                error.response.status_code >= 500)
+    # retrying a transaction too large for the server is pointless
+    return all(err.get('code', '').startswith(TRANSIENT_ERROR)
+               for err in error.errors) and not needs_split(error)
+
+
+class ProgressManifest():
+    """
+    Batches, or chunks of batches, committed by a load, kept in the JSON
+    file `path`.
+
+    The file is rewritten atomically after every commit. Unless `resume`
+    is set, a previous manifest is discarded and the load starts over.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.committed = set()
+        # rows committed so far of batches not fully committed yet
+        self.rows = {}
+        # number of chunks of the batches loaded in chunks, once known
+        self.chunks = {}
+        self.lock = threading.Lock()
+        if resume and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                state = json.load(f)
+            self.committed = set(state['committed'])
+            self.rows = state['rows']
+            logger.info('neo4j.ingest.resume', manifest=path,
+                        committed=len(self.committed),
+                        partial=len(self.rows))
+        with self.lock:
+            self.save()
+
+    def done(self, batch):
+        return batch in self.committed
+
+    def committed_rows(self, batch):
+        return self.rows.get(batch, 0)
+
+    def commit_rows(self, batch, rows):
+        """
+        Record that the first `rows` rows of `batch` are committed
+        """
+        with self.lock:
+            self.rows[batch] = rows
+            self.save()
+
+    def commit(self, *batches):
+        """
+        Record that `batches` are fully committed
+        """
+        with self.lock:
+            self.committed.update(batches)
+            for batch in batches:
+                self.rows.pop(batch, None)
+            self.save()
+
+    def commit_chunk(self, batch, number, last=False):
+        """
+        Record that chunk #`number` of `batch` is committed, `last` if no
+        chunk follows it; once all its chunks are, in any order, `batch`
+        is committed in their place
+        """
+        with self.lock:
+            name = chunk_name(batch, number)
+            self.committed.add(name)
+            self.rows.pop(name, None)
+            if last:
+                self.chunks[batch] = number + 1
+            if batch in self.chunks:
+                names = [chunk_name(batch, n)
+                         for n in range(self.chunks[batch])]
+                if self.committed.issuperset(names):
+                    self.committed.difference_update(names)
+                    self.committed.add(batch)
+                    del self.chunks[batch]
+            self.save()
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        state = {'committed': sorted(self.committed), 'rows': self.rows}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,74 @@
+"""
+Structured logging.
+
+Modules get their logger from `get_logger`, which only imports structlog
+once a message is logged, so that commands logging nothing (--help)
+start without it. `init_logger` has structlog render JSON events to
+stderr, stdout being left to the data of commands writing there.
+"""
+import logging
+import sys
+import threading
+
+_lock = threading.Lock()
+# whether structlog is to be configured on first use
+_configure = False
+
+
+def init_logger():
+    global _configure
+    logging.basicConfig(
+        format="%(message)s",
+        stream=sys.stderr,
+        level=logging.INFO,
+    )
+
+    logging.getLogger("requests").setLevel(logging.WARNING)
+    _configure = True
+    if 'structlog' in sys.modules:
+        _structlog()
+
+
+def _structlog():
+    global _configure
+    import structlog
+
+    with _lock:
+        if _configure:
+            structlog.configure(
+                processors=[
+                    structlog.stdlib.filter_by_level,
+                    structlog.stdlib.add_logger_name,
+                    structlog.stdlib.add_log_level,
+                    structlog.stdlib.PositionalArgumentsFormatter(),
+                    structlog.processors.TimeStamper(fmt="iso"),
+                    structlog.processors.StackInfoRenderer(),
+                    structlog.processors.format_exc_info,
+                    structlog.processors.JSONRenderer()
+                ],
+                context_class=dict,
+                logger_factory=structlog.stdlib.LoggerFactory(),
+                wrapper_class=structlog.stdlib.BoundLogger,
+                cache_logger_on_first_use=True,
+            )
+            _configure = False
+    return structlog
+
+
+class LazyLogger():
+    """
+    Stand-in for the structlog logger `name`, created on first use
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._logger = None
+
+    def __getattr__(self, attr):
+        if self._logger is None:
+            self._logger = _structlog().get_logger(self.name)
+        return getattr(self._logger, attr)
+
+
+def get_logger(name):
+    return LazyLogger(name)
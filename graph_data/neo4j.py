@@ -1,10 +1,11 @@
+import abc
+import gzip
 import json
 import requests
-import structlog
 
-logger = structlog.get_logger(__name__)
+from .log import get_logger
 
-ctx = None
+logger = get_logger(__name__)
 
 Q_CR_UNIQUE_CONSTRAINT = """
     CREATE CONSTRAINT ON (entity:{type})
@@ -30,9 +31,57 @@ Q_IN_STUDENTS = """
     )
     """
 
+# students linked by id to Characteristic nodes created beforehand
+Q_IN_STUDENTS_BY_KEY = """
+    UNWIND {students} AS student
+    MERGE (s:Student {idno:student.idno})
+      SET s += student.properties
+    FOREACH (fr in student.friends |
+      MERGE (t:Student {idno:fr})
+      MERGE (s)-[:friend]->(t)
+    )
+    WITH s, student
+    UNWIND student.characteristic_ids AS id
+    MATCH (ch:Characteristic {id:id})
+    MERGE (s)-[:characteristic]->(ch)
+    """
+
+Q_IN_STUDENT_NODES = """
+    UNWIND {students} AS student
+    MERGE (s:Student {idno:student.idno})
+      SET s += student.properties
+    """
+
+Q_IN_CHARACTERISTIC_NODES = """
+    UNWIND {characteristics} AS characteristic
+    MERGE (ch:Characteristic {id:characteristic.id})
+      ON CREATE SET ch.type=characteristic.type, ch.value=characteristic.value
+    """
+
+Q_IN_CHARACTERISTIC_LINKS = """
+    UNWIND {links} AS link
+    MATCH (s:Student {idno:link.idno})
+    MATCH (ch:Characteristic {id:link.id})
+    MERGE (s)-[:characteristic]->(ch)
+    """
+
+Q_IN_FRIEND_LINKS = """
+    UNWIND {friends} AS friend
+    MERGE (s:Student {idno:friend.idno})
+    MERGE (t:Student {idno:friend.friend_idno})
+    MERGE (s)-[:friend]->(t)
+    """
+
+# The LOAD CSV queries commit every {commit_size} rows. Each of them MERGEs
+# nodes of a single label or MATCHes the nodes it links, so that the
+# planner needs no Eager operator, which would load the whole file in
+# memory despite the periodic commits. Nodes must be loaded before the
+# relationships between them. {idno} and {friend_idno} are the Cypher
+# expressions of the idno columns, ids.IdScheme.csv_value.
 Q_IN_CSV_STUDENTS = """
+    USING PERIODIC COMMIT {commit_size}
     LOAD CSV WITH HEADERS FROM 'file://{file}' AS line
-    MERGE (s:Student {{idno:line.idno}})
+    MERGE (s:Student {{idno:{idno}}})
     SET 
         s.name = line.name, 
         s.description = line.description, 
@@ -46,81 +95,171 @@ Q_IN_CSV_STUDENTS = """
         s.date_enrolled = line.date_enrolled 
     """
 
-Q_IN_CSV_CHARACTERISTICS = """
+Q_IN_CSV_CHARACTERISTIC_NODES = """
+    USING PERIODIC COMMIT {commit_size}
     LOAD CSV WITH HEADERS FROM 'file://{file}' AS line
-    MERGE (s:Student {{idno:line.idno}})
     MERGE (ch:Characteristic {{id:line.type+':'+line.value}})
       ON CREATE SET ch.type=line.type, ch.value=line.value
+    """
+
+Q_IN_CSV_CHARACTERISTIC_LINKS = """
+    USING PERIODIC COMMIT {commit_size}
+    LOAD CSV WITH HEADERS FROM 'file://{file}' AS line
+    MATCH (s:Student {{idno:{idno}}})
+    MATCH (ch:Characteristic {{id:line.type+':'+line.value}})
     MERGE (s)-[:characteristic]->(ch)
     """
 
+# the friends of the students of a shard can be students of shards not
+# loaded yet: the friend nodes are MERGEd before the friend links, and
+# get their properties when their own shard is loaded
+Q_IN_CSV_FRIEND_NODES = """
+    USING PERIODIC COMMIT {commit_size}
+    LOAD CSV WITH HEADERS FROM 'file://{file}' AS line
+    MERGE (fr:Student {{idno:{friend_idno}}})
+    """
+
 Q_IN_CSV_FRIENDS = """
+    USING PERIODIC COMMIT {commit_size}
     LOAD CSV WITH HEADERS FROM 'file://{file}' AS line
-    MERGE (s:Student {{idno:line.idno}})
-    MERGE (fr:Student {{idno:line.friend_idno}})
-    MERGE (s)-[:friend]->(ch)
+    MATCH (s:Student {{idno:{idno}}})
+    MATCH (fr:Student {{idno:{friend_idno}}})
+    MERGE (s)-[:friend]->(fr)
     """
 
 
-def do_query_update(query, params={}):
+# statistics of a statement, as reported by the HTTP endpoint
+STATS_KEYS = (
+    'contains_updates', 'nodes_created', 'nodes_deleted', 'properties_set',
+    'relationships_created', 'relationship_deleted', 'labels_added',
+    'labels_removed', 'indexes_added', 'indexes_removed',
+    'constraints_added', 'constraints_removed')
+
+
+class QueryError(Exception):
     """
-    Execute one query statement,
-    Return result and statistics
+    Errors reported by neo4j for a committed request,
+    `errors` holds the {code, message} dicts of the response
     """
-    url = get_neo4j_api_url('/db/data/transaction/commit')
-    query_request = {
-        'statements': [{
-            'statement': query,
-            'parameters': params,
-            'includeStats': True
-        }]
-    }
-    query_request = json.dumps(query_request).encode()
-    response = requests.post(url, data=query_request)
-    raise_for_update_errors(response)
-    return response
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("Neo4j Query Exception: " + ";".join(
+            err.get('message') for err in errors))
+
+
+class BaseClient(abc.ABC):
+    """
+    Queries shared by the clients of every transport, which implement
+    `do_query_update_batch` and `close`
+    """
+
+    def do_query_update(self, query, params={}):
+        """
+        Execute one query statement,
+        Return result and statistics
+        """
+        return self.do_query_update_batch(
+            [{'statement': query, 'params': params}])
+
+    @abc.abstractmethod
+    def do_query_update_batch(self, queries):
+        """
+        Execute multiple query statements in one transaction,
+        Return result and statistics for each of the statements
+        """
+
+    def close(self):
+        pass
+
+    def create_schema(self):
+        """
+        Create database indexes and uniqueness constraints
+        """
+        logger.info('graph.db.schema.prepare')
+        # Add Student constraints
+        params = {'type': 'Student', 'property': 'idno'}
+        self.do_query_update(prepare_query(Q_CR_UNIQUE_CONSTRAINT, params))
+        # Add Characteristic constraints
+        params = {'type': 'Characteristic', 'property': 'id'}
+        self.do_query_update(prepare_query(Q_CR_UNIQUE_CONSTRAINT, params))
+        params['property'] = 'type'
+        self.do_query_update(prepare_query(Q_CR_INDEX, params))
+        params['property'] = 'value'
+        self.do_query_update(prepare_query(Q_CR_INDEX, params))
+        logger.info('graph.db.schema.created')
 
 
-def do_query_update_batch(queries):
+class Neo4jClient(BaseClient):
     """
-    Execute multiple query statements,
-    Return result and statistics for each of the statements
+    Client of the neo4j HTTP transactional endpoint.
+
+    Requests go through a keep-alive connection pool of `pool_size`
+    connections and can be gzip compressed. Clients do not share any
+    state, so several of them can be used at once.
     """
-    url = get_neo4j_api_url('/db/data/transaction/commit')
-    statements = []
-    for query in queries:
-        statement = {
-            'statement': query['statement'],
-            'parameters': query['params'],
-            'includeStats': True
+
+    def __init__(self, url, timeout=None, gzip=False, pool_size=10):
+        self.url = url
+        self.timeout = timeout
+        self.gzip = gzip
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'Accept': 'application/json; charset=UTF-8',
+            'Content-Type': 'application/json',
+        })
+        if gzip:
+            self.session.headers['Content-Encoding'] = 'gzip'
+
+    def close(self):
+        self.session.close()
+
+    def do_query_update_batch(self, queries):
+        """
+        Execute multiple query statements,
+        Return result and statistics for each of the statements
+        """
+        statements = []
+        for query in queries:
+            statement = {
+                'statement': query['statement'],
+                'parameters': query['params'],
+                'includeStats': True
+            }
+            statements.append(statement)
+
+        query_request = {
+            'statements': statements
         }
-        statements.append(statement)
 
-    query_request = {
-        'statements': statements
-    }
+        query_request = json.dumps(query_request).encode()
+        if self.gzip:
+            query_request = gzip.compress(query_request, compresslevel=1)
+        response = self.session.post(
+            self.get_neo4j_api_url('/db/data/transaction/commit'),
+            data=query_request, timeout=self.timeout)
+        return raise_for_update_errors(response)
 
-    query_request = json.dumps(query_request).encode()
-    response = requests.post(url, data=query_request)
-    raise_for_update_errors(response)
-    return response
+    def get_neo4j_api_url(self, endpoint=None):
+        if not endpoint:
+            return self.url
+        return self.url + endpoint
 
 
 def raise_for_update_errors(response):
+    """
+    Check the response of a commit request,
+    Return the parsed response
+    """
     response.raise_for_status()
-    errors = []
-    for err in response.json().get('errors'):
-        errors.append(err.get('message'))
-    if errors:
-        message = ";".join(errors)
-        raise Exception("Neo4j Query Exception: " + message)
-
-
-def get_neo4j_api_url(endpoint=None):
-    neo4j_url = ctx.neo4j_url
-    if not endpoint:
-        return neo4j_url
-    return neo4j_url + endpoint
+    result = response.json()
+    if result.get('errors'):
+        raise QueryError(result['errors'])
+    return result
 
 
 def prepare_query(query, params):
@@ -130,33 +269,12 @@ def prepare_query(query, params):
     return query.format(**params)
 
 
-def create_schema():
-    """
-    Create database indexes and uniqueness constraints
-    """
-    logger.info('graph.db.schema.prepare')
-    # Add Student constraints
-    params = {'type': 'Student', 'property': 'idno'}
-    do_query_update(prepare_query(Q_CR_UNIQUE_CONSTRAINT, params))
-    # Add Characteristic constraints
-    params = {'type': 'Characteristic', 'property': 'id'}
-    do_query_update(prepare_query(Q_CR_UNIQUE_CONSTRAINT, params))
-    params['property'] = 'type'
-    do_query_update(prepare_query(Q_CR_INDEX, params))
-    params['property'] = 'value'
-    do_query_update(prepare_query(Q_CR_INDEX, params))
-    logger.info('graph.db.schema.created')
-
-
-def log_update_query_stats(duration, response, **kwargs):
-    update_response = response.json()
-    # remove errors block since it's empty
-    update_response.pop('errors')
+def log_update_query_stats(duration, result, **kwargs):
     stats = {}
-    for res in update_response['results']:
+    for res in result['results']:
         for op in res['stats']:
             if op in stats:
-                if isinstance(op, bool):
+                if isinstance(res['stats'][op], bool):
                     stats[op] = stats[op] or res['stats'][op]
                 else:
                     stats[op] = stats[op] + res['stats'][op]
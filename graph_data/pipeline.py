@@ -0,0 +1,278 @@
+"""
+Staged pipelines with bounded queues.
+
+Items produced by a source go through a chain of stages, each stage
+running its function in its own worker threads (or, for CPU bound
+stages, in a process pool fed by those threads) and handing results to
+the next stage through a bounded queue. Stages record how long they are
+busy and how long they wait for input or for room in their output
+queue, which tells which stage is the bottleneck.
+
+An expanding stage turns an item into any number of items, handed to the
+next stage as they are produced, so that a large item (a whole batch
+file) flows through the next stages in bounded chunks. In processes,
+every worker thread of such a stage feeds a process of its own.
+"""
+import multiprocessing
+import threading
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from queue import Empty, Full, Queue
+
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+# end of stream marker
+_DONE = object()
+# returned when waiting on a queue of a stopped pipeline
+_STOPPED = object()
+
+
+class Stage():
+
+    def __init__(self, name, func, workers=1, processes=False,
+                 expand=False):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.processes = processes
+        self.expand = expand
+        self.busy = 0.0
+        self.wait_input = 0.0
+        self.wait_output = 0.0
+        self.items = 0
+        self.lock = threading.Lock()
+
+    def record(self, busy, wait_input, wait_output):
+        with self.lock:
+            self.busy += busy
+            self.wait_input += wait_input
+            self.wait_output += wait_output
+            self.items += 1
+
+
+class StreamingProcess():
+    """
+    Process applying `func`, which returns an iterable, to one item at a
+    time, its results handed back as they are produced through a queue of
+    `queue_size` results
+    """
+
+    def __init__(self, func, queue_size):
+        self.tasks = multiprocessing.Queue()
+        self.results = multiprocessing.Queue(maxsize=queue_size)
+        self.process = multiprocessing.Process(
+            target=_stream, args=(func, self.tasks, self.results),
+            daemon=True)
+        self.process.start()
+
+    def stream(self, item, stopped):
+        """
+        Yield the results of `func` for `item`, until the `stopped` event
+        is set
+        """
+        self.tasks.put(item)
+        while not stopped.is_set():
+            try:
+                done, result = self.results.get(timeout=0.1)
+            except Empty:
+                if not self.process.is_alive():
+                    raise RuntimeError('streaming process exited with code '
+                                       '{}'.format(self.process.exitcode))
+                continue
+            if not done:
+                yield result
+            elif result is None:
+                return
+            else:
+                raise result
+
+    def shutdown(self):
+        self.tasks.put(None)
+        self.process.join(timeout=1.0)
+        if self.process.is_alive():
+            # stopped while blocked on a full result queue
+            self.process.terminate()
+            self.process.join()
+
+
+def _stream(func, tasks, results):
+    # Run in a StreamingProcess: (False, result) for every result, then
+    # (True, None) or (True, error) for every item
+    for item in iter(tasks.get, None):
+        try:
+            for result in func(item):
+                results.put((False, result))
+        except Exception as e:
+            results.put((True, e))
+        else:
+            results.put((True, None))
+
+
+class Pipeline():
+    """
+    Chain of stages fed by `source`, an iterable of items
+    """
+
+    def __init__(self, name, source, queue_size=4):
+        self.name = name
+        self.source = source
+        self.queue_size = queue_size
+        self.stages = []
+        self.failed = threading.Event()
+        self.error = None
+
+    def add_stage(self, name, func, workers=1, processes=False,
+                  expand=False):
+        """
+        Append a stage applying `func` to every item, in `workers`
+        threads or, if `processes`, in a pool of `workers` processes;
+        if `expand`, `func` returns an iterable of items for the next
+        stage
+        """
+        self.stages.append(Stage(name, func, workers, processes, expand))
+        return self
+
+    def run(self):
+        """
+        Run the pipeline,
+        Yield the results of the last stage as they are produced
+        """
+        start = time.monotonic()
+        queues = [Queue(maxsize=self.queue_size)
+                  for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(
+            target=self._feed, args=(queues[0],), daemon=True)]
+        pools = []
+        for i, stage in enumerate(self.stages):
+            pool = None
+            if stage.processes and not stage.expand:
+                pool = ProcessPoolExecutor(max_workers=stage.workers)
+                pools.append(pool)
+            remaining = [stage.workers]
+            for _ in range(stage.workers):
+                if stage.processes and stage.expand:
+                    pool = StreamingProcess(stage.func, self.queue_size)
+                    pools.append(pool)
+                threads.append(threading.Thread(
+                    target=self._work,
+                    args=(stage, pool, queues[i], queues[i + 1], remaining),
+                    daemon=True))
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                item = self._get(queues[-1])
+                if item is _DONE or item is _STOPPED:
+                    break
+                yield item
+        finally:
+            self.failed.set()
+            for thread in threads:
+                thread.join()
+            for pool in pools:
+                pool.shutdown()
+        if self.error is not None:
+            raise self.error
+        self.report(time.monotonic() - start)
+
+    def report(self, elapsed):
+        """
+        Log the utilization of every stage and the bottleneck stage,
+        the one busy for the largest share of its workers' time
+        """
+        stages = {}
+        for stage in self.stages:
+            stages[stage.name] = {
+                'workers': stage.workers,
+                'items': stage.items,
+                'utilization': '{:.2f}'.format(
+                    stage.busy / (elapsed * stage.workers or 1)),
+                'busy_seconds': '{:.3f}'.format(stage.busy),
+                'wait_input_seconds': '{:.3f}'.format(stage.wait_input),
+                'wait_output_seconds': '{:.3f}'.format(stage.wait_output),
+            }
+        bottleneck = max(
+            self.stages, key=lambda stage: stage.busy / stage.workers)
+        logger.info('pipeline.stats', pipeline=self.name, stages=stages,
+                    bottleneck=bottleneck.name,
+                    duration_seconds='{:.3f}'.format(elapsed))
+
+    def _feed(self, output):
+        try:
+            for item in self.source:
+                if not self._put(output, item):
+                    return
+        except Exception as e:
+            self._fail(e)
+            return
+        self._put(output, _DONE)
+
+    def _work(self, stage, pool, input, output, remaining):
+        while True:
+            started = time.monotonic()
+            item = self._get(input)
+            if item is _STOPPED:
+                return
+            if item is _DONE:
+                # the last worker of the stage ends the next stage
+                with stage.lock:
+                    remaining[0] -= 1
+                    last = not remaining[0]
+                if last:
+                    self._put(output, _DONE)
+                else:
+                    self._put(input, _DONE)
+                return
+            got = time.monotonic()
+            results = self._apply(stage, pool, item)
+            while True:
+                try:
+                    result = next(results)
+                except StopIteration:
+                    break
+                except Exception as e:
+                    self._fail(e)
+                    return
+                done = time.monotonic()
+                if not self._put(output, result):
+                    return
+                stage.record(
+                    done - got, got - started, time.monotonic() - done)
+                started = got = time.monotonic()
+
+    def _apply(self, stage, pool, item):
+        # Yield the results of `stage` for `item`
+        if isinstance(pool, StreamingProcess):
+            yield from pool.stream(item, self.failed)
+        elif pool is not None:
+            yield pool.submit(stage.func, item).result()
+        elif stage.expand:
+            yield from stage.func(item)
+        else:
+            yield stage.func(item)
+
+    def _fail(self, error):
+        if self.error is None:
+            self.error = error
+        self.failed.set()
+
+    def _get(self, queue):
+        while not self.failed.is_set():
+            try:
+                return queue.get(timeout=0.1)
+            except Empty:
+                pass
+        return _STOPPED
+
+    def _put(self, queue, item):
+        # Return False when the pipeline stopped
+        while not self.failed.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
@@ -0,0 +1,117 @@
+"""
+Pools of faker values for the "fast" generation mode.
+
+Faker dominates the cost of generating a student. In fast mode the bulk
+generator does not call faker: it samples every faker field from a pool
+of values drawn once per process. Pool sizes bound the number of
+distinct values of each field.
+
+Pools only depend on their seed and sizes, so every process builds the
+same pools and datasets stay reproducible. They can be kept in a JSON
+cache file to skip building them.
+"""
+import json
+import os
+
+from . import generator
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_POOL_SIZE = 10000
+
+# faker fields of a student and how to draw one value
+FIELDS = {
+    'name': lambda: generator.get_fake().name(),
+    'description': lambda: generator.get_fake().text(),
+    'phone': lambda: generator.get_fake().phone_number(),
+    'country': lambda: generator.get_fake().country(),
+    'city': lambda: generator.get_fake().city(),
+    'street': lambda: generator.get_fake().street_name(),
+    'building_number': lambda: generator.get_fake().building_number(),
+}
+
+# pools built by this process, by ValuePools.key()
+_built = {}
+
+
+class ValuePools():
+    """
+    Pools of `size` values for every faker field, `sizes` overrides the
+    size of some fields, `cache` is the path of a JSON cache file.
+
+    Values are drawn on first use; pickling a ValuePools does not copy
+    them, so it is cheap to send to worker processes.
+    """
+
+    def __init__(self, seed, size=DEFAULT_POOL_SIZE, sizes=None, cache=None):
+        sizes = sizes or {}
+        unknown = set(sizes) - set(FIELDS)
+        if unknown:
+            raise ValueError('no pool for {}, pools are {}'.format(
+                ', '.join(sorted(unknown)), ', '.join(FIELDS)))
+        self.seed = seed
+        self.sizes = {field: sizes.get(field, size) for field in FIELDS}
+        self.cache = cache
+
+    def key(self):
+        return (self.seed, tuple(sorted(self.sizes.items())))
+
+    @property
+    def values(self):
+        key = self.key()
+        if key not in _built:
+            _built[key] = self._read_cache() or self._build()
+        return _built[key]
+
+    def sample(self, field, n):
+        """
+        Draw `n` values of `field` uniformly from its pool,
+        using the random state of the generator
+        """
+        pool = self.values[field]
+        return [pool[i] for i in generator.random_indices(len(pool), n)]
+
+    def _build(self):
+        logger.info('generator.pools.build', seed=self.seed, sizes=self.sizes)
+        from faker.generator import random
+
+        # faker draws from its own global random state: seed it for the
+        # pools and give it back as it was
+        fake = generator.get_fake()
+        state = random.getstate()
+        fake.seed(self.seed)
+        try:
+            values = {field: [draw() for _ in range(self.sizes[field])]
+                      for field, draw in FIELDS.items()}
+        finally:
+            random.setstate(state)
+        if self.cache:
+            self._write_cache(values)
+        return values
+
+    def _header(self):
+        from faker import VERSION
+
+        return {'seed': self.seed, 'sizes': self.sizes, 'faker': VERSION}
+
+    def _read_cache(self):
+        if not self.cache or not os.path.exists(self.cache):
+            return None
+        with open(self.cache, encoding='utf-8') as f:
+            document = json.load(f)
+        if document.get('header') != self._header():
+            logger.info('generator.pools.cache.stale', cache=self.cache)
+            return None
+        logger.info('generator.pools.cache.read', cache=self.cache)
+        return document['pools']
+
+    def _write_cache(self, values):
+        # concurrent processes each write their own file, the last
+        # rename wins and all of them hold the same pools
+        tmp_path = '{}.{}.tmp'.format(self.cache, os.getpid())
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'header': self._header(), 'pools': values}, f,
+                      ensure_ascii=False)
+        os.replace(tmp_path, self.cache)
+        logger.info('generator.pools.cache.written', cache=self.cache)
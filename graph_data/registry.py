@@ -0,0 +1,237 @@
+"""
+Compact registry of student idnos.
+
+A registry keeps idnos packed by their scheme (ids.IdScheme) into 128
+bits in a numpy array, 16 bytes each, instead of lists of 36 character
+strings (about 100 bytes each), along with an open addressing hash table
+of their positions:
+
+* membership checks and insertions are O(1), and vectorized over arrays
+  of idnos
+* idnos are sampled uniformly in O(1) by drawing positions
+
+A registry given a `path` lives in two files memory mapped by every
+process using it, `path`.ids (a header and the packed idnos) and
+`path`.slots (the hash table), so that it is backed by the page cache
+rather than the heap and outlives the process, and other processes open
+it read-only (pickling a registry only copies its path). A billion
+students take 16 GB of idnos and 8 GB of hash table.
+
+There is a single writer: readers see idnos added after they opened the
+registry once they `refresh()` it.
+"""
+import os
+
+import numpy
+
+from . import generator, ids
+
+# first word of the header row of an ids file
+MAGIC = 0x47445f4944524547
+
+DEFAULT_CAPACITY = 1 << 16
+
+# the hash table is grown past that share of used slots
+MAX_LOAD = 0.5
+
+
+def _hash(packed):
+    return generator.mix64(packed[:, 0] ^ packed[:, 1])
+
+
+class IdRegistry():
+    """
+    Registry of idnos, kept in memory or, given a `path`, in memory
+    mapped files. `mode` is `w+` to create (or reset) a registry, `r+`
+    to add to an existing one (created if missing) and `r` to open one
+    read-only. Capacity grows as needed, from `capacity` idnos.
+    """
+
+    def __init__(self, path=None, mode='w+', capacity=DEFAULT_CAPACITY,
+                 id_scheme=None):
+        self.path = path
+        self.mode = mode
+        self.id_scheme = id_scheme or ids.scheme(ids.DEFAULT_SCHEME)
+        if path is None:
+            if mode == 'r':
+                raise ValueError('a read-only registry needs a path')
+            self._header = numpy.array([[MAGIC, 0]], dtype=numpy.uint64)
+            self._ids = numpy.zeros((capacity, 2), dtype=numpy.uint64)
+            self._slots = numpy.zeros(self._table_size(capacity),
+                                      dtype=self._slot_type(capacity))
+        elif mode == 'w+' or (mode == 'r+' and not os.path.exists(
+                path + '.ids')):
+            self._map_ids(capacity, 'w+')
+            self._header[0] = (MAGIC, 0)
+            self._map_slots(capacity, 'w+')
+        else:
+            self.refresh()
+
+    def __len__(self):
+        return int(self._header[0, 1])
+
+    def __contains__(self, idno):
+        return bool(self.contains([idno])[0])
+
+    def __getstate__(self):
+        if self.path is None:
+            raise TypeError('only registries backed by files are shared')
+        self.flush()
+        return {'path': self.path, 'id_scheme': self.id_scheme}
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self.id_scheme = state['id_scheme']
+        self.mode = 'r'
+        self.refresh()
+
+    @property
+    def capacity(self):
+        return len(self._ids)
+
+    def refresh(self):
+        """
+        Map the files of the registry again, to see what another
+        process added since
+        """
+        size = os.path.getsize(self.path + '.ids')
+        self._map_ids(size // 16 - 1, self.mode)
+        if int(self._header[0, 0]) != MAGIC:
+            raise ValueError('not an id registry: {}'.format(self.path))
+        self._map_slots(self.capacity, self.mode)
+
+    def flush(self):
+        for array in (self._header, self._ids, self._slots):
+            if isinstance(array, numpy.memmap):
+                array.flush()
+
+    def add(self, idnos):
+        """
+        Register the idnos not registered yet,
+        Return the number of idnos added
+        """
+        packed = self.id_scheme.pack(idnos)
+        packed = packed[self._find(packed) < 0]
+        # idnos repeated in `idnos` are added once, in order of first use
+        _, first = numpy.unique(
+            packed.view([('high', numpy.uint64), ('low', numpy.uint64)]),
+            return_index=True)
+        packed = packed[numpy.sort(first)]
+        count = len(self)
+        if count + len(packed) > self.capacity:
+            self._grow(count + len(packed))
+        self._ids[count:count + len(packed)] = packed
+        self._insert(numpy.arange(count, count + len(packed)))
+        self._header[0, 1] = count + len(packed)
+        return len(packed)
+
+    def contains(self, idnos):
+        """
+        Return a boolean array telling which of `idnos` are registered
+        """
+        return self._find(self.id_scheme.pack(idnos)) >= 0
+
+    def sample(self, rng, n):
+        """
+        Draw `n` registered idnos uniformly, with replacement, with the
+        numpy generator `rng`
+        """
+        if not len(self):
+            raise IndexError('sample from an empty registry')
+        return self.id_scheme.unpack(
+            self._ids[rng.integers(0, len(self), n)])
+
+    def _map_ids(self, capacity, mode):
+        if self.path is None:
+            rows = numpy.zeros((capacity, 2), dtype=numpy.uint64)
+            rows[:len(self)] = self._ids[:len(self)]
+            self._ids = rows
+            return
+        # the header row is followed by the idnos
+        rows = numpy.memmap(self.path + '.ids', dtype=numpy.uint64,
+                            mode=mode, shape=(capacity + 1, 2))
+        self._header = rows[:1]
+        self._ids = rows[1:]
+
+    def _map_slots(self, capacity, mode):
+        # slots hold the position of an idno plus 1, 0 for empty slots
+        shape = (self._table_size(capacity),)
+        dtype = self._slot_type(capacity)
+        if self.path is None:
+            self._slots = numpy.zeros(shape, dtype=dtype)
+        else:
+            self._slots = numpy.memmap(self.path + '.slots', dtype=dtype,
+                                       mode=mode, shape=shape)
+
+    @staticmethod
+    def _table_size(capacity):
+        size = 1
+        while size * MAX_LOAD < capacity:
+            size *= 2
+        return size
+
+    @staticmethod
+    def _slot_type(capacity):
+        return numpy.uint32 if capacity < 2 ** 32 - 1 else numpy.uint64
+
+    def _grow(self, needed):
+        if self.mode == 'r':
+            raise ValueError('registry {} is read-only'.format(self.path))
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        self.flush()
+        self._map_ids(capacity, 'r+')
+        self._map_slots(capacity, 'w+')
+        self._insert(numpy.arange(len(self), dtype=numpy.int64))
+
+    def _insert(self, positions):
+        # linear probing, vectorized: every round each pending idno
+        # claims its slot if empty, one idno per slot, the others probe
+        # the next slot
+        mask = len(self._slots) - 1
+        slots = _hash(self._ids[positions]) & numpy.uint64(mask)
+        while len(positions):
+            empty = self._slots[slots] == 0
+            claimed, first = numpy.unique(slots[empty], return_index=True)
+            self._slots[claimed] = positions[empty][first] + 1
+            placed = numpy.zeros(len(positions), dtype=bool)
+            placed[numpy.flatnonzero(empty)[first]] = True
+            positions = positions[~placed]
+            slots = (slots[~placed] + numpy.uint64(1)) & numpy.uint64(mask)
+
+    def _find(self, packed):
+        # Return the position of every packed idno, -1 if not registered
+        mask = len(self._slots) - 1
+        found = numpy.full(len(packed), -1, dtype=numpy.int64)
+        pending = numpy.arange(len(packed))
+        slots = _hash(packed) & numpy.uint64(mask)
+        while len(pending):
+            positions = self._slots[slots].astype(numpy.int64) - 1
+            used = positions >= 0
+            match = used.copy()
+            match[used] = (self._ids[positions[used]]
+                           == packed[pending[used]]).all(axis=1)
+            found[pending[match]] = positions[match]
+            pending = pending[used & ~match]
+            slots = (slots[used & ~match] + numpy.uint64(1)) \
+                & numpy.uint64(mask)
+        return found
+
+
+def sample_friends(registry, idnos, rng, min_friends=5, max_friends=19,
+                   min_students=50):
+    """
+    Draw [min_friends, max_friends] friends for every student of `idnos`
+    uniformly among the registered students, none until `min_students`
+    are registered,
+    Return a list of (idno, friend idno) edges
+    """
+    if len(registry) < min_students:
+        return []
+    degree = rng.integers(min_friends, max_friends, len(idnos), endpoint=True)
+    sources = numpy.repeat(numpy.arange(len(idnos)), degree)
+    targets = registry.sample(rng, len(sources))
+    return [(idnos[source], target)
+            for source, target in zip(sources.tolist(), targets)
+            if target != idnos[source]]
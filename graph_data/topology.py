@@ -0,0 +1,199 @@
+"""
+Friend graph topology models.
+
+Students are numbered by their position in the dataset (or in the load
+order) and a model draws, for every student, friends among the students
+numbered before it. Models are stateless: the friends of a range of
+students only depend on the model seed and the range, so memory use is
+bounded by the range size whatever the size of the graph. Friends of a
+student are distinct and never include the student itself.
+"""
+import abc
+
+import numpy
+
+from . import generator
+
+
+class Topology(abc.ABC):
+    """
+    Base model: out-degrees are drawn uniformly from
+    [min_friends, max_friends], targets are chosen by `targets`
+    """
+
+    def __init__(self, seed, min_friends=5, max_friends=19):
+        self.seed = seed
+        self.min_friends = min_friends
+        self.max_friends = max_friends
+
+    def edges(self, start, stop):
+        """
+        Draw the friends of students start..stop,
+        Return (sources, targets) arrays sorted by source
+        """
+        rng = numpy.random.default_rng([self.seed, start])
+        students = numpy.arange(start, stop, dtype=numpy.int64)
+        degree = rng.integers(self.min_friends, self.max_friends,
+                              len(students), endpoint=True)
+        degree = numpy.minimum(degree, students)
+        sources = numpy.repeat(students, degree)
+        # rank of every edge among the edges of its source, from 1
+        ranks = numpy.arange(len(sources)) - numpy.repeat(
+            numpy.cumsum(degree) - degree, degree) + 1
+        targets = self.targets(sources, ranks, rng)
+        return unique_edges(sources, targets)
+
+    def friends(self, start, stop):
+        """
+        Draw the friends of students start..stop,
+        Return (offsets, targets), friends of student start + i being
+        targets[offsets[i]:offsets[i + 1]]
+        """
+        sources, targets = self.edges(start, stop)
+        offsets = numpy.searchsorted(
+            sources, numpy.arange(start, stop + 1, dtype=numpy.int64))
+        return offsets, targets
+
+    @abc.abstractmethod
+    def targets(self, sources, ranks, rng):
+        """
+        Draw a friend among the students before every source, `ranks`
+        numbering the edges of a source from 1
+        """
+
+    def blocks(self, start, stop):
+        """
+        Return the university index of students start..stop for models
+        that cluster students by university, None otherwise
+        """
+        return None
+
+
+class UniformTopology(Topology):
+    """
+    Friends are chosen uniformly among the previous students
+    """
+
+    def targets(self, sources, ranks, rng):
+        return (rng.random(len(sources)) * sources).astype(numpy.int64)
+
+
+class PreferentialTopology(Topology):
+    """
+    Preferential attachment: earlier students attract more friends, with
+    a power-law degree distribution of the given `exponent`.
+
+    Instead of tracking degrees, targets are drawn from the expected
+    degree (Chung-Lu) weights (j + 1) ** (-1 / (exponent - 1)) by
+    inverting their cumulative distribution, which keeps the model
+    stateless.
+    """
+
+    def __init__(self, seed, exponent=2.5, **kwargs):
+        super().__init__(seed, **kwargs)
+        self.alpha = 1.0 / (exponent - 1)
+
+    def targets(self, sources, ranks, rng):
+        beta = 1.0 - self.alpha
+        total = numpy.power(sources + 1.0, beta) - 1.0
+        x = numpy.power(1.0 + rng.random(len(sources)) * total, 1.0 / beta)
+        return numpy.minimum(x.astype(numpy.int64) - 1, sources - 1).clip(0)
+
+
+class SmallWorldTopology(Topology):
+    """
+    Watts-Strogatz small world: students are friends with the students
+    right before them, each friendship is rewired to a uniformly chosen
+    previous student with probability `rewire`
+    """
+
+    def __init__(self, seed, rewire=0.1, **kwargs):
+        super().__init__(seed, **kwargs)
+        self.rewire = rewire
+
+    def targets(self, sources, ranks, rng):
+        targets = sources - ranks
+        rewired = rng.random(len(sources)) < self.rewire
+        targets[rewired] = (rng.random(rewired.sum()) *
+                            sources[rewired]).astype(numpy.int64)
+        return targets
+
+
+class BlockTopology(Topology):
+    """
+    Stochastic block model: students are split into one block per
+    university and a friend is chosen within the student's block with
+    probability `within`, among all previous students otherwise.
+
+    Blocks follow the weights of the university catalog, --catalog_skew
+    included: every PERIOD consecutive students hold the same number of
+    students of each university, proportional to its weight, in an order
+    shuffled once per seed. The block of a student and the members of a
+    block before it are thus computed without state. Datasets generated
+    with this model assign universities by block.
+    """
+    # students of a period of the block layout
+    PERIOD = 1 << 16
+
+    def __init__(self, seed, within=0.8, **kwargs):
+        super().__init__(seed, **kwargs)
+        self.within = within
+        weights = generator.CATALOGS['university'].weights
+        if weights is None:
+            size = len(generator.CATALOGS['university'])
+            weights = numpy.full(size, 1.0 / size)
+        # students of every block in a period, largest remainders first
+        quotas = numpy.floor(weights * self.PERIOD).astype(numpy.int64)
+        remainders = numpy.argsort(quotas - weights * self.PERIOD,
+                                   kind='stable')
+        quotas[remainders[:self.PERIOD - quotas.sum()]] += 1
+        self.quotas = quotas
+        # block of every student of a period
+        self.layout = numpy.random.default_rng(self.seed).permutation(
+            numpy.repeat(numpy.arange(len(quotas)), quotas))
+        # students of the period by block, those of block b starting at
+        # first[b], and the rank of every student within its block
+        self.members = numpy.argsort(self.layout, kind='stable')
+        self.first = numpy.cumsum(quotas) - quotas
+        self.rank = numpy.empty(self.PERIOD, dtype=numpy.int64)
+        self.rank[self.members] = (numpy.arange(self.PERIOD)
+                                   - self.first[self.layout[self.members]])
+
+    def blocks(self, start, stop):
+        return self.layout[
+            numpy.arange(start, stop, dtype=numpy.int64) % self.PERIOD]
+
+    def targets(self, sources, ranks, rng):
+        targets = (rng.random(len(sources)) * sources).astype(numpy.int64)
+        offset = sources % self.PERIOD
+        block = self.layout[offset]
+        quota = self.quotas[block]
+        # number of previous students in the same block
+        members = sources // self.PERIOD * quota + self.rank[offset]
+        within = (rng.random(len(sources)) < self.within) & (members > 0)
+        # member k of block b is member k % quota of b in period k // quota
+        k = (rng.random(within.sum()) * members[within]).astype(numpy.int64)
+        targets[within] = k // quota[within] * self.PERIOD + self.members[
+            self.first[block[within]] + k % quota[within]]
+        return targets
+
+
+def unique_edges(sources, targets):
+    """
+    Drop duplicate edges,
+    Return (sources, targets) sorted by source and target
+    """
+    order = numpy.lexsort((targets, sources))
+    sources = sources[order]
+    targets = targets[order]
+    keep = numpy.ones(len(sources), dtype=bool)
+    keep[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+    return sources[keep], targets[keep]
+
+
+MODELS = {
+    'uniform': UniformTopology,
+    'preferential': PreferentialTopology,
+    'small_world': SmallWorldTopology,
+    'sbm': BlockTopology,
+}
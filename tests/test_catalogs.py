@@ -0,0 +1,82 @@
+import random
+
+import numpy
+import pytest
+
+from graph_data.catalogs import Catalog, alias_table
+
+VALUES = tuple('value{}'.format(i) for i in range(20))
+
+
+def frequencies(indices, size):
+    return numpy.bincount(indices, minlength=size) / len(indices)
+
+
+@pytest.mark.parametrize('weights', [
+    [1.0],
+    [1.0, 1.0, 1.0],
+    [5.0, 1.0],
+    [0.0, 2.0, 1.0, 7.0],
+    (1.0 / numpy.arange(1, 101) ** 1.5).tolist(),
+])
+def test_alias_table_keeps_weights(weights):
+    probability, alias = alias_table(weights)
+    k = len(weights)
+    assert ((probability >= 0) & (probability <= 1)).all()
+    # index i is drawn with probability[i] / k, plus the share the
+    # other indices give it as their alias
+    drawn = probability / k
+    numpy.add.at(drawn, alias, (1 - probability) / k)
+    assert numpy.allclose(drawn, numpy.asarray(weights) / sum(weights))
+
+
+def test_sample_frequencies_match_weights(tmp_path):
+    path = tmp_path / 'catalog.txt'
+    path.write_text('# weighted\nrare\t1\ncommon\t6\n\nhalf\t3\n',
+                    encoding='utf-8')
+    catalog = Catalog('test', lambda: VALUES)
+    catalog.configure(str(path))
+    assert catalog.values == ('rare', 'common', 'half')
+    assert numpy.allclose(catalog.weights, [0.1, 0.6, 0.3])
+    indices = catalog.sample(numpy.random.default_rng(1), 200000)
+    assert numpy.abs(frequencies(indices, 3) - catalog.weights).max() < 0.01
+
+
+def test_skewed_sample_frequencies_match_zipf_weights():
+    catalog = Catalog('test', lambda: VALUES)
+    catalog.configure(skew=1.2)
+    zipf = 1.0 / numpy.arange(1, len(VALUES) + 1) ** 1.2
+    assert numpy.allclose(catalog.weights, zipf / zipf.sum())
+    indices = catalog.sample(numpy.random.default_rng(1), 200000)
+    shares = frequencies(indices, len(VALUES))
+    assert numpy.abs(shares - catalog.weights).max() < 0.01
+    random.seed(1)
+    values = [catalog.choice() for _ in range(50000)]
+    shares = frequencies([VALUES.index(value) for value in values],
+                         len(VALUES))
+    assert numpy.abs(shares - catalog.weights).max() < 0.01
+
+
+def test_zero_skew_is_uniform():
+    catalog = Catalog('test', lambda: VALUES)
+    catalog.configure(skew=0.0)
+    assert catalog.uniform
+    # the draws of uniform catalogs do not change
+    assert catalog.sample(numpy.random.default_rng(1), 100).tolist() == \
+        numpy.random.default_rng(1).integers(0, len(VALUES), 100).tolist()
+    random.seed(1)
+    values = [catalog.choice() for _ in range(100)]
+    random.seed(1)
+    assert values == [random.choice(VALUES) for _ in range(100)]
+    shares = frequencies(catalog.sample(numpy.random.default_rng(1), 200000),
+                         len(VALUES))
+    assert numpy.abs(shares - 1 / len(VALUES)).max() < 0.01
+
+
+def test_empty_catalog_file(tmp_path):
+    path = tmp_path / 'catalog.txt'
+    path.write_text('# nothing\n\n', encoding='utf-8')
+    catalog = Catalog('test', lambda: VALUES)
+    catalog.configure(str(path))
+    with pytest.raises(ValueError):
+        catalog.values
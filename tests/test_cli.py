@@ -0,0 +1,94 @@
+import json
+import os
+import subprocess
+import sys
+
+CLI_MAIN = 'from graph_data.cli import main; main()'
+# worker processes start afresh instead of inheriting the parent state
+SPAWN_CLI_MAIN = ('import multiprocessing; '
+                  'multiprocessing.set_start_method("spawn"); ' + CLI_MAIN)
+
+
+def run_cli(*args, main=CLI_MAIN):
+    return subprocess.run(
+        [sys.executable, '-c', main] + list(args), check=True,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def read_dump(output_dir):
+    dump = {}
+    for file in sorted(os.listdir(output_dir)):
+        with open(os.path.join(output_dir, file), 'rb') as f:
+            dump[file] = f.read()
+    return dump
+
+
+def test_fast_batch_output_is_data_only():
+    process = run_cli('--seed', '1', '--fast', '--pool_size', '5',
+                      '--batch_size', '3', 'batch')
+    students = json.loads(process.stdout.decode('utf-8'))['data']
+    assert len(students) == 3
+    # logs go to stderr
+    assert b'generator.pools.build' in process.stderr
+
+
+def test_fast_ndjson_batch_output_parses():
+    process = run_cli('--seed', '1', '--fast', '--pool_size', '5',
+                      '--batch_size', '3', 'batch', '--format', 'ndjson')
+    lines = process.stdout.decode('utf-8').splitlines()
+    assert [len(json.loads(line)) > 0 for line in lines] == [True] * 3
+
+
+def test_help_imports_neither_numpy_nor_structlog():
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CLI_MAIN, '--help'],
+        check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True)
+    imported = {line.split('|')[-1].strip()
+                for line in process.stderr.splitlines()}
+    assert 'numpy' not in imported
+    assert 'structlog' not in imported
+
+
+def test_option_choices_match_registries():
+    from graph_data import cli, ids, topology
+
+    assert cli.TOPOLOGIES == tuple(sorted(topology.MODELS))
+    assert cli.ID_SCHEMES == tuple(sorted(ids.SCHEMES))
+
+
+def test_spawned_workers_use_the_catalogs_of_the_command(tmp_path):
+    dumps = []
+    for workers in ('1', '2'):
+        output_dir = str(tmp_path / workers)
+        os.mkdir(output_dir)
+        run_cli('--seed', '1', '--batches', '2', '--batch_size', '50',
+                '--reference_date', '2020-01-01', '--output_dir', output_dir,
+                '--catalog_skew', 'faculty=3,hobby=3',
+                'dump', '--workers', workers, main=SPAWN_CLI_MAIN)
+        dumps.append(read_dump(output_dir))
+    assert sorted(dumps[0]) == sorted(dumps[1])
+    assert all(dumps[0][file] == dumps[1][file] for file in dumps[0])
+
+
+def test_batch_regenerates_dumped_batch(tmp_path):
+    dataset = ['--seed', '7', '--batches', '3', '--batch_size', '20',
+               '--reference_date', '2020-01-01']
+    run_cli(*dataset, '--output_dir', str(tmp_path), 'dump')
+    for batch_nr in ('3', '1'):
+        process = run_cli(*dataset, 'batch', '--batch_nr', batch_nr)
+        assert process.stdout == (
+            tmp_path / '0000{}.json'.format(batch_nr)).read_bytes()
+
+
+def test_shard_dumps_add_up_to_the_dump(tmp_path):
+    dataset = ['--seed', '7', '--batches', '5', '--batch_size', '20',
+               '--reference_date', '2020-01-01']
+    (tmp_path / 'full').mkdir()
+    (tmp_path / 'sharded').mkdir()
+    run_cli(*dataset, '--output_dir', str(tmp_path / 'full'), 'dump')
+    for shard in ('2/2', '1/2'):
+        run_cli(*dataset, '--shard', shard,
+                '--output_dir', str(tmp_path / 'sharded'), 'dump')
+    assert read_dump(str(tmp_path / 'sharded')) == \
+        read_dump(str(tmp_path / 'full'))
@@ -0,0 +1,71 @@
+import json
+import pickle
+import subprocess
+import sys
+
+import pytest
+
+from graph_data import cli, columnar, generator
+
+CLI_MAIN = 'from graph_data.cli import main; main()'
+
+
+@pytest.fixture(scope='module')
+def dump(tmp_path_factory):
+    # the same batch, as JSON and columnar files
+    output_dir = tmp_path_factory.mktemp('dump')
+    for format in ('json', 'columnar'):
+        subprocess.run(
+            [sys.executable, '-c', CLI_MAIN, '--seed', '7', '--batches', '1',
+             '--batch_size', '300', '--output_dir', str(output_dir),
+             'dump', '--format', format],
+            check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    with open(str(output_dir / '00001.json'), encoding='utf-8') as input:
+        rows = json.load(input)['data']
+    return output_dir, rows
+
+
+def read_batch(output_dir):
+    return columnar.read_columnar(open(str(output_dir / '00001.columnar'),
+                                       mode='rb'))
+
+
+def test_rows_match_json(dump):
+    output_dir, rows = dump
+    assert list(read_batch(output_dir)) == rows
+
+
+def test_payloads_match_row_payloads(dump):
+    output_dir, rows = dump
+    edges = [(rows[0]['idno'], rows[1]['idno'])]
+    _, _, expected = cli.students_payload(
+        ('00001.json', (0, True), rows, edges))
+    _, _, students = cli.students_payload(
+        ('00001.columnar', (0, True), read_batch(output_dir), edges))
+    assert students == expected
+
+
+def test_csv_rows_match_generator(dump):
+    output_dir, rows = dump
+    batch = read_batch(output_dir)
+    assert batch.csv_rows() == [
+        generator.get_student_as_csv_row(row) for row in rows]
+    assert batch.characteristic_rows() == [
+        characteristic for row in rows
+        for characteristic in generator.get_student_characteristic_rows(row)]
+
+
+def test_slice(dump):
+    output_dir, rows = dump
+    batch = read_batch(output_dir).slice(100, 250)
+    assert len(batch) == 150
+    assert batch.idnos() == [row['idno'] for row in rows[100:250]]
+    assert list(batch) == rows[100:250]
+
+
+def test_pickle_copies_path(dump):
+    output_dir, rows = dump
+    batch = read_batch(output_dir).slice(10, 20)
+    data = pickle.dumps(batch)
+    assert len(data) < 1000
+    assert list(pickle.loads(data)) == rows[10:20]
@@ -0,0 +1,95 @@
+import datetime
+import io
+
+import pytest
+
+from graph_data import dataset, formats
+from graph_data.dataset import VirtualDataset
+
+REFERENCE_DATE = datetime.date(2020, 1, 1)
+
+
+def new_dataset(batches=4, batch_size=30, **kwargs):
+    return VirtualDataset(11, batch_size, batches, REFERENCE_DATE, **kwargs)
+
+
+def render(virtual, batch_nr, format='json', chunks=None):
+    """
+    Return the batch files, written from `chunks` (the chunks of the
+    batch by default), and the friends file of a batch
+    """
+    if chunks is None:
+        chunks = virtual.chunks(batch_nr)
+    output = io.BytesIO() if format in formats.BINARY else io.StringIO()
+    outputs = [output]
+    if format == formats.CSV:
+        outputs.append(io.StringIO())
+        formats.write_csv(chunks, *outputs)
+    else:
+        formats.WRITERS[format](chunks, output)
+    outputs.append(io.StringIO())
+    formats.write_friends(virtual.friends(batch_nr), outputs[-1])
+    return [output.getvalue() for output in outputs]
+
+
+def test_batches_regenerate_in_any_order():
+    virtual = new_dataset()
+    in_order = [render(virtual, batch_nr) for batch_nr in range(1, 5)]
+    # another process regenerating some batches only
+    again = new_dataset()
+    assert render(again, 3) == in_order[2]
+    assert render(again, 1) == in_order[0]
+    assert [render(again, batch_nr) for batch_nr in (4, 2)] == [
+        in_order[3], in_order[1]]
+    # batches do not depend on the number of batches
+    assert render(new_dataset(batches=9), 2) == in_order[1]
+
+
+def test_batch_out_of_range():
+    with pytest.raises(IndexError):
+        list(new_dataset().chunks(5))
+
+
+@pytest.mark.parametrize('format',
+                         sorted(formats.WRITERS) + [formats.CSV])
+def test_chunked_output_matches_unchunked(monkeypatch, format):
+    monkeypatch.setattr(dataset, 'CHUNK_SIZE', 10)
+    virtual = new_dataset(batch_size=45)
+    assert [len(chunk) for chunk in virtual.chunks(2)] == [10] * 4 + [5]
+    # streamed chunk by chunk, or written at once
+    assert render(virtual, 2, format) == render(
+        virtual, 2, format, chunks=[virtual.batch(2)])
+    assert list(virtual.students(2)) == list(virtual.batch(2))
+
+
+def test_chunk_friends_split_batch_friends(monkeypatch):
+    virtual = new_dataset(batch_size=45)
+    monkeypatch.setattr(dataset, 'CHUNK_SIZE', 10)
+    chunks = list(virtual.chunks(2))
+    friends = list(virtual.chunk_friends(2))
+    assert len(friends) == len(chunks)
+    idnos, friend_idnos = virtual.friends(2)
+    assert [idno for chunk_idnos, _ in friends
+            for idno in chunk_idnos] == idnos
+    assert [idno for _, chunk_friend_idnos in friends
+            for idno in chunk_friend_idnos] == friend_idnos
+    for chunk, (chunk_idnos, _) in zip(chunks, friends):
+        assert set(chunk_idnos) <= set(chunk.idno)
+
+
+@pytest.mark.parametrize('batches', [1, 2, 5, 7, 16])
+@pytest.mark.parametrize('shards', [1, 2, 3, 5, 8])
+def test_shards_cover_the_batches_once(batches, shards):
+    ranges = [new_dataset(batches=batches, shard=(shard, shards)).batch_nrs()
+              for shard in range(1, shards + 1)]
+    assert [batch_nr for batch_nrs in ranges for batch_nr in batch_nrs] == \
+        list(range(1, batches + 1))
+    assert max(map(len, ranges)) - min(map(len, ranges)) <= 1
+
+
+def test_shard_batches_match_unsharded_batches():
+    virtual = new_dataset(batches=5)
+    for shard in (1, 2):
+        sharded = new_dataset(batches=5, shard=(shard, 2))
+        for batch_nr in sharded.batch_nrs():
+            assert render(sharded, batch_nr) == render(virtual, batch_nr)
@@ -0,0 +1,84 @@
+import pickle
+import uuid
+
+import numpy
+import pytest
+
+from graph_data import ids
+
+INDICES = list(range(0, 5000)) + [2 ** 32, 2 ** 40 + 7]
+
+
+def test_base_scheme_is_abstract():
+    with pytest.raises(TypeError):
+        ids.IdScheme()
+
+    class Incomplete(ids.IdScheme):
+        def idnos(self, seed, indices):
+            return []
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+@pytest.mark.parametrize('name', sorted(ids.SCHEMES))
+def test_round_trip(name):
+    scheme = ids.scheme(name)
+    idnos = scheme.idnos(42, INDICES)
+    packed = scheme.pack(idnos)
+    assert packed.shape == (len(INDICES), 2)
+    assert packed.dtype == numpy.uint64
+    assert scheme.unpack(packed) == idnos
+    assert scheme.parse(str(idnos[0])) == idnos[0]
+
+
+@pytest.mark.parametrize('name', sorted(ids.SCHEMES))
+def test_idnos_are_reproducible_and_distinct(name):
+    scheme = ids.scheme(name)
+    idnos = scheme.idnos(42, INDICES)
+    assert scheme.idnos(42, INDICES[100:200]) == idnos[100:200]
+    assert len(set(idnos)) == len(idnos)
+    if name != 'int':
+        assert scheme.idnos(43, INDICES[:100]) != idnos[:100]
+
+
+@pytest.mark.parametrize('name', sorted(ids.SCHEMES))
+def test_pickle_keeps_singletons(name):
+    scheme = ids.scheme(name)
+    assert pickle.loads(pickle.dumps(scheme)) is scheme
+
+
+def test_uuid4():
+    for idno in ids.scheme('uuid4').idnos(42, INDICES[:100]):
+        assert uuid.UUID(idno).version == 4
+
+
+def test_uuid7_is_time_ordered():
+    scheme = ids.scheme('uuid7')
+    idnos = scheme.idnos(42, INDICES)
+    # string order, packed order and student order agree
+    assert sorted(idnos) == idnos
+    packed = scheme.pack(idnos)
+    assert (packed[1:, 0] > packed[:-1, 0]).all()
+    for index, idno in zip(INDICES, idnos):
+        value = uuid.UUID(idno)
+        assert value.version == 7
+        assert value.variant == uuid.RFC_4122
+        assert value.int >> 80 == scheme.EPOCH_MS + index
+
+
+def test_int():
+    scheme = ids.scheme('int')
+    assert scheme.integer
+    assert scheme.idnos(42, [0, 1, 9]) == [1, 2, 10]
+    assert scheme.parse('10') == 10
+    assert scheme.csv_value('idno') == 'toInteger(line.idno)'
+
+
+def test_base62_order_matches_values():
+    scheme = ids.scheme('base62')
+    idnos = scheme.idnos(42, INDICES)
+    assert all(len(idno) == scheme.WIDTH and idno.isalnum()
+               for idno in idnos)
+    values = scheme.pack(idnos)[:, 1]
+    assert [idnos[i] for i in numpy.argsort(values)] == sorted(idnos)
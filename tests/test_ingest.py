@@ -0,0 +1,314 @@
+import csv
+import json
+import os
+
+import pytest
+import requests
+
+from graph_data import cli, formats, ingest, neo4j
+
+
+def test_needs_split():
+    assert ingest.needs_split(requests.exceptions.ReadTimeout())
+    assert ingest.needs_split(TimeoutError())
+    assert ingest.needs_split(neo4j.QueryError(
+        [{'code': 'Neo.TransientError.General.OutOfMemoryError',
+          'message': 'out of memory'}]))
+    assert not ingest.needs_split(neo4j.QueryError(
+        [{'code': 'Neo.ClientError.Statement.SyntaxError',
+          'message': 'syntax error'}]))
+    assert not ingest.needs_split(requests.exceptions.ConnectTimeout())
+    assert not ingest.needs_split(requests.exceptions.ConnectionError())
+
+
+class FailingClient():
+    """
+    Client failing its transactions with `errors` in turn, None for a
+    transaction that commits
+    """
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.sizes = []
+        self.committed = []
+
+    def do_query_update(self, query, parameters):
+        self.sizes.append(len(parameters['rows']))
+        if self.errors:
+            error = self.errors.pop(0)
+            if error is not None:
+                raise error
+        self.committed.extend(parameters['rows'])
+        stats = {'nodes_created': len(parameters['rows'])}
+        return {'results': [{'stats': stats}], 'errors': []}
+
+
+def test_read_timeout_splits_transaction():
+    client = FailingClient(requests.exceptions.ReadTimeout())
+    batcher = ingest.AdaptiveBatcher(client, 'query', 'rows',
+                                     initial_size=10, retries=0)
+    results = batcher.load(list(range(10)))
+    assert [result['stats']['nodes_created'] for result in results] == [5, 5]
+    assert client.sizes == [10, 5, 5]
+
+
+def test_connect_timeout_is_raised():
+    client = FailingClient(requests.exceptions.ConnectTimeout())
+    batcher = ingest.AdaptiveBatcher(client, 'query', 'rows',
+                                     initial_size=10, retries=0)
+    with pytest.raises(requests.exceptions.ConnectTimeout):
+        batcher.load(list(range(10)))
+    assert client.sizes == [10]
+
+
+def test_partition_csv(tmp_path):
+    path = tmp_path / 'batch.friends.csv'
+    path.write_text('"idno","friend_idno"\n' + ''.join(
+        '"{}","{}"\n'.format(i, (i * 7) % 50) for i in range(50)))
+    parts = formats.partition_csv(str(path),
+                                  ingest.csv_partition('friends', 3),
+                                  str(tmp_path))
+    assert sum(rows for _, rows in parts.values()) == 50
+    for (a, b), (part, rows) in parts.items():
+        with open(part, encoding='utf-8', newline='') as input:
+            records = list(csv.reader(input))
+        assert records[0] == ['idno', 'friend_idno']
+        assert len(records) == rows + 1
+        assert all(ingest.partition(idno, 3) == a
+                   and ingest.partition(friend_idno, 3) == b
+                   for idno, friend_idno in records[1:])
+
+
+def test_partitioned_csv_rounds_write_disjoint_groups(tmp_path):
+    groups = 4
+    manifest = ingest.ProgressManifest(str(tmp_path / 'manifest.json'))
+    loader = ingest.PartitionedCsvLoader(None, groups, 1000, manifest)
+    pairs = [(a, b) for a in range(groups) for b in range(groups)]
+    # partition of every shard path
+    partitions = {}
+
+    def shards(file, kind, keys):
+        files = {}
+        for key in keys:
+            path = '{}.{}.{}.csv'.format(file, kind, key)
+            partitions[path] = key
+            files[key] = [(path, 1)]
+        return files
+
+    batches = [(file, {
+        'students': shards(file, 'students', [(g,) for g in range(groups)]),
+        'characteristics': shards(file, 'characteristics', pairs),
+        'friends': shards(file, 'friends', pairs),
+    }) for file in ('00001', '00002')]
+    # nodes written by a shard of every phase, from its partition
+    written = {
+        'students': lambda key: {('student', key[0])},
+        'characteristic_nodes': lambda key: {('characteristic', key[1])},
+        'characteristic_links': lambda key: {('student', key[0]),
+                                             ('characteristic', key[1])},
+        'friend_links': lambda key: {('student', key[0]),
+                                     ('student', key[1])},
+    }
+    for phase, kind in (('students', 'students'),
+                        ('characteristic_nodes', 'characteristics'),
+                        ('characteristic_links', 'characteristics'),
+                        ('friend_links', 'friends')):
+        rounds = loader.rounds(phase, kind, batches)
+        paths = [path for tasks in rounds for task in tasks
+                 for _, path, _ in task]
+        assert sorted(paths) == sorted(
+            path for _, files in batches
+            for part in files[kind].values() for path, _ in part)
+        for tasks in rounds:
+            nodes = [set().union(*[written[phase](partitions[path])
+                                   for _, path, _ in task])
+                     for task in tasks]
+            # the tasks of a round run together
+            for i, task_nodes in enumerate(nodes):
+                for other in nodes[i + 1:]:
+                    assert not task_nodes & other
+
+
+def test_batch_committed_with_its_last_chunk(tmp_path):
+    path = str(tmp_path / 'manifest.json')
+    manifest = ingest.ProgressManifest(path)
+    manifest.commit_chunk('00001.json', 2, last=True)
+    manifest.commit_chunk('00001.json', 0)
+    assert manifest.done(ingest.chunk_name('00001.json', 2))
+    assert not manifest.done('00001.json')
+    manifest.commit_rows(ingest.chunk_name('00001.json', 1), 100)
+    resumed = ingest.ProgressManifest(path, resume=True)
+    assert resumed.committed_rows(ingest.chunk_name('00001.json', 1)) == 100
+    # chunks committed by a previous run count once seen again
+    resumed.commit_chunk('00001.json', 2, last=True)
+    resumed.commit_chunk('00001.json', 1)
+    assert resumed.done('00001.json')
+    assert resumed.committed == {'00001.json'}
+    assert resumed.rows == {}
+
+
+def write_characteristics(path, values):
+    with open(str(path), 'w', encoding='utf-8', newline='') as output:
+        writer = csv.writer(output, dialect=formats.CSV_DIALECT)
+        writer.writerow(('idno', 'type', 'value'))
+        writer.writerows((str(i), 'hobby', value)
+                         for i, value in enumerate(values))
+    return str(path)
+
+
+def read_nodes(path):
+    with open(path, encoding='utf-8', newline='') as input:
+        return [value for _, value in list(csv.reader(input))[1:]]
+
+
+@pytest.fixture
+def csv_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(cli, 'TMP_DIR', str(tmp_path))
+    return [(file, {'characteristics': write_characteristics(
+        tmp_path / file.replace('csv', 'characteristics.csv'), values)})
+        for file, values in (('00001.csv', ['a', 'b']),
+                             ('00002.csv', ['b', 'c', 'b']),
+                             ('00003.csv', ['c', 'd']))]
+
+
+def test_characteristics_planned_in_batch_order(csv_chunks):
+    nodes = cli.plan_csv_chunks(ingest.CharacteristicPlanner(), csv_chunks)
+    shuffled = cli.plan_csv_chunks(
+        ingest.CharacteristicPlanner(), [csv_chunks[2], csv_chunks[0],
+                                         csv_chunks[1]])
+    assert shuffled == nodes
+    assert [read_nodes(nodes[files['characteristics']])
+            for _, files in csv_chunks] == [['a', 'b'], ['c'], ['d']]
+
+
+def test_resumed_plan_does_not_skip_characteristics(csv_chunks, tmp_path):
+    paths = [files['characteristics'] for _, files in csv_chunks]
+    manifest = ingest.ProgressManifest(str(tmp_path / 'manifest.json'))
+    nodes = cli.plan_csv_chunks(ingest.CharacteristicPlanner(), csv_chunks)
+    # the first run stopped after the first batch and the characteristic
+    # nodes of the second one
+    manifest.commit('00001.csv', ingest.shard_name(
+        '00002.csv', 'characteristic_nodes', nodes[paths[1]]))
+    resumed = cli.plan_csv_chunks(
+        ingest.CharacteristicPlanner(),
+        [chunk for chunk in csv_chunks if not manifest.done(chunk[0])])
+    # b, created with the first batch, is planned again with the second
+    assert read_nodes(resumed[paths[1]]) == ['b', 'c']
+    assert not manifest.done(ingest.shard_name(
+        '00002.csv', 'characteristic_nodes', resumed[paths[1]]))
+    # nodes files planned alike keep their name
+    assert resumed[paths[2]] == nodes[paths[2]]
+
+
+SYNTAX_ERROR = neo4j.QueryError([{
+    'code': 'Neo.ClientError.Statement.SyntaxError',
+    'message': 'syntax error'}])
+
+
+def read_manifest(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_manifest_commits(tmp_path):
+    path = str(tmp_path / 'progress' / 'manifest.json')
+    manifest = ingest.ProgressManifest(path)
+    assert read_manifest(path) == {'committed': [], 'rows': {}}
+    manifest.commit_rows('00002.json', 100)
+    manifest.commit('00001.json')
+    assert read_manifest(path) == {'committed': ['00001.json'],
+                                   'rows': {'00002.json': 100}}
+    manifest.commit_rows('00002.json', 200)
+    resumed = ingest.ProgressManifest(path, resume=True)
+    assert resumed.done('00001.json')
+    assert not resumed.done('00002.json')
+    assert resumed.committed_rows('00002.json') == 200
+    assert resumed.committed_rows('00003.json') == 0
+    resumed.commit('00002.json')
+    assert read_manifest(path) == {
+        'committed': ['00001.json', '00002.json'], 'rows': {}}
+    # a load that does not resume starts over
+    restarted = ingest.ProgressManifest(path)
+    assert not restarted.done('00001.json')
+    assert read_manifest(path) == {'committed': [], 'rows': {}}
+
+
+def test_restart_mid_batch(tmp_path):
+    path = str(tmp_path / 'manifest.json')
+    rows = list(range(10))
+    manifest = ingest.ProgressManifest(path)
+    client = FailingClient(None, None, SYNTAX_ERROR)
+    batcher = ingest.AdaptiveBatcher(client, 'query', 'rows',
+                                     initial_size=3, retries=0)
+    with pytest.raises(neo4j.QueryError):
+        batcher.load(rows, on_commit=lambda committed: manifest.commit_rows(
+            '00001.json', committed))
+    assert client.committed == rows[:6]
+
+    manifest = ingest.ProgressManifest(path, resume=True)
+    assert manifest.committed_rows('00001.json') == 6
+    client = FailingClient()
+    batcher = ingest.AdaptiveBatcher(client, 'query', 'rows',
+                                     initial_size=3, retries=0)
+    batcher.load(rows, start=manifest.committed_rows('00001.json'),
+                 on_commit=lambda committed: manifest.commit_rows(
+                     '00001.json', committed))
+    assert client.committed == rows[6:]
+    assert manifest.committed_rows('00001.json') == 10
+
+
+def test_manifest_save_is_atomic(tmp_path, monkeypatch):
+    path = str(tmp_path / 'manifest.json')
+    manifest = ingest.ProgressManifest(path)
+    manifest.commit('00001.json')
+
+    def interrupted(src, dst):
+        raise OSError('interrupted')
+
+    monkeypatch.setattr(ingest.os, 'replace', interrupted)
+    with pytest.raises(OSError):
+        manifest.commit('00002.json')
+    # the manifest is intact, the new state only in the temporary file
+    assert read_manifest(path)['committed'] == ['00001.json']
+    assert read_manifest(path + '.tmp')['committed'] == [
+        '00001.json', '00002.json']
+    monkeypatch.undo()
+    manifest.commit('00003.json')
+    assert read_manifest(path)['committed'] == [
+        '00001.json', '00002.json', '00003.json']
+    assert not os.path.exists(path + '.tmp')
+
+
+class RecordingClient():
+
+    def __init__(self):
+        self.files = []
+
+    def do_query_update(self, query, params={}):
+        self.files.append(query.split("'file://")[1].split("'")[0])
+        return {'results': [{'stats': {}}], 'errors': []}
+
+
+def test_committed_csv_shards_are_skipped(tmp_path):
+    manifest = ingest.ProgressManifest(str(tmp_path / 'manifest.json'))
+
+    def shards(file, kind):
+        return [('/tmp/{}.{}.{}.csv'.format(file, kind, i), 10)
+                for i in range(2)]
+
+    batches = [(file, {kind: shards(file, kind) for kind in (
+        'students', 'characteristic_nodes', 'characteristics', 'friends')})
+        for file in ('00001', '00002')]
+    skipped = [
+        ('00001', 'students', '/tmp/00001.students.0.csv'),
+        ('00002', 'students', '/tmp/00002.students.1.csv'),
+        ('00002', 'friend_links', '/tmp/00002.friends.0.csv')]
+    for file, phase, path in skipped:
+        manifest.commit(ingest.shard_name(file, phase, path))
+    client = RecordingClient()
+    ingest.CsvShardLoader(client, 2, 1000, manifest).load(batches)
+    all_files = [path for _, files in batches for kind in files
+                 for path, _ in files[kind]]
+    assert sorted(client.files) == sorted(
+        set(all_files) - {path for _, _, path in skipped})
+    assert manifest.done('00001') and manifest.done('00002')
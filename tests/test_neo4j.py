@@ -0,0 +1,20 @@
+import pytest
+
+from graph_data import neo4j
+
+
+def test_base_client_is_abstract():
+    with pytest.raises(TypeError):
+        neo4j.BaseClient()
+
+    class Client(neo4j.BaseClient):
+        def __init__(self):
+            self.batches = []
+
+        def do_query_update_batch(self, queries):
+            self.batches.append(queries)
+            return {'results': [], 'errors': []}
+
+    client = Client()
+    client.do_query_update('RETURN 1')
+    assert client.batches == [[{'statement': 'RETURN 1', 'params': {}}]]
@@ -0,0 +1,80 @@
+import datetime
+
+import pytest
+
+from graph_data import cli, dataset, formats
+from graph_data.dataset import VirtualDataset
+from graph_data.pipeline import Pipeline
+
+
+def countdown(n):
+    for i in range(n, 0, -1):
+        yield n, i
+
+
+def fail_after_one(n):
+    yield n
+    raise ValueError(n)
+
+
+@pytest.mark.parametrize('processes', [False, True])
+def test_expanding_stage(processes):
+    pipeline = Pipeline('test', [1, 2, 3], queue_size=1)
+    pipeline.add_stage('expand', countdown, 2, processes=processes,
+                       expand=True)
+    pipeline.add_stage('square', lambda item: (item[0], item[1] ** 2))
+    results = list(pipeline.run())
+    assert sorted(results) == [(1, 1), (2, 1), (2, 4), (3, 1), (3, 4), (3, 9)]
+    # the items of an expanded item keep their order
+    for n in (1, 2, 3):
+        assert [i for m, i in results if m == n] == [
+            i * i for i in range(n, 0, -1)]
+
+
+@pytest.mark.parametrize('processes', [False, True])
+def test_expanding_stage_error(processes):
+    pipeline = Pipeline('test', [1])
+    pipeline.add_stage('expand', fail_after_one, processes=processes,
+                       expand=True)
+    with pytest.raises(ValueError):
+        list(pipeline.run())
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(dataset, 'CHUNK_SIZE', 40)
+
+
+@pytest.mark.parametrize('source', ['virtual'] + sorted(formats.READERS))
+def test_decode_dump_batch_in_chunks(tmp_path, small_chunks, source):
+    virtual = VirtualDataset(5, 100, 2, datetime.date(2020, 1, 1))
+    rows = list(virtual.students(2))
+    edges = list(zip(*virtual.friends(2)))
+    if source == 'virtual':
+        task = source, virtual, 2
+    else:
+        file = VirtualDataset.batch_file_name(2, formats.extension(source))
+        mode = 'wb' if source in formats.BINARY else 'w'
+        with open(str(tmp_path / file), mode) as output:
+            formats.WRITERS[source](virtual.chunks(2), output)
+        with open(str(tmp_path / VirtualDataset.friends_file_name(file)),
+                  'w', encoding='utf-8', newline='') as output:
+            formats.write_friends(virtual.friends(2), output)
+        task = source, str(tmp_path), file
+    chunks = list(cli.decode_dump_batch(task))
+    assert [position for _, position, _, _ in chunks] == [
+        (0, False), (1, False), (2, True)]
+    assert [len(data) for _, _, data, _ in chunks] == [40, 40, 20]
+    assert [row for _, _, data, _ in chunks for row in data] == rows
+    assert [edge for _, _, _, chunk_edges in chunks
+            for edge in chunk_edges] == edges
+    for _, _, data, chunk_edges in chunks:
+        idnos = {row['idno'] for row in data}
+        assert all(idno in idnos for idno, _ in chunk_edges)
+
+
+def test_empty_batch_is_one_chunk(tmp_path):
+    (tmp_path / '00001.ndjson').write_text('')
+    assert list(cli.decode_dump_batch(
+        ('ndjson', str(tmp_path), '00001.ndjson'))) == [
+            ('00001.ndjson', (0, True), [], [])]
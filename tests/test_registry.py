@@ -0,0 +1,108 @@
+import pickle
+
+import numpy
+import pytest
+
+from graph_data import ids
+from graph_data.registry import IdRegistry, sample_friends
+
+
+def idnos(scheme, start, stop, seed=1):
+    return ids.scheme(scheme).idnos(seed, range(start, stop))
+
+
+@pytest.mark.parametrize('scheme', sorted(ids.SCHEMES))
+def test_add_past_resize_threshold(scheme):
+    registry = IdRegistry(capacity=16, id_scheme=ids.scheme(scheme))
+    added = idnos(scheme, 0, 1000)
+    for start in range(0, 1000, 100):
+        assert registry.add(added[start:start + 100]) == 100
+    assert len(registry) == 1000
+    assert registry.capacity >= 1000
+    assert registry.contains(added).all()
+    assert not registry.contains(idnos(scheme, 1000, 1100)).any()
+
+
+def test_add_skips_registered_and_repeated_idnos():
+    registry = IdRegistry()
+    batch = idnos('uuid4', 0, 10)
+    assert registry.add(batch + batch[:5]) == 10
+    assert registry.add(batch[5:] + idnos('uuid4', 10, 12)) == 2
+    assert len(registry) == 12
+
+
+def test_membership():
+    registry = IdRegistry(id_scheme=ids.scheme('int'))
+    registry.add([1, 2, 3])
+    assert 2 in registry
+    assert 4 not in registry
+    assert registry.contains([3, 4, 1]).tolist() == [True, False, True]
+
+
+def test_reopen_in_r_plus_mode(tmp_path):
+    path = str(tmp_path / 'registry')
+    registry = IdRegistry(path, capacity=16)
+    registry.add(idnos('uuid4', 0, 100))
+    registry.flush()
+    reopened = IdRegistry(path, mode='r+')
+    assert len(reopened) == 100
+    assert reopened.contains(idnos('uuid4', 0, 100)).all()
+    # grows past the capacity of the files it opened
+    assert reopened.add(idnos('uuid4', 100, 300)) == 200
+    reopened.flush()
+    assert len(IdRegistry(path, mode='r')) == 300
+
+
+def test_read_only_registry_does_not_grow(tmp_path):
+    path = str(tmp_path / 'registry')
+    IdRegistry(path, capacity=16).add(idnos('uuid4', 0, 16))
+    with pytest.raises(ValueError):
+        IdRegistry(path, mode='r').add(idnos('uuid4', 16, 32))
+
+
+def test_pickle_opens_files_read_only(tmp_path):
+    path = str(tmp_path / 'registry')
+    registry = IdRegistry(path, id_scheme=ids.scheme('base62'))
+    registry.add(idnos('base62', 0, 50))
+    data = pickle.dumps(registry)
+    assert len(data) < 1000
+    copy = pickle.loads(data)
+    assert copy.mode == 'r'
+    assert copy.id_scheme is ids.scheme('base62')
+    assert copy.contains(idnos('base62', 0, 50)).all()
+    # a copy sees the idnos added since once refreshed
+    registry.add(idnos('base62', 50, 60))
+    registry.flush()
+    copy.refresh()
+    assert len(copy) == 60
+
+
+def test_in_memory_registry_is_not_pickled():
+    with pytest.raises(TypeError):
+        pickle.dumps(IdRegistry())
+
+
+def test_sample():
+    registry = IdRegistry(id_scheme=ids.scheme('int'))
+    with pytest.raises(IndexError):
+        registry.sample(numpy.random.default_rng(1), 1)
+    registry.add(list(range(1, 101)))
+    sample = registry.sample(numpy.random.default_rng(1), 10000)
+    assert len(sample) == 10000
+    assert set(sample) <= set(range(1, 101))
+    # uniform: every idno drawn about 100 times
+    counts = numpy.bincount(sample, minlength=101)[1:]
+    assert counts.min() > 50 and counts.max() < 150
+
+
+def test_sample_friends():
+    rng = numpy.random.default_rng(1)
+    registry = IdRegistry(id_scheme=ids.scheme('int'))
+    batch = list(range(1, 41))
+    registry.add(batch)
+    assert sample_friends(registry, batch, rng) == []
+    registry.add(list(range(41, 101)))
+    edges = sample_friends(registry, batch, rng)
+    assert {idno for idno, _ in edges} <= set(batch)
+    assert all(registry.contains([friend for _, friend in edges]))
+    assert all(idno != friend for idno, friend in edges)
@@ -0,0 +1,54 @@
+import numpy
+import pytest
+
+from graph_data import generator, topology
+
+
+@pytest.fixture
+def skewed_universities():
+    generator.CATALOGS['university'].configure(skew=1.2)
+    yield generator.CATALOGS['university']
+    generator.CATALOGS['university'].configure()
+
+
+def test_topology_is_abstract():
+    with pytest.raises(TypeError):
+        topology.Topology(1)
+
+
+@pytest.mark.parametrize('name', sorted(topology.MODELS))
+def test_friends_are_previous_students(name):
+    model = topology.MODELS[name](7)
+    sources, targets = model.edges(1000, 3000)
+    assert ((sources >= 1000) & (sources < 3000)).all()
+    assert ((targets >= 0) & (targets < sources)).all()
+    # distinct, sorted by source then target
+    pairs = sources * 3000 + targets
+    assert (numpy.diff(pairs) > 0).all()
+    # ranges are drawn on their own
+    again = model.edges(1000, 3000)
+    assert (again[0] == sources).all() and (again[1] == targets).all()
+
+
+def test_blocks_follow_university_weights(skewed_universities):
+    model = topology.BlockTopology(7)
+    blocks = model.blocks(0, 4 * model.PERIOD)
+    shares = numpy.bincount(
+        blocks, minlength=len(skewed_universities)) / len(blocks)
+    assert numpy.abs(shares - skewed_universities.weights).max() < 1e-4
+    assert shares[0] > 10 * shares[100]
+
+
+def test_blocks_of_uniform_universities():
+    model = topology.BlockTopology(7)
+    counts = numpy.bincount(model.blocks(0, model.PERIOD))
+    assert len(counts) == len(generator.CATALOGS['university'])
+    assert counts.max() - counts.min() <= 1
+
+
+def test_friends_within_blocks(skewed_universities):
+    model = topology.BlockTopology(7, within=1.0)
+    start = model.PERIOD - 5000
+    sources, targets = model.edges(start, model.PERIOD + 5000)
+    blocks = model.blocks(0, model.PERIOD + 5000)
+    assert (blocks[sources] == blocks[targets]).all()